@@ -0,0 +1,3 @@
+'''
+Benchmarks of playbook2uml. They are not run by `make test`, see `make help`.
+'''
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+'''
+Cold-start benchmark of rendering from a graph file.
+
+Writes a synthetic playbook (see `benchmarks.synthetic`) and its state graph
+(`-t json`, and `-t msgpack` when msgpack is installed), then measures the wall time
+of `python -m playbook2uml` in a new process for:
+
+- `startup`: a one-task playbook with each parser, and its graph with `--from-graph`
+- `render`: the synthetic playbook with each parser, and its graphs with `--from-graph`
+
+Rendering from a graph imports neither ansible-core nor PyYAML, so its startup
+is the time a documentation build pays when the graphs were extracted earlier in CI.
+Times are the median (and the minimum) of `--repeat` runs, in seconds.
+
+Usage:
+    python -m benchmarks.cold_start [--plays N] [--tasks M] [-t TYPE] [--repeat K] [-o FILE]
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from argparse import ArgumentParser
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+from benchmarks.run import TINY_PLAYBOOK, run_cli, timings
+from benchmarks.synthetic import add_shape_arguments, shape_from_args, write_project
+
+def graph_types() -> list[str]:
+    return ['json', 'msgpack'] if importlib.util.find_spec('msgpack') else ['json']
+
+def bench_sources(playbook:str, diagram_type:str, repeat:int, tmp_dir:str) -> dict:
+    '''
+    Measure rendering the playbook with each parser and from each graph type
+    '''
+    results = {}
+    for parser in ('ansible', 'fast'):
+        results[parser] = timings(lambda: run_cli('-t', diagram_type, '--parser', parser, playbook), repeat)
+    name, _ = os.path.splitext(os.path.basename(playbook))
+    for graph_type in graph_types():
+        graph = os.path.join(tmp_dir, f'{name}.{graph_type}')
+        run_cli('-t', graph_type, '--parser', 'fast', '-o', graph, playbook)
+        results[f'graph/{graph_type}'] = timings(lambda: run_cli('-t', diagram_type, '--from-graph', graph), repeat)
+        results[f'graph/{graph_type}']['bytes'] = os.path.getsize(graph)
+    return results
+
+def run(option) -> dict:
+    shape = shape_from_args(option)
+    result = {'shape': shape._asdict(), 'type': option.type, 'repeat': option.repeat}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tiny = os.path.join(tmp_dir, 'tiny.yml')
+        with open(tiny, 'w') as f:
+            f.write(TINY_PLAYBOOK)
+        playbook = write_project(tmp_dir, shape)
+        print('benchmark startup', file=sys.stderr)
+        result['startup'] = bench_sources(tiny, option.type, option.repeat, tmp_dir)
+        print('benchmark render', file=sys.stderr)
+        result['render'] = bench_sources(playbook, option.type, option.repeat, tmp_dir)
+    return result
+
+def main(argv=None) -> int:
+    ap = ArgumentParser(prog='python -m benchmarks.cold_start', description='Cold-start benchmark of rendering from a graph file')
+    add_shape_arguments(ap)
+    ap.add_argument('-t', '--type', type=str, choices=['plantuml', 'mermaid'], default='plantuml', help='The diagram type.[default=plantuml]')
+    ap.add_argument('--repeat', type=int, default=5, help='The number of runs of each measure.[default=5]')
+    ap.add_argument('-o', '--output', type=str, default='-', help='The JSON file to write.[default=- (STDOUT)]')
+    option = ap.parse_args(argv)
+    result = run(option)
+    if option.output == '-':
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        with open(option.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
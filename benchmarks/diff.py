@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of `playbook2uml diff` on growing playbooks.
+
+For each `--sizes` number of tasks per play, writes a synthetic playbook
+(see `benchmarks.synthetic`) and a copy with one task inserted at the top of each play,
+loads both with the fast parser and measures `diff_playbooks`.
+The time per task stays flat as the playbook grows, the matching is linear.
+Times are the median (and the minimum) of `--repeat` runs, in seconds.
+
+Usage:
+    python -m benchmarks.diff [--sizes N ...] [--plays P] [--repeat K] [-o FILE]
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from argparse import ArgumentParser
+import json
+import os
+import sys
+import tempfile
+import yaml
+from benchmarks.run import timings
+from benchmarks.synthetic import Shape, write_project, write_yaml
+
+def write_new_version(old_playbook:str, directory:str) -> str:
+    '''
+    Write a copy of the playbook with a task inserted at the top of each play
+    '''
+    with open(old_playbook) as f:
+        book = yaml.safe_load(f)
+    for play in book:
+        play['tasks'].insert(0, {'name': 'inserted', 'ansible.builtin.ping': None})
+    playbook = os.path.join(directory, 'site.yml')
+    write_yaml(playbook, book)
+    os.symlink(os.path.join(os.path.dirname(old_playbook), 'roles'), os.path.join(directory, 'roles'))
+    return playbook
+
+def bench_size(tasks:int, plays:int, repeat:int, tmp_dir:str) -> dict:
+    import playbook2uml.cli as cli
+    import playbook2uml.umlstate as umlstate
+    from playbook2uml.diff import diff_playbooks, walk_states
+    old_dir = os.path.join(tmp_dir, f'old_{tasks}')
+    new_dir = os.path.join(tmp_dir, f'new_{tasks}')
+    os.makedirs(new_dir)
+    old_playbook = write_project(old_dir, Shape(plays=plays, tasks=tasks))
+    new_playbook = write_new_version(old_playbook, new_dir)
+    old = umlstate.load(cli.parse_args(['--parser', 'fast', old_playbook]))
+    new = umlstate.load(cli.parse_args(['--parser', 'fast', new_playbook]))
+    changes = diff_playbooks(old, new)
+    result = timings(lambda: diff_playbooks(old, new), repeat)
+    total = sum(1 for _ in walk_states(new))
+    result.update(states=total, changes=len(changes), per_state_us=result['median'] / total * 1e6)
+    return result
+
+def main(argv=None) -> int:
+    ap = ArgumentParser(prog='python -m benchmarks.diff', description='Benchmark of the structural diff of two playbooks')
+    ap.add_argument('--sizes', type=int, nargs='+', default=[250, 500, 1000, 2000, 4000],
+                    help='The numbers of tasks per play and role.[default=250 500 1000 2000 4000]')
+    ap.add_argument('--plays', type=int, default=2, help='The number of plays.[default=2]')
+    ap.add_argument('--repeat', type=int, default=5, help='The number of runs of each measure.[default=5]')
+    ap.add_argument('-o', '--output', type=str, default='-', help='The JSON file to write.[default=- (STDOUT)]')
+    option = ap.parse_args(argv)
+    result = {'plays': option.plays, 'repeat': option.repeat, 'sizes': {}}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in option.sizes:
+            print(f'benchmark {size} tasks', file=sys.stderr)
+            result['sizes'][str(size)] = bench_size(size, option.plays, option.repeat, tmp_dir)
+    if option.output == '-':
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        with open(option.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
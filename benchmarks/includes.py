@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of the static resolution of the includes (`--resolve-includes`).
+
+Writes a playbook of `--includes` `include_tasks` of one task file of `--tasks` tasks
+(see `benchmarks.synthetic`) and measures, with one ansible-core environment:
+
+- `load`: loading the playbook, the includes are kept as tasks
+- `resolve`: loading the playbook with `--resolve-includes`, `resolve - load` is the cost of the expansion
+  including the conversion to states
+- `ansible_dynamic`: what the strategy of ansible-playbook does for each include when the play runs
+  (`load_from_file` and `load_list_of_blocks` of the included file), without the conversion to states
+
+Times are the median (and the minimum) of `--repeat` runs, in seconds.
+
+Usage:
+    python -m benchmarks.includes [--includes N] [--tasks M] [--repeat K] [-o FILE]
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from argparse import ArgumentParser
+import json
+import os
+import sys
+import tempfile
+from benchmarks.run import timings
+from benchmarks.synthetic import Shape, make_tasks, write_yaml
+
+def write_playbook(directory:str, includes:int, tasks:int) -> str:
+    write_yaml(os.path.join(directory, 'included.yml'), make_tasks('included', Shape(tasks=tasks)))
+    playbook = os.path.join(directory, 'site.yml')
+    write_yaml(playbook, [{
+        'name': 'includes',
+        'hosts': 'all',
+        'gather_facts': False,
+        'tasks': [{'name': f'include {i}', 'ansible.builtin.include_tasks': 'included.yml'} for i in range(includes)],
+    }])
+    return playbook
+
+def ansible_dynamic(playbook:str, environment) -> int:
+    '''
+    Load the included file of each include like `StrategyBase._load_included_file`
+    '''
+    from ansible.playbook import Playbook
+    from ansible.playbook.helpers import load_list_of_blocks
+    loader = environment.dataloader
+    pb = Playbook.load(playbook, variable_manager=environment.variable_manager, loader=loader)
+    play = pb.get_plays()[0]
+    path = os.path.join(os.path.dirname(playbook), 'included.yml')
+    blocks = 0
+    for block in play.tasks:
+        for task in block.block:
+            data = loader.load_from_file(path, trusted_as_template=True)
+            task_copy = task.copy(exclude_parent=True)
+            task_copy._parent = task._parent
+            blocks += len(load_list_of_blocks(data, play=play, parent_block=task_copy.build_parent_block(), role=task._role,
+                                              use_handlers=False, loader=loader, variable_manager=environment.variable_manager))
+    return blocks
+
+def main(argv=None) -> int:
+    ap = ArgumentParser(prog='python -m benchmarks.includes', description='Benchmark of the static resolution of the includes')
+    ap.add_argument('--includes', type=int, default=200, help='The number of includes of the task file.[default=200]')
+    ap.add_argument('--tasks', type=int, default=20, help='The number of tasks of the included file.[default=20]')
+    ap.add_argument('--repeat', type=int, default=5, help='The number of runs of each measure.[default=5]')
+    ap.add_argument('-o', '--output', type=str, default='-', help='The JSON file to write.[default=- (STDOUT)]')
+    option = ap.parse_args(argv)
+
+    import playbook2uml.cli as cli
+    import playbook2uml.umlstate as umlstate
+    from playbook2uml.umlstate.extract import AnsibleEnvironment
+    environment = AnsibleEnvironment()
+    result = {'includes': option.includes, 'tasks': option.tasks, 'repeat': option.repeat}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        playbook = write_playbook(tmp_dir, option.includes, option.tasks)
+        for name, args in (('load', []), ('resolve', ['--resolve-includes'])):
+            print(f'benchmark {name}', file=sys.stderr)
+            load_option = cli.parse_args(['--no-role-cache', *args, playbook])
+            result[name] = timings(lambda: umlstate.load(load_option, environment=environment), option.repeat)
+        print('benchmark ansible_dynamic', file=sys.stderr)
+        result['ansible_dynamic'] = timings(lambda: ansible_dynamic(playbook, environment), option.repeat)
+    result['resolve_cost'] = result['resolve']['median'] - result['load']['median']
+    result['ansible_dynamic_cost'] = result['ansible_dynamic']['median'] - result['load']['median']
+    if option.output == '-':
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        with open(option.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
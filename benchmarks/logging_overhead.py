@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+'''
+Micro-benchmark of the logging overhead on the generation hot path.
+
+- `call`: one `logger.debug()` call at the WARNING level, formatted eagerly with an f-string
+  (the former style) and lazily with arguments (`logger.debug('start %s', state)`),
+  without the cost of the benchmark loop
+- `generate`: `generate()` of a synthetic playbook with the loggers at WARNING, and with
+  the loggers of the states replaced by a stub doing nothing (the cost without any logging)
+
+Usage:
+    python -m benchmarks.logging_overhead [--plays N] [--tasks M] [--repeat K] [-o FILE]
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from argparse import ArgumentParser, Namespace
+from unittest import mock
+import json
+import sys
+import tempfile
+import timeit
+from benchmarks.run import diagram_option, timings
+from benchmarks.synthetic import add_shape_arguments, shape_from_args, write_project
+
+class StubLogger:
+    '''
+    A logger doing nothing
+    '''
+    def debug(self, *args, **kwargs) -> None:
+        pass
+
+    info = warning = debug
+
+def bench_call(state, number:int=200000) -> dict:
+    logger = state.logger
+    eager = timeit.timeit(lambda: logger.debug(f'start {state}'), number=number)
+    lazy = timeit.timeit(lambda: logger.debug('start %s', state), number=number)
+    empty = timeit.timeit(lambda: None, number=number)
+    return {'eager_ns': (eager - empty) / number * 1e9, 'lazy_ns': (lazy - empty) / number * 1e9}
+
+def run(option:Namespace) -> dict:
+    import playbook2uml.umlstate as umlstate
+    from playbook2uml.umlstate.base import UMLStateTaskBase, UMLStateBlockBase, UMLStatePlayBase
+    shape = shape_from_args(option)
+    result = {'shape': shape._asdict(), 'repeat': option.repeat, 'call': {}, 'generate': {}}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        playbook = write_project(tmp_dir, shape)
+        for diagram_type in ('plantuml', 'mermaid'):
+            book = umlstate.load(diagram_option(playbook, diagram_type, 'fast'))
+            generate = lambda: sum(1 for _ in book.generate())
+            result['call'][diagram_type] = bench_call(book.plays[0])
+            warning = timings(generate, option.repeat)
+            stub = StubLogger()
+            with mock.patch.object(UMLStateTaskBase, 'logger', stub), \
+                    mock.patch.object(UMLStateBlockBase, 'logger', stub), \
+                    mock.patch.object(UMLStatePlayBase, 'logger', stub):
+                no_logging = timings(generate, option.repeat)
+            result['generate'][diagram_type] = {
+                'warning': warning,
+                'no_logging': no_logging,
+                'overhead_ratio': warning['median'] / no_logging['median'],
+            }
+    return result
+
+def main(argv=None) -> int:
+    ap = ArgumentParser(prog='python -m benchmarks.logging_overhead', description='Benchmark the logging overhead of generate()')
+    add_shape_arguments(ap)
+    ap.add_argument('--repeat', type=int, default=5, help='The number of runs of each measurement.[default=5]')
+    ap.add_argument('-o', '--output', type=str, default='-', help='The JSON file to write.[default=- (STDOUT)]')
+    option = ap.parse_args(argv)
+    result = run(option)
+    if option.output == '-':
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        with open(option.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+'''
+Memory benchmark of loading a large playbook.
+
+Measures with tracemalloc the peak memory while loading (`UMLStatePlaybook.__init__`)
+and the memory retained by the loaded states, for each parser.
+`ansible-objects` is the memory of the Ansible objects of the same playbook when kept
+alive, which the states do not reference (see `playbook2uml.umlstate.ir`).
+
+Usage:
+    python -m benchmarks.memory [--plays N] [--tasks M] [--roles R] [--depth D] [-o FILE]
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from argparse import ArgumentParser, Namespace
+import gc
+import json
+import sys
+import tempfile
+import tracemalloc
+from benchmarks.synthetic import add_shape_arguments, shape_from_args, write_project
+
+def measure(load) -> dict:
+    '''
+    Measure the peak and the retained memory of `load()`
+    '''
+    gc.collect()
+    tracemalloc.start()
+    result = load()
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {'peak_bytes': peak, 'retained_bytes': retained}
+
+def run(option:Namespace) -> dict:
+    import playbook2uml.umlstate as umlstate
+    from playbook2uml.umlstate.extract import AnsibleEnvironment
+    environment = AnsibleEnvironment()
+    shape = shape_from_args(option)
+    results = {'shape': shape._asdict(), 'results': {}}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        playbook = write_project(tmp_dir, shape)
+
+        def load_states(parser:str):
+            def load():
+                args = Namespace(PLAYBOOK=playbook, type='plantuml', role='', tasks_from='main', BASE_DIR=None,
+                                 title=None, theme=None, left_to_right=False, verbose=0, parser=parser)
+                book = umlstate.load(args, environment=environment)
+                environment.clear_cache()
+                return book
+            return load
+
+        def load_ansible_objects():
+            from ansible.playbook import Playbook
+            pb = Playbook.load(playbook, variable_manager=environment.variable_manager, loader=environment.dataloader)
+            environment.clear_cache()
+            return pb
+
+        for name, load in (('ansible', load_states('ansible')),
+                           ('fast', load_states('fast')),
+                           ('ansible-objects', load_ansible_objects)):
+            results['results'][name] = measure(load)
+    return results
+
+def main(argv=None) -> int:
+    ap = ArgumentParser(prog='python -m benchmarks.memory', description='Memory benchmark of loading a playbook')
+    add_shape_arguments(ap)
+    ap.add_argument('-o', '--output', type=str, default='-', help='The JSON file to write.[default=- (STDOUT)]')
+    option = ap.parse_args(argv)
+    results = run(option)
+    if option.output == '-':
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(option.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of deeply nested blocks.
+
+Writes `test_playbook/book_3_block_nested.yml` scaled up: each play has `--depth`
+nested blocks, each block starts with `--width` tasks before the next block and ends
+with a task after it. Measures the time to load the states and to generate the
+diagram, for each diagram type. Generating the relations asks every block for the
+entry point and the end point of its neighbours, which are resolved at load time.
+
+Usage:
+    python -m benchmarks.nested [--plays N] [--depth D] [--width W] [--parser PARSER] [--repeat K] [-o FILE]
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from argparse import ArgumentParser
+import json
+import sys
+import tempfile
+import os
+from benchmarks.run import diagram_option, timings
+from benchmarks.synthetic import write_yaml
+
+def make_nested_block(prefix:str, depth:int, width:int) -> dict:
+    '''
+    Get `depth` nested blocks, each with `width` tasks before the nested block and one after it
+    '''
+    block: dict = {'name': f'{prefix} block {depth}',
+                   'block': [{'name': f'{prefix} task {depth}.{i}', 'debug': {'msg': f'{depth}.{i}'}} for i in range(width)]}
+    if depth > 1:
+        block['block'].append(make_nested_block(prefix, depth - 1, width))
+        block['block'].append({'name': f'{prefix} end {depth}', 'debug': {'msg': f'end {depth}'}})
+    return block
+
+def write_playbook(directory:str, plays:int, depth:int, width:int) -> str:
+    book = []
+    for p in range(plays):
+        book.append({
+            'name': f'play {p}',
+            'hosts': 'localhost',
+            'tasks': [
+                {'name': f'play {p} begin', 'file': {'path': '/path/to/dir', 'state': 'directory'}},
+                make_nested_block(f'play {p}', depth, width),
+                {'name': f'play {p} end', 'debug': {'msg': 'End'}},
+            ],
+        })
+    playbook = os.path.join(directory, 'nested.yml')
+    write_yaml(playbook, book)
+    return playbook
+
+def run(plays:int, depth:int, width:int, parser:str, repeat:int) -> dict:
+    import playbook2uml.umlstate as umlstate
+    from playbook2uml.umlstate.extract import AnsibleEnvironment
+    environment = AnsibleEnvironment() if parser != 'fast' else None
+    results = {'plays': plays, 'depth': depth, 'width': width, 'parser': parser, 'results': {}}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        playbook = write_playbook(tmp_dir, plays, depth, width)
+        for diagram_type in umlstate.DIAGRAM_TYPES:
+            option = diagram_option(playbook, diagram_type, parser)
+            book = umlstate.load(option, environment=environment)
+            results['results'][diagram_type] = {
+                'load': timings(lambda: umlstate.load(option, environment=environment), repeat),
+                'generate': timings(lambda: list(book.generate()), repeat),
+                'lines': len(list(book.generate())),
+            }
+    return results
+
+def main(argv=None) -> int:
+    ap = ArgumentParser(prog='python -m benchmarks.nested', description='Benchmark of deeply nested blocks')
+    ap.add_argument('--plays', type=int, default=10, help='The number of plays.[default=10]')
+    ap.add_argument('--depth', type=int, default=60, help='The nesting depth of the blocks.[default=60]')
+    ap.add_argument('--width', type=int, default=3, help='The number of tasks in each block before the nested block.[default=3]')
+    ap.add_argument('--parser', type=str, choices=['ansible', 'fast'], default='fast', help='The playbook parser.[default=fast]')
+    ap.add_argument('--repeat', type=int, default=5, help='The number of runs of each measure.[default=5]')
+    ap.add_argument('-o', '--output', type=str, default='-', help='The JSON file to write.[default=- (STDOUT)]')
+    option = ap.parse_args(argv)
+    results = run(option.plays, option.depth, option.width, option.parser, option.repeat)
+    if option.output == '-':
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(option.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of the subtree cache on a role imported many times.
+
+Writes a playbook of `--imports` plays listing the same role of `--tasks` tasks
+(see `benchmarks.synthetic`) and measures the time to generate the diagram,
+for each diagram type, with the subtree cache (the lines of the repeated role are
+generated twice, then reused with the names of the states) and with `--no-subtree-cache`.
+The diagrams are checked to be the same.
+
+Times are the median (and the minimum) of `--repeat` runs, in seconds.
+
+Usage:
+    python -m benchmarks.repeated_roles [--imports N] [--tasks M] [--depth D] [--parser PARSER] [--repeat K] [-o FILE]
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from argparse import ArgumentParser
+import json
+import os
+import sys
+import tempfile
+from benchmarks.run import diagram_option, timings
+from benchmarks.synthetic import Shape, make_tasks, write_yaml
+
+TEXT_TYPES = ('plantuml', 'mermaid')
+
+def write_playbook(directory:str, imports:int, tasks:int, depth:int) -> str:
+    write_yaml(os.path.join(directory, 'roles', 'common', 'tasks', 'main.yml'), make_tasks('common', Shape(tasks=tasks, depth=depth)))
+    playbook = os.path.join(directory, 'site.yml')
+    write_yaml(playbook, [{'name': f'play {p}', 'hosts': 'all', 'gather_facts': False, 'roles': ['common']}
+                          for p in range(imports)])
+    return playbook
+
+def run(imports:int, tasks:int, depth:int, parser:str, repeat:int) -> dict:
+    import playbook2uml.umlstate as umlstate
+    from playbook2uml.umlstate.extract import AnsibleEnvironment
+    environment = AnsibleEnvironment() if parser != 'fast' else None
+    results = {'imports': imports, 'tasks': tasks, 'depth': depth, 'parser': parser, 'results': {}}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        playbook = write_playbook(tmp_dir, imports, tasks, depth)
+        for diagram_type in TEXT_TYPES:
+            option = diagram_option(playbook, diagram_type, parser)
+            book = umlstate.load(option, environment=environment)
+            lines = list(book.generate())
+            stats = dict(book.context.stats)
+            book.context.memoize_subtrees = False
+            same = list(book.generate()) == lines
+            uncached = timings(lambda: list(book.generate()), repeat)
+            book.context.memoize_subtrees = True
+            cached = timings(lambda: list(book.generate()), repeat)
+            results['results'][diagram_type] = {
+                'generate': cached,
+                'generate_uncached': uncached,
+                'speedup': round(uncached['median'] / cached['median'], 2),
+                'lines': len(lines),
+                'same': same,
+                'hits': stats.get('subtree_cache_hits', 0),
+                'templates': stats.get('subtree_cache_templates', 0),
+            }
+    return results
+
+def main(argv=None) -> int:
+    ap = ArgumentParser(prog='python -m benchmarks.repeated_roles', description='Benchmark of the subtree cache on a role imported many times')
+    ap.add_argument('--imports', type=int, default=50, help='The number of plays listing the role.[default=50]')
+    ap.add_argument('--tasks', type=int, default=100, help='The number of tasks of the role.[default=100]')
+    ap.add_argument('--depth', type=int, default=2, help='The nesting depth of the blocks of the role.[default=2]')
+    ap.add_argument('--parser', type=str, choices=['ansible', 'fast'], default='fast', help='The playbook parser.[default=fast]')
+    ap.add_argument('--repeat', type=int, default=5, help='The number of runs of each measure.[default=5]')
+    ap.add_argument('-o', '--output', type=str, default='-', help='The JSON file to write.[default=- (STDOUT)]')
+    option = ap.parse_args(argv)
+    results = run(option.imports, option.tasks, option.depth, option.parser, option.repeat)
+    if option.output == '-':
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(option.output, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
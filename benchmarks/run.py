@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark harness of playbook2uml.
+
+Writes a synthetic playbook (see `benchmarks.synthetic`) and measures, for each
+diagram type and parser:
+
+- `startup`: the wall time of `python -m playbook2uml` on a one-task playbook, in a new process
+- `cli`: the wall time of `python -m playbook2uml` on the synthetic playbook, in a new process
+- `load`: the time of `UMLStatePlaybook.__init__` (with a warm Ansible environment)
+- `generate`: the time to consume `UMLStatePlaybook.generate()`
+- `peak_bytes`: the peak memory of loading and generating, traced with tracemalloc
+
+Times are the median (and the minimum) of `--repeat` runs, in seconds.
+The results are written as JSON. With `--compare BASELINE.json`, the medians are
+compared to a previous result and the exit status is 1 when one is slower than
+`--threshold` times the baseline.
+
+Usage:
+    python -m benchmarks.run [--plays N] [--tasks M] [--repeat K] [-o FILE] [--compare BASELINE.json]
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from argparse import ArgumentParser, Namespace
+from typing import Callable
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from benchmarks.synthetic import add_shape_arguments, shape_from_args, write_project
+
+TINY_PLAYBOOK = '- hosts: all\n  tasks:\n    - ping:\n'
+
+def timings(func:Callable[[], object], repeat:int) -> dict:
+    '''
+    Call `func` `repeat` times, returns the median and the minimum seconds
+    '''
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'median': statistics.median(times), 'min': min(times)}
+
+def run_cli(*args:str) -> None:
+    subprocess.run([sys.executable, '-m', 'playbook2uml', *args], check=True, stdout=subprocess.DEVNULL)
+
+def diagram_option(playbook:str, diagram_type:str, parser:str) -> Namespace:
+    return Namespace(PLAYBOOK=playbook, type=diagram_type, parser=parser, role='', tasks_from='main', BASE_DIR=None,
+                     title=None, theme=None, left_to_right=False, verbose=0)
+
+def bench_case(playbook:str, diagram_type:str, parser:str, repeat:int, environment) -> dict:
+    import playbook2uml.umlstate as umlstate
+    option = diagram_option(playbook, diagram_type, parser)
+
+    def load():
+        environment.clear_cache()
+        return umlstate.load(option, environment=environment)
+
+    book = load()
+    lines = sum(1 for _ in book.generate())
+
+    def load_and_generate():
+        for _ in load().generate():
+            pass
+
+    gc.collect()
+    tracemalloc.start()
+    load_and_generate()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'lines': lines,
+        'cli': timings(lambda: run_cli('-t', diagram_type, '--parser', parser, playbook), repeat),
+        'load': timings(load, repeat),
+        'generate': timings(lambda: sum(1 for _ in book.generate()), repeat),
+        'peak_bytes': peak,
+    }
+
+def run(option:Namespace) -> dict:
+    from playbook2uml.cache import tool_version
+    from playbook2uml.umlstate.extract import AnsibleEnvironment
+    shape = shape_from_args(option)
+    result = {
+        'version': tool_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'shape': shape._asdict(),
+        'repeat': option.repeat,
+        'startup': {},
+        'cases': {},
+    }
+    try:
+        from importlib.metadata import version
+        result['ansible_core'] = version('ansible-core')
+    except Exception:
+        result['ansible_core'] = None
+
+    environment = AnsibleEnvironment()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tiny = os.path.join(tmp_dir, 'tiny.yml')
+        with open(tiny, 'w') as f:
+            f.write(TINY_PLAYBOOK)
+        playbook = write_project(tmp_dir, shape)
+        for parser in option.parser:
+            result['startup'][parser] = timings(lambda: run_cli('--parser', parser, tiny), option.repeat)
+            for diagram_type in option.type:
+                name = f'{diagram_type}/{parser}'
+                print(f'benchmark {name}', file=sys.stderr)
+                result['cases'][name] = bench_case(playbook, diagram_type, parser, option.repeat, environment)
+    return result
+
+def compare(result:dict, baseline:dict, threshold:float) -> list[str]:
+    '''
+    Get the measurements slower than `threshold` times the baseline
+    '''
+    regressions = []
+    pairs = [(f'startup/{parser}', value, baseline.get('startup', {}).get(parser))
+             for parser, value in result['startup'].items()]
+    for name, case in result['cases'].items():
+        base_case = baseline.get('cases', {}).get(name, {})
+        pairs.extend((f'{name}/{metric}', case[metric], base_case.get(metric)) for metric in ('cli', 'load', 'generate'))
+    for name, value, base in pairs:
+        if base and value['median'] > base['median'] * threshold:
+            regressions.append(f'{name}: {value["median"]:.4f}s > {base["median"]:.4f}s x {threshold}')
+    return regressions
+
+def main(argv=None) -> int:
+    ap = ArgumentParser(prog='python -m benchmarks.run', description='Benchmark playbook2uml on a synthetic playbook')
+    add_shape_arguments(ap)
+    ap.add_argument('--repeat', type=int, default=5, help='The number of runs of each measurement.[default=5]')
+    ap.add_argument('-t', '--type', action='append', choices=['plantuml', 'mermaid'],
+                    help='The diagram types to measure.[default=both]')
+    ap.add_argument('--parser', action='append', choices=['ansible', 'fast'],
+                    help='The parsers to measure.[default=both]')
+    ap.add_argument('-o', '--output', type=str, default='-', help='The JSON file to write.[default=- (STDOUT)]')
+    ap.add_argument('--compare', type=str, metavar='BASELINE', help='Compare with a previous JSON result')
+    ap.add_argument('--threshold', type=float, default=1.2,
+                    help='The slowdown ratio reported as a regression with --compare.[default=1.2]')
+    option = ap.parse_args(argv)
+    option.type = option.type or ['plantuml', 'mermaid']
+    option.parser = option.parser or ['ansible', 'fast']
+
+    result = run(option)
+    if option.output == '-':
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        with open(option.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if option.compare:
+        with open(option.compare, 'r') as f:
+            regressions = compare(result, json.load(f), option.threshold)
+        for regression in regressions:
+            print(f'regression: {regression}', file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+'''
+Synthetic playbooks for the benchmarks.
+
+`write_project` writes a playbook of N plays x M tasks and its roles into a directory.
+The tasks cycle through the syntaxes the diagrams show: plain modules with arguments,
+`when`, `loop`/`with_items`, `until`/`retries`/`delay`, `become`/`register`/`delegate_to`,
+and nested blocks with `rescue`/`always`.
+
+Usage:
+    python -m benchmarks.synthetic OUTPUT_DIR [--plays N] [--tasks M] [--roles R] [--depth D]
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from argparse import ArgumentParser
+from typing import NamedTuple
+import os
+import sys
+import yaml
+
+class Shape(NamedTuple):
+    '''
+    The size of a synthetic playbook
+    '''
+    plays: int = 10
+    """
+    The number of plays
+    """
+    tasks: int = 100
+    """
+    The number of tasks per play (and per role)
+    """
+    roles: int = 2
+    """
+    The number of roles, each play lists all of them
+    """
+    depth: int = 2
+    """
+    The nesting depth of the blocks
+    """
+    block_every: int = 10
+    """
+    Every `block_every` tasks are wrapped in nested blocks
+    """
+
+def make_task(prefix:str, i:int) -> dict:
+    '''
+    Get the i-th task, the kind of task cycles with `i`
+    '''
+    name = f'{prefix} task {i}'
+    kind = i % 6
+    if kind == 0:
+        return {'name': name, 'ansible.builtin.copy': {'src': f'files/{i}.conf', 'dest': f'/etc/app/{i}.conf', 'mode': '0644'}}
+    elif kind == 1:
+        return {'name': name, 'ansible.builtin.debug': {'msg': f'value {i}'}, 'when': [f'var_{i} is defined', f'var_{i} | bool']}
+    elif kind == 2:
+        return {'name': name, 'ansible.builtin.package': {'name': '{{ item }}', 'state': 'present'},
+                'loop': [f'pkg-{i}-a', f'pkg-{i}-b', f'pkg-{i}-c']}
+    elif kind == 3:
+        return {'name': name, 'ansible.builtin.uri': {'url': f'http://localhost:{8000 + i}/health'},
+                'register': f'result_{i}', 'until': f'result_{i}.status == 200', 'retries': 5, 'delay': 2}
+    elif kind == 4:
+        return {'name': name, 'ansible.builtin.command': f'/usr/bin/app --id {i} creates=/var/lib/app/{i}',
+                'become': True, 'become_user': 'app', 'delegate_to': 'localhost'}
+    return {'name': name, 'ansible.builtin.debug': {'var': 'item'}, 'with_items': f'{{{{ items_{i} }}}}'}
+
+def make_block(prefix:str, tasks:list[dict], depth:int) -> dict:
+    '''
+    Wrap the tasks in `depth` nested blocks with `rescue` and `always`
+    '''
+    block = {'name': f'{prefix} block {depth}', 'block': tasks,
+             'rescue': [{'name': f'{prefix} rescue {depth}', 'ansible.builtin.debug': {'msg': 'failed'}}],
+             'always': [{'name': f'{prefix} always {depth}', 'ansible.builtin.debug': {'msg': 'done'}}]}
+    if depth > 1:
+        return make_block(prefix, [block], depth - 1)
+    return block
+
+def make_tasks(prefix:str, shape:Shape) -> list[dict]:
+    tasks = []
+    chunk = []
+    for i in range(shape.tasks):
+        chunk.append(make_task(prefix, i))
+        if shape.depth and len(chunk) == shape.block_every:
+            tasks.append(make_block(f'{prefix} {i}', chunk, shape.depth))
+            chunk = []
+    tasks.extend(chunk)
+    return tasks
+
+def write_yaml(path:str, data) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        yaml.safe_dump(data, f, sort_keys=False, width=1000)
+
+def write_project(directory:str, shape:Shape=Shape()) -> str:
+    '''
+    Write the playbook `site.yml` and its roles into the directory.
+
+    Returns:
+        str: The path of the playbook
+    '''
+    role_names = [f'role_{r}' for r in range(shape.roles)]
+    for role in role_names:
+        write_yaml(os.path.join(directory, 'roles', role, 'tasks', 'main.yml'), make_tasks(role, shape))
+
+    book = []
+    for p in range(shape.plays):
+        book.append({
+            'name': f'play {p}',
+            'hosts': 'all',
+            'gather_facts': False,
+            'roles': role_names,
+            'tasks': make_tasks(f'play {p}', shape),
+        })
+    playbook = os.path.join(directory, 'site.yml')
+    write_yaml(playbook, book)
+    return playbook
+
+def add_shape_arguments(ap:ArgumentParser) -> None:
+    default = Shape()
+    ap.add_argument('--plays', type=int, default=default.plays, help=f'The number of plays.[default={default.plays}]')
+    ap.add_argument('--tasks', type=int, default=default.tasks, help=f'The number of tasks per play and role.[default={default.tasks}]')
+    ap.add_argument('--roles', type=int, default=default.roles, help=f'The number of roles.[default={default.roles}]')
+    ap.add_argument('--depth', type=int, default=default.depth, help=f'The nesting depth of the blocks.[default={default.depth}]')
+    ap.add_argument('--block-every', type=int, default=default.block_every,
+                    help=f'Wrap every N tasks in nested blocks.[default={default.block_every}]')
+
+def shape_from_args(option) -> Shape:
+    return Shape(plays=option.plays, tasks=option.tasks, roles=option.roles,
+                 depth=option.depth, block_every=option.block_every)
+
+def main(argv=None) -> int:
+    ap = ArgumentParser(prog='python -m benchmarks.synthetic', description='Write a synthetic playbook')
+    ap.add_argument('OUTPUT_DIR', type=str, help='The directory to write site.yml and the roles to')
+    add_shape_arguments(ap)
+    option = ap.parse_args(argv)
+    print(write_project(option.OUTPUT_DIR, shape_from_args(option)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+'''
+asyncio API to render diagrams from a web service without blocking the event loop.
+
+Loading the playbook (ansible-core or the fast parser) and generating the lines are
+blocking, so they run in an executor thread, and the lines are streamed back to the
+event loop as they are generated.
+
+- Backpressure: the thread waits when `max_chunks` chunks of `chunk_size` lines are not
+  consumed yet, so a slow client does not buffer the whole diagram in memory
+- Cancellation: when the consumer stops (`break`, `aclose()` or a cancelled task),
+  the thread stops generating at the next chunk. Loading the playbook is not interrupted.
+
+Example:
+    >>> async for line in render_async('site.yml', type='mermaid', max_depth=2):
+    ...     await response.write(line + '\\n')
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import Any, AsyncIterator, Optional
+from argparse import Namespace
+from concurrent.futures import Executor
+import asyncio
+import threading
+import playbook2uml.umlstate as umlstate
+from playbook2uml.logger import getLogger
+
+logger = getLogger(__name__)
+
+OPTION_DEFAULTS: dict[str, Any] = {
+    'type': 'plantuml',
+    'title': None,
+    'theme': None,
+    'left_to_right': False,
+    'parser': 'ansible',
+    'role': '',
+    'tasks_from': 'main',
+    'base_dir': None,
+    'no_role_cache': False,
+    'no_subtree_cache': False,
+    'stable_ids': False,
+    'resolve_includes': False,
+    'include_depth': 5,
+    'collapse_roles': False,
+    'max_depth': None,
+    'max_args': None,
+    'max_arg_length': None,
+    'cache_dir': None,
+    'cache_max_size': 256 * 1024 * 1024,
+    'verbose': 0,
+}
+"""
+The keyword options of `render_async`, the options of the command line
+"""
+
+_END = object()
+
+_environment = None
+_environment_lock = threading.Lock()
+
+def create_option(playbook:Optional[str]=None, **options) -> Namespace:
+    '''
+    Create the options of `umlstate.load` from the keyword options (see `OPTION_DEFAULTS`).
+    The role mode is selected by `role`, with `base_dir` (the current directory by default).
+    '''
+    unknown = set(options) - set(OPTION_DEFAULTS)
+    if unknown:
+        raise TypeError('unknown options: %s' % ', '.join(sorted(unknown)))
+    values = dict(OPTION_DEFAULTS, **options)
+    if values['type'] not in umlstate.DIAGRAM_TYPES or values['type'] in umlstate.BINARY_TYPES:
+        raise ValueError(f'invalid type: {values["type"]}')
+    base_dir = values.pop('base_dir')
+    if values['role']:
+        playbook = base_dir = base_dir or '.'
+    elif playbook is None:
+        raise ValueError('one of playbook or role is required.')
+    return Namespace(PLAYBOOK=playbook, BASE_DIR=base_dir, **values)
+
+def shared_environment():
+    '''
+    Get the Ansible environment shared by the renderings without an `environment`, created at the first call
+    '''
+    global _environment
+    with _environment_lock:
+        if _environment is None:
+            from playbook2uml.umlstate.extract import AnsibleEnvironment
+            _environment = AnsibleEnvironment()
+        return _environment
+
+async def render_async(playbook:Optional[str]=None, *, option:Optional[Namespace]=None,
+                       executor:Optional[Executor]=None, environment=None,
+                       chunk_size:int=64, max_chunks:int=16, **options) -> AsyncIterator[str]:
+    '''
+    Render the diagram of the playbook (or the role) and yield the lines as they are generated.
+
+    Args:
+        playbook (str, optional): The playbook file
+        option (Namespace, optional): The options of the command line (e.g. of `cli.parse_args`),
+            instead of `playbook` and the keyword options
+        executor (Executor, optional): The thread pool loading and generating the diagram.
+            The default executor of the event loop when omitted.
+        environment (AnsibleEnvironment, optional): The Ansible environment.
+            One environment is shared by the renderings when omitted.
+        chunk_size (int): The number of lines sent to the event loop at once
+        max_chunks (int): The number of chunks generated ahead of the consumer
+        **options: The options of the diagram, see `OPTION_DEFAULTS`
+
+    Raises:
+        The exceptions of loading the playbook, when the first line is awaited
+    '''
+    if option is None:
+        option = create_option(playbook, **options)
+    elif playbook is not None or options:
+        raise TypeError('option can not be used with playbook or the keyword options')
+    if chunk_size < 1 or max_chunks < 1:
+        raise ValueError('chunk_size and max_chunks must be positive numbers.')
+    if environment is None and getattr(option, 'parser', 'ansible') != 'fast' and not getattr(option, 'from_graph', False):
+        environment = await asyncio.get_running_loop().run_in_executor(executor, shared_environment)
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    slots = threading.Semaphore(max_chunks)
+    cancelled = threading.Event()
+
+    def send(item) -> bool:
+        slots.acquire()
+        if cancelled.is_set():
+            return False
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+        return True
+
+    def produce() -> None:
+        try:
+            chunk = []
+            for line in umlstate.generate(option, environment=environment):
+                chunk.append(line)
+                if len(chunk) >= chunk_size:
+                    if not send(chunk):
+                        logger.debug('cancelled: %s', option.role or option.PLAYBOOK)
+                        return
+                    chunk = []
+            if chunk and not send(chunk):
+                return
+            send(_END)
+        except BaseException as e:
+            send(e)
+
+    producer = loop.run_in_executor(executor, produce)
+    try:
+        while True:
+            item = await queue.get()
+            slots.release()
+            if item is _END:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            for line in item:
+                yield line
+        await producer
+    finally:
+        # wake up the producer waiting for a slot, it stops at the next chunk
+        cancelled.set()
+        slots.release()
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+'''
+Render many playbooks/roles in one process.
+
+Loading ansible-core, initializing its plugin loader and creating the
+DataLoader/VariableManager cost far more than converting a playbook, so the
+batch mode sets them up once and reuses them for every input.
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import Iterable, Iterator, NamedTuple, Optional
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import os
+import sys
+import time
+import playbook2uml.umlstate as umlstate
+from playbook2uml.logger import getLogger, setLoggerLevel
+from playbook2uml.output import open_output, write_output, is_gzip_path
+
+logger = getLogger(__name__)
+
+_worker_environment = None
+"""
+The Ansible environment of the worker process, see `_init_worker`
+"""
+
+class BatchJob(NamedTuple):
+    '''
+    A playbook or a role to render and the file to write the diagram to.
+    '''
+    source: str
+    output: str
+    option: Namespace
+
+class BatchResult(NamedTuple):
+    '''
+    The result of a `BatchJob`. `error` is `None` on success.
+    '''
+    source: str
+    output: str
+    error: Optional[str] = None
+    seconds: float = 0.0
+    """
+    The wall time of loading, generating and writing the diagram
+    """
+
+def read_manifest(manifest:str) -> Iterator[str]:
+    '''
+    Read playbook paths or glob patterns from the manifest file, one per line.
+    Empty lines and lines starting with `#` are ignored.
+    `-` reads the manifest from STDIN.
+    '''
+    if manifest == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(manifest, 'r') as f:
+            lines = f.read().splitlines()
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+def expand_inputs(patterns:Iterable[str]) -> list[str]:
+    '''
+    Expand glob patterns (`**` is supported) to the playbook files.
+    The order of the patterns is kept, the files matched by a pattern are sorted
+    and duplicates are removed.
+    '''
+    playbooks: dict[str, None] = {}
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            paths = sorted(glob.glob(pattern, recursive=True))
+            if not paths:
+                logger.warning('no files matched: %s', pattern)
+        else:
+            paths = [pattern]
+        for path in paths:
+            if os.path.isfile(path):
+                playbooks.setdefault(os.path.normpath(path), None)
+            else:
+                logger.warning('not a file: %s', path)
+    return list(playbooks)
+
+def output_path(source:str, output_dir:str, diagram_type:str, compress:bool=False, root:Optional[str]=None) -> str:
+    '''
+    Get the output file path of the `source` playbook.
+    The directory layout relative to `root` (the current directory by default) is kept under `output_dir`.
+    A playbook outside `root` is written to its absolute path under `output_dir`.
+    '''
+    abs_path = os.path.abspath(source)
+    rel_path = os.path.relpath(abs_path, root or os.curdir)
+    if rel_path.split(os.sep)[0] == os.pardir:
+        rel_path = os.path.splitdrive(abs_path)[1].lstrip(os.sep)
+    base_name, _ = os.path.splitext(rel_path)
+    return os.path.join(output_dir, base_name + umlstate.FILE_EXTENSIONS[diagram_type] + ('.gz' if compress else ''))
+
+def create_jobs(playbooks:Iterable[str], option:Namespace, output_dir:str,
+                roles:Iterable[str] = (), base_dir:str = '.', root:Optional[str] = None) -> list[BatchJob]:
+    '''
+    Create the jobs from the playbook files and the role names.
+
+    `option` holds the diagram options shared by all jobs (`type`, `title`, `theme`,
+    `left_to_right`, `tasks_from`, `verbose` and `gzip`).
+    The diagrams of the playbooks are written with their layout relative to `root`
+    (the current directory by default), see `output_path`.
+    The diagrams of the roles are written to `OUTPUT_DIR/roles/ROLE_NAME.EXT`.
+
+    Raises:
+        ValueError: Two inputs are written to the same file
+    '''
+    compress = getattr(option, 'gzip', False)
+    jobs = []
+    for playbook in playbooks:
+        job_option = Namespace(**vars(option))
+        job_option.PLAYBOOK = playbook
+        job_option.role = ''
+        job_option.BASE_DIR = None
+        jobs.append(BatchJob(playbook, output_path(playbook, output_dir, option.type, compress, root), job_option))
+
+    for role in roles:
+        job_option = Namespace(**vars(option))
+        job_option.PLAYBOOK = base_dir
+        job_option.role = role
+        job_option.BASE_DIR = base_dir
+        file_name = role if option.tasks_from == 'main' else f'{role}.{option.tasks_from}'
+        output = os.path.join(output_dir, 'roles', file_name + umlstate.FILE_EXTENSIONS[option.type] + ('.gz' if compress else ''))
+        jobs.append(BatchJob(f'role:{role}', output, job_option))
+
+    sources: dict[str, str] = {}
+    for job in jobs:
+        source = sources.setdefault(os.path.normpath(job.output), job.source)
+        if source != job.source:
+            raise ValueError(f'{source} and {job.source} are written to the same file: {job.output}')
+    return jobs
+
+def render_job(job:BatchJob, environment=None) -> BatchResult:
+    '''
+    Render the diagram of the job and write it to `job.output`.
+    Errors are not raised but returned as the `BatchResult.error`, and reported by the caller.
+    '''
+    logger.info('render %s => %s', job.source, job.output)
+    start = time.perf_counter()
+    try:
+        lines = umlstate.generate(job.option, environment=environment)
+        output_dir = os.path.dirname(job.output)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        binary_mode = job.option.type in umlstate.BINARY_TYPES
+        with open_output(job.output, compress=getattr(job.option, 'gzip', False) or is_gzip_path(job.output),
+                         binary_mode=binary_mode) as stream:
+            write_output(lines, stream, binary_mode)
+    except Exception as e:
+        logger.debug('failed to render %s', job.source, exc_info=True)
+        return BatchResult(job.source, job.output, f'{e.__class__.__name__}: {e}', time.perf_counter() - start)
+
+    return BatchResult(job.source, job.output, seconds=time.perf_counter() - start)
+
+def _init_worker(verbose:int=0, parser:str='ansible'):
+    '''
+    Initializer of the worker processes.
+    Each worker sets up its own Ansible environment (and the plugin loader) once.
+    The fast parser does not need it.
+    '''
+    global _worker_environment
+    setLoggerLevel(logger, verbose)
+    if parser == 'fast':
+        return
+    from playbook2uml.umlstate.extract import AnsibleEnvironment
+    _worker_environment = AnsibleEnvironment()
+
+def _render_in_worker(job:BatchJob) -> BatchResult:
+    return render_job(job, _worker_environment)
+
+def render_batch(jobs:Iterable[BatchJob], environment=None, processes:int=1) -> Iterator[BatchResult]:
+    '''
+    Render all jobs with one Ansible environment per process.
+
+    Args:
+        jobs: The jobs created by `create_jobs`
+        environment (AnsibleEnvironment, optional): Shared Ansible loaders used in serial mode.
+            A new one is created when omitted.
+        processes (int): The number of worker processes. `1` renders in this process.
+            The diagrams are the same as in serial mode because the state IDs are
+            allocated per playbook (see `RenderContext`).
+
+    No Ansible environment is created when the jobs use the fast parser (`--parser fast`).
+
+    Yields:
+        BatchResult: The result of each job, in the order of `jobs`.
+    '''
+    jobs = list(jobs)
+    verbose = jobs[0].option.verbose if jobs else 0
+    parser = getattr(jobs[0].option, 'parser', 'ansible') if jobs else 'ansible'
+    if processes > 1:
+        logger.info('render %s jobs with %s processes', len(jobs), processes)
+        chunksize = max(1, len(jobs) // (processes * 4))
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(verbose, parser)) as executor:
+            yield from executor.map(_render_in_worker, jobs, chunksize=chunksize)
+        return
+
+    if environment is None and parser != 'fast':
+        from playbook2uml.umlstate.extract import AnsibleEnvironment
+        environment = AnsibleEnvironment()
+
+    for job in jobs:
+        yield render_job(job, environment)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+'''
+Content-addressed on-disk cache of the generated diagrams.
+
+The cache key is a hash of the playbook and every file it pulls in (see
+`playbook2uml.dependency`), the diagram type, the diagram options and the tool
+version. A cache hit returns the stored diagram without loading ansible-core.
+The playbooks pulling in files which can not be found statically (templated paths,
+roles outside the role search path) are not cached, their changes could not be detected.
+The entries are evicted in least-recently-used order when the cache exceeds its size.
+The size is counted by walking the cache directory once per process, then added up by the
+stores of the process, so the other processes writing the same directory are seen by the next walk.
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import Callable, Iterable, Iterator, Optional
+from argparse import Namespace
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from playbook2uml.logger import getLogger, setLoggerLevel
+
+logger = getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+KEY_OPTIONS = ('type', 'title', 'theme', 'left_to_right', 'role', 'tasks_from', 'parser',
+               'collapse_roles', 'max_depth', 'max_args', 'max_arg_length', 'resolve_includes', 'include_depth',
+               'stable_ids')
+"""
+The options which change the generated diagram
+"""
+
+_sizes: dict[str, int] = {}
+"""
+The total size of each cache directory, counted by `OutputCache.evict()` and added up by `OutputCache.store()`
+"""
+_sizes_lock = threading.Lock()
+
+def tool_version() -> str:
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+        return version('playbook2uml')
+    except PackageNotFoundError:
+        return 'unknown'
+
+def parse_size(size:str) -> int:
+    '''
+    Parse a size like `512M`, `2G`, `100k` or `1048576` to bytes
+    '''
+    m = re.fullmatch(r'\s*(\d+)\s*([kKmMgG]?)[bB]?\s*', size)
+    if not m:
+        raise ValueError(f'invalid size: {size}')
+    return int(m.group(1)) * 1024 ** ' kmg'.index(m.group(2).lower() or ' ')
+
+def cache_key(option:Namespace) -> Optional[str]:
+    '''
+    Get the cache key of the diagram of `option.PLAYBOOK` (or `option.role`),
+    `None` when some dependencies can not be resolved.
+    '''
+    # PyYAML is imported when a key is computed, not when the options are parsed
+    from playbook2uml.dependency import collect_dependencies
+    dependencies = collect_dependencies(option.PLAYBOOK, role=option.role,
+                                        tasks_from=option.tasks_from, base_dir=option.BASE_DIR)
+    logger.debug('dependencies: %s', dependencies)
+    if dependencies.unresolved:
+        logger.info('not cached, unresolved dependencies: %s', ', '.join(dependencies.unresolved))
+        return None
+    h = hashlib.sha256()
+    h.update(f'playbook2uml {tool_version()}\0'.encode())
+    for key in KEY_OPTIONS:
+        h.update(f'{key}={getattr(option, key, None)!r}\0'.encode())
+    base_dir = option.BASE_DIR if option.role else os.path.dirname(option.PLAYBOOK)
+    for path in dependencies.files:
+        h.update(f'file:{os.path.relpath(path, base_dir or ".")}\0'.encode())
+        with open(path, 'rb') as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+class OutputCache:
+    '''
+    Stores the generated diagrams in `cache_dir/XX/KEY.EXT`.
+
+    Args:
+        cache_dir (str): The cache directory, created when missing.
+        max_size (int): The maximum total size in bytes. The least recently used
+            entries are removed when exceeded.
+    '''
+
+    def __init__(self, cache_dir:str, max_size:int=DEFAULT_MAX_SIZE) -> None:
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def _path(self, key:str, ext:str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ext)
+
+    def get(self, key:str, ext:str) -> Optional[str]:
+        '''
+        Get the stored diagram, `None` on a cache miss.
+        '''
+        path = self._path(key, ext)
+        try:
+            with open(path, 'r', encoding='utf-8', newline='\n') as f:
+                text = f.read()
+        except FileNotFoundError:
+            logger.info('cache miss: %s', key)
+            return None
+        try:
+            # mtime is the last used time of LRU
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        logger.info('cache hit: %s', key)
+        return text
+
+    def store(self, key:str, ext:str, lines:Iterable[str]) -> Iterator[str]:
+        '''
+        Pass through the generated lines while writing them to the cache.
+        The entry is stored only when all lines were consumed.
+        '''
+        path = self._path(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as f:
+                for line in lines:
+                    f.write(line)
+                    f.write('\n')
+                    yield line
+                f.flush()
+                size = os.fstat(f.fileno()).st_size
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        cache_dir = os.path.abspath(self.cache_dir)
+        with _sizes_lock:
+            total = _sizes.get(cache_dir)
+            if total is not None:
+                total = _sizes[cache_dir] = total + size
+        if total is None or total > self.max_size:
+            self.evict()
+
+    def evict(self) -> None:
+        '''
+        Remove the least recently used entries until the total size is 90% of `max_size`,
+        so that the next stores have room before the next eviction.
+        Walks the cache directory, `store()` calls it when the size counted so far exceeds `max_size`.
+        '''
+        entries = []
+        total = 0
+        for dir_path, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                if file_name.endswith('.tmp'):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total > self.max_size:
+            target = self.max_size * 9 // 10
+            for _, size, path in sorted(entries):
+                logger.info('evict %s', path)
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= target:
+                    break
+        with _sizes_lock:
+            _sizes[os.path.abspath(self.cache_dir)] = total
+
+def generate_with_cache(option:Namespace, generate:Callable[[], Iterable[str]], ext:str) -> Iterator[str]:
+    '''
+    Yield the diagram lines from the cache in `option.cache_dir`.
+    On a cache miss, `generate()` is called and its lines are stored while yielded.
+    The cache is neither read nor written when some dependencies can not be resolved.
+    '''
+    setLoggerLevel(logger, getattr(option, 'verbose', 0))
+    key = cache_key(option)
+    if key is None:
+        yield from generate()
+        return
+    output_cache = OutputCache(option.cache_dir, getattr(option, 'cache_max_size', DEFAULT_MAX_SIZE))
+    text = output_cache.get(key, ext)
+    if text is not None:
+        yield from text.split('\n')[:-1]
+        return
+    yield from output_cache.store(key, ext, generate())
@@ -1,29 +1,105 @@
 #!env python
 # -*- coding: utf-8 -*-
 from __future__ import (absolute_import, division, print_function, annotations)
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
 import playbook2uml.logger as umlLogger
 import playbook2uml.umlstate as umlstate
 import sys
 import os.path
 
-def parse_args(args: list[str]):
-    ap = ArgumentParser(prog='playbook2uml' ,description='Ansible playbook/role to PlantUML or Mermaid.js diagram', usage='''
-    %(prog)s [options] PLAYBOOK
-    %(prog)s [options] -R ROLE_NAME [BASE_DIR]
-    ''')
-    ap.add_argument('-t', '--type', type=str, choices=['plantuml', 'mermaid'], default='plantuml', help='The diagram type.[default=plantuml]')
+def add_diagram_arguments(ap: ArgumentParser):
+    '''
+    Add the options of the diagram which are common to all commands
+    '''
+    ap.add_argument('-t', '--type', type=str, choices=umlstate.DIAGRAM_TYPES, default='plantuml', help='''
+        The diagram type. `json` (JSON Lines) and `msgpack` write the state graph.[default=plantuml]
+        ''')
     ap.add_argument('-T', '--title', type=str, help='The title of the playbook/role')
     ap.add_argument('--theme', type=str, default=None, help='PlantUML theme')
     ap.add_argument('--left-to-right', action='store_true', help='left to right direction')
+    ap.add_argument('--parser', type=str, choices=['ansible', 'fast'], default='ansible', help='''
+        The playbook parser. `fast` reads the YAML directly without Ansible's object model.
+        [default=ansible]
+        ''')
+    ap.add_argument('--no-role-cache', action='store_true', help='Do not share the states of a role between the plays and the playbooks')
+    ap.add_argument('--no-subtree-cache', action='store_true', help='Generate the lines of every repeated role and block instead of reusing them')
+    ap.add_argument('--stable-ids', action='store_true', help='''
+        Name the states by the hashes of their paths in the playbook (e.g. task_5f0c3a1e) instead of the counters,
+        so the lines of the unchanged parts stay the same when tasks are inserted
+        ''')
+    ap.add_argument('--resolve-includes', action='store_true', help='''
+        Expand `include_tasks`/`include_role` whose target is not templated into a block of the included tasks
+        ''')
+    ap.add_argument('--include-depth', type=non_negative_int, default=5, metavar='N', help='The number of nested includes expanded by --resolve-includes.[default=5]')
     ap.add_argument('-v', '--verbose', action="count", default=0, help='''
         Show information to STDERR.
         -v  => INFO
         -vv => DEBUG
     ''')
+    summary_group = ap.add_argument_group('Summary', 'Bound the size of the diagram, the hidden tasks are not loaded')
+    summary_group.add_argument('--collapse-roles', action='store_true', help='Show each role as one state with the number of its tasks')
+    summary_group.add_argument('--max-depth', type=non_negative_int, metavar='N', help='Show the blocks nested deeper than N as one state with the number of their tasks')
+    summary_group.add_argument('--max-args', type=non_negative_int, metavar='N', help='Show only the first N arguments of each task')
+    summary_group.add_argument('--max-arg-length', type=non_negative_int, metavar='N', help='Truncate the argument values longer than N characters')
+    cache_group = ap.add_argument_group('Cache', 'Reuse the diagrams of unchanged playbooks')
+    cache_group.add_argument('--cache-dir', type=str, default=None, help='The directory of the output cache. The cache is disabled when omitted')
+    cache_group.add_argument('--cache-max-size', type=parse_size, default='256M', help='The maximum size of the output cache, e.g. 512M, 2G.[default=256M]')
+
+def add_watch_arguments(ap: ArgumentParser):
+    watch_group = ap.add_argument_group('Watch', 'Re-render the diagrams when the playbooks, task files of the roles or vars_files change')
+    watch_group.add_argument('--watch', action='store_true', help='Keep running and re-render the affected diagrams on changes')
+    watch_group.add_argument('--watch-interval', type=float, default=0.5, help='Seconds between the checks of the files.[default=0.5]')
+    watch_group.add_argument('--debounce', type=float, default=0.3, help='Seconds the files must stay unchanged before re-rendering.[default=0.3]')
+
+def non_negative_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise ArgumentTypeError(f'invalid number: {value}')
+    if number < 0:
+        raise ArgumentTypeError(f'must not be negative: {value}')
+    return number
+
+def parse_size(size: str) -> int:
+    from playbook2uml.cache import parse_size
+    try:
+        return parse_size(size)
+    except ValueError as e:
+        raise ArgumentTypeError(str(e))
+
+def parse_args(args: list[str]):
+    ap = ArgumentParser(prog='playbook2uml' ,description='Ansible playbook/role to PlantUML or Mermaid.js diagram', usage='''
+    %(prog)s [options] PLAYBOOK
+    %(prog)s [options] -R ROLE_NAME [BASE_DIR]
+    %(prog)s batch [options] -o OUTPUT_DIR [PLAYBOOK ...]
+    %(prog)s diff [options] OLD NEW
+    %(prog)s serve [options]
+    ''')
+    add_diagram_arguments(ap)
+
+    ap.add_argument('-o', '--output', type=str, default='-', help='The file to write the diagram to.[default=- (STDOUT)]')
+    ap.add_argument('--gzip', action='store_true', help='Write gzip compressed data. Implied when OUTPUT ends with ".gz"')
+
+    split_group = ap.add_argument_group('Split', 'Write one diagram per play and an index diagram of the plays')
+    split_group.add_argument('--split', type=str, metavar='DIR', help='The directory to write index.EXT and play_N.EXT to, instead of OUTPUT')
+    split_group.add_argument('--split-roles', action='store_true', help='Also write the roles to DIR/roles/ROLE.EXT, the plays link to them')
+    split_group.add_argument('-j', '--jobs', type=int, default=0, help='The number of threads writing the diagrams. 0 means the number of CPUs.[default=0]')
+
+    add_watch_arguments(ap)
+
+    profile_group = ap.add_argument_group('Profile', 'Record the time and the allocations of each phase')
+    profile_group.add_argument('--profile', type=str, metavar='REPORT', help='''
+        Write the JSON report of the phases (import, init_plugin_loader, parse, states of each play/role, generate)
+        to REPORT. "-" writes to STDERR
+        ''')
+    profile_group.add_argument('--profile-stats', type=str, metavar='FILE', help='Also run cProfile and write the pstats to FILE')
 
     playbook_group = ap.add_argument_group('Playbook', 'Generate a graph of the playbook')
     playbook_group.add_argument('PLAYBOOK', nargs='?', default='.', type=str, help='playbook file')
+    playbook_group.add_argument('--from-graph', action='store_true', help='''
+        PLAYBOOK is a graph file written by `-t json` or `-t msgpack` ("-" reads STDIN).
+        The diagram is rendered without ansible-core
+        ''')
 
     role_group = ap.add_argument_group('Role', 'Generate a graph of the role only')
     role_group.add_argument('-R', '--role', type=str, default='', help='The role name')
@@ -32,26 +108,314 @@ def parse_args(args: list[str]):
 
     option = ap.parse_args(args)
 
-    if option.role:
+    if option.from_graph:
+        if option.role:
+            ap.error('--from-graph can not be used with --role.')
+        if option.PLAYBOOK != '-' and not os.path.isfile(option.PLAYBOOK):
+            ap.error('PLAYBOOK must be a file.')
+    elif option.role:
         option.BASE_DIR = option.PLAYBOOK
         if not os.path.isdir(option.BASE_DIR):
             ap.error('BASE_DIR must be a directory.')
     elif not os.path.isfile(option.PLAYBOOK):
         ap.error('PLAYBOOK must be a file.')
+    if option.watch and (option.profile or option.profile_stats):
+        ap.error('--watch can not be used with --profile or --profile-stats.')
+    if option.watch and option.from_graph:
+        ap.error('--watch can not be used with --from-graph.')
+    if option.split and (option.watch or option.profile or option.profile_stats):
+        ap.error('--split can not be used with --watch, --profile or --profile-stats.')
+    if option.split and option.type in umlstate.GRAPH_TYPES:
+        ap.error(f'--split can not be used with --type {option.type}.')
+    if option.split_roles and not option.split:
+        ap.error('--split-roles requires --split.')
+    if option.jobs < 0:
+        ap.error('--jobs must be 0 or a positive number.')
+
+    return option
+
+def parse_batch_args(args: list[str]):
+    ap = ArgumentParser(prog='playbook2uml batch', description='Render many playbooks/roles in one process', usage='''
+    %(prog)s [options] -o OUTPUT_DIR [PLAYBOOK ...]
+    %(prog)s [options] -o OUTPUT_DIR --manifest FILE
+    %(prog)s [options] -o OUTPUT_DIR -R ROLE_NAME [-R ROLE_NAME ...] [--base-dir BASE_DIR]
+    %(prog)s [options] -o OUTPUT_DIR --repo DIR [--include GLOB ...] [--exclude GLOB ...]
+    ''')
+    add_diagram_arguments(ap)
+    ap.add_argument('-o', '--output-dir', type=str, required=True, help='The directory to write the diagrams to')
+    ap.add_argument('--gzip', action='store_true', help='Write gzip compressed files (with ".gz" suffix)')
+    ap.add_argument('-j', '--jobs', type=int, default=1, help='The number of worker processes. 0 means the number of CPUs.[default=1]')
+    add_watch_arguments(ap)
+
+    playbook_group = ap.add_argument_group('Playbook', 'Generate graphs of the playbooks')
+    playbook_group.add_argument('PLAYBOOK', nargs='*', type=str, help='playbook files or glob patterns (`**` is supported)')
+    playbook_group.add_argument('--manifest', type=str, help='File listing playbook files or glob patterns, one per line. `-` reads STDIN')
+
+    role_group = ap.add_argument_group('Role', 'Generate graphs of the roles only')
+    role_group.add_argument('-R', '--role', type=str, action='append', default=[], help='The role name. Can be specified multiple times')
+    role_group.add_argument('--tasks-from', type=str, default='main', help='File to load from a role\'s tasks/ directory.')
+    role_group.add_argument('--base-dir', type=str, default='.', help='The base directory of the roles.[default=current directory]')
+
+    repo_group = ap.add_argument_group('Repository', '''
+        Generate graphs of all playbooks of the repository, with the directory layout of the repository.
+        The time and the error of each playbook are written to OUTPUT_DIR/summary.json
+        ''')
+    repo_group.add_argument('--repo', type=str, metavar='DIR', help='The repository directory. `DIR/roles` is shared by all playbooks')
+    repo_group.add_argument('--include', type=str, action='append', default=[], metavar='GLOB',
+                            help='Only check the files matching the glob pattern (relative to DIR). Can be specified multiple times')
+    repo_group.add_argument('--exclude', type=str, action='append', default=[], metavar='GLOB',
+                            help='Skip the files matching the glob pattern (relative to DIR). Can be specified multiple times')
+
+    option = ap.parse_args(args)
+
+    if not (option.PLAYBOOK or option.manifest or option.role or option.repo):
+        ap.error('one of PLAYBOOK, --manifest, --role or --repo is required.')
+    if option.role and not os.path.isdir(option.base_dir):
+        ap.error('--base-dir must be a directory.')
+    if option.repo:
+        if not os.path.isdir(option.repo):
+            ap.error('--repo must be a directory.')
+        if option.PLAYBOOK or option.manifest:
+            ap.error('--repo can not be used with PLAYBOOK or --manifest.')
+    elif option.include or option.exclude:
+        ap.error('--include and --exclude require --repo.')
+    if option.jobs < 0:
+        ap.error('--jobs must be 0 or a positive number.')
+    if option.jobs == 0:
+        option.jobs = os.cpu_count() or 1
 
     return option
 
+def batch_main(args: list[str]) -> int:
+    '''main of `batch` sub command'''
+    import playbook2uml.batch as batch
+    option = parse_batch_args(args)
+
+    logger = umlLogger.getLogger(__name__, option.verbose)
+    umlLogger.setLoggerLevel(batch.logger, option.verbose)
+
+    if option.repo:
+        return repo_main(option)
+
+    patterns = list(option.PLAYBOOK)
+    if option.manifest:
+        patterns.extend(batch.read_manifest(option.manifest))
+
+    try:
+        jobs = batch.create_jobs(batch.expand_inputs(patterns), option, option.output_dir,
+                                 roles=option.role, base_dir=option.base_dir)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    logger.info('%s jobs', len(jobs))
+
+    if option.watch:
+        return watch(jobs, option)
+
+    failures = [result for result in batch.render_batch(jobs, processes=option.jobs) if result.error]
+    for result in failures:
+        print(f'{result.source}: {result.error}', file=sys.stderr)
+
+    logger.info('%s succeeded, %s failed', len(jobs) - len(failures), len(failures))
+    return 1 if failures else 0
+
+def repo_main(option) -> int:
+    '''Render all playbooks of `--repo` and write the summary'''
+    import time
+    import playbook2uml.batch as batch
+    import playbook2uml.repo as umlrepo
+    umlLogger.setLoggerLevel(umlrepo.logger, option.verbose)
+    logger = umlLogger.getLogger(__name__, option.verbose)
+
+    start = time.perf_counter()
+    playbooks = umlrepo.find_playbooks(option.repo, option.include, option.exclude)
+    try:
+        jobs = batch.create_jobs(playbooks, option, option.output_dir,
+                                 roles=option.role, base_dir=option.base_dir, root=option.repo)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    logger.info('%s jobs', len(jobs))
+
+    with umlrepo.roles_path(umlrepo.repo_roles_dirs(option.repo)):
+        if option.watch:
+            return watch(jobs, option)
+        results = list(batch.render_batch(jobs, processes=option.jobs))
+
+    summary_path = os.path.join(option.output_dir, umlrepo.SUMMARY_FILE)
+    summary = umlrepo.write_summary(summary_path, option.repo, results, time.perf_counter() - start)
+    for failure in summary['failures']:
+        print(f'{failure["source"]}: {failure["error"]}', file=sys.stderr)
+    print(f'{summary["playbooks"]} playbooks, {summary["failed"]} failed in {summary["seconds"]:.1f}s: {summary_path}', file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+def watch(jobs: list, option) -> int:
+    '''Render the jobs and re-render them on changes until interrupted'''
+    import playbook2uml.watch as umlwatch
+    umlLogger.setLoggerLevel(umlwatch.logger, option.verbose)
+
+    def on_render(result):
+        if result.error:
+            print(f'{result.source}: {result.error}', file=sys.stderr)
+
+    watcher = umlwatch.Watcher(jobs, interval=option.watch_interval, debounce=option.debounce, on_render=on_render)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def parse_diff_args(args: list[str]):
+    ap = ArgumentParser(prog='playbook2uml diff', description='Structural diff of two versions of a playbook', usage='''
+    %(prog)s [options] OLD NEW
+    %(prog)s [options] -f diagram OLD NEW
+    ''')
+    add_diagram_arguments(ap)
+    ap.add_argument('-f', '--format', type=str, choices=['list', 'diagram'], default='list', help='''
+        `list` writes the changed tasks, `diagram` writes the diagram of NEW with the changed states highlighted.
+        [default=list]
+        ''')
+    ap.add_argument('-o', '--output', type=str, default='-', help='The file to write the changes to.[default=- (STDOUT)]')
+    ap.add_argument('--from-graph', action='store_true', help='OLD and NEW are graph files written by `-t json` or `-t msgpack`')
+    ap.add_argument('OLD', type=str, help='The old playbook file')
+    ap.add_argument('NEW', type=str, help='The new playbook file')
+
+    option = ap.parse_args(args)
+    for path in (option.OLD, option.NEW):
+        if not os.path.isfile(path):
+            ap.error(f'{path} must be a file.')
+    if option.format == 'diagram' and option.type in umlstate.GRAPH_TYPES:
+        ap.error(f'-f diagram can not be used with --type {option.type}.')
+    option.role = ''
+    option.tasks_from = 'main'
+    option.BASE_DIR = None
+
+    return option
+
+def diff_main(args: list[str]) -> int:
+    '''main of `diff` sub command. The exit status is 1 when the playbooks differ'''
+    from argparse import Namespace
+    import playbook2uml.diff as umldiff
+    from playbook2uml.output import open_output, write_lines, is_gzip_path
+    option = parse_diff_args(args)
+
+    logger = umlLogger.getLogger(__name__, option.verbose)
+    umlLogger.setLoggerLevel(umldiff.logger, option.verbose)
+
+    # both playbooks are loaded with one Ansible environment
+    environment = None
+    if not option.from_graph and option.parser != 'fast':
+        from playbook2uml.umlstate.extract import AnsibleEnvironment
+        environment = AnsibleEnvironment()
+    books = []
+    for path in (option.OLD, option.NEW):
+        side_option = Namespace(**vars(option))
+        side_option.PLAYBOOK = path
+        books.append(umlstate.load(side_option, environment=environment))
+    old_book, new_book = books
+
+    changes = umldiff.diff_playbooks(old_book, new_book)
+    logger.info('%s changes', len(changes))
+    if option.format == 'diagram':
+        lines = umldiff.highlight(new_book.generate(), changes, option.type)
+    else:
+        lines = umldiff.format_changes(changes)
+    with open_output(option.output, compress=is_gzip_path(option.output)) as stream:
+        write_lines(lines, stream)
+
+    return 1 if changes else 0
+
+def parse_serve_args(args: list[str]):
+    ap = ArgumentParser(prog='playbook2uml serve', description='Render server keeping ansible-core loaded')
+    ap.add_argument('--host', type=str, default='127.0.0.1', help='The address to listen on.[default=127.0.0.1]')
+    ap.add_argument('-p', '--port', type=int, default=8080, help='The port to listen on.[default=8080]')
+    ap.add_argument('--socket', type=str, default=None, help='Listen on the Unix domain socket instead of TCP')
+    ap.add_argument('-w', '--workers', type=int, default=4, help='The number of worker threads.[default=4]')
+    ap.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for a diagram.[default=30]')
+    ap.add_argument('--queue-size', type=int, default=16, help='The number of requests waiting for a worker.[default=16]')
+    ap.add_argument('-v', '--verbose', action="count", default=0, help='''
+        Show information to STDERR.
+        -v  => INFO
+        -vv => DEBUG
+    ''')
+
+    option = ap.parse_args(args)
+    if option.workers < 1:
+        ap.error('--workers must be a positive number.')
+    if option.queue_size < 0:
+        ap.error('--queue-size must not be negative.')
+
+    return option
+
+def serve_main(args: list[str]) -> int:
+    '''main of `serve` sub command'''
+    import playbook2uml.server as server
+    option = parse_serve_args(args)
+
+    logger = umlLogger.getLogger(__name__, option.verbose)
+    umlLogger.setLoggerLevel(server.logger, option.verbose)
+
+    service = server.RenderService(workers=option.workers, timeout=option.timeout,
+                                   queue_size=option.queue_size, verbose=option.verbose)
+    httpd = server.create_server(service, host=option.host, port=option.port, socket_path=option.socket)
+    logger.warning('listening on %s', option.socket or "http://%s:%d" % httpd.server_address[:2])
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.shutdown()
+        if option.socket and os.path.exists(option.socket):
+            os.unlink(option.socket)
+
+    return 0
+
+SUB_COMMANDS = {
+    'batch': batch_main,
+    'diff': diff_main,
+    'serve': serve_main,
+}
+
 def main():
     '''main'''
+    if sub_command := SUB_COMMANDS.get(sys.argv[1] if len(sys.argv) > 1 else ''):
+        sys.exit(sub_command(sys.argv[2:]))
+
     option = parse_args(sys.argv[1:])
 
     logger = umlLogger.getLogger(__name__, option.verbose)
 
     logger.debug("START")
 
-    umlplaybook = umlstate.load(option)
-    for line in umlplaybook.generate():
-        print(line)
+    if option.watch:
+        from playbook2uml.batch import BatchJob
+        source = f'role:{option.role}' if option.role else option.PLAYBOOK
+        sys.exit(watch([BatchJob(source, option.output, option)], option))
+
+    if option.split:
+        import playbook2uml.split as split
+        umlLogger.setLoggerLevel(split.logger, option.verbose)
+        paths = split.write_split(umlstate.load(option), option.split, umlstate.FILE_EXTENSIONS[option.type],
+                                  split_roles=option.split_roles, compress=option.gzip, workers=option.jobs or None)
+        logger.info('wrote %s diagrams', len(paths))
+        logger.debug("END")
+        return
+
+    from playbook2uml.output import open_output, write_output, is_gzip_path
+    from playbook2uml.profiling import Profiler, NULL_PROFILER
+    profiler = NULL_PROFILER
+    if option.profile or option.profile_stats:
+        profiler = Profiler(cprofile=bool(option.profile_stats))
+
+    binary_mode = option.type in umlstate.BINARY_TYPES
+    with profiler, open_output(option.output, compress=option.gzip or is_gzip_path(option.output), binary_mode=binary_mode) as stream:
+        write_output(profiler.iterate('generate', umlstate.generate(option, profiler=profiler)), stream, binary_mode)
+
+    if option.profile:
+        profiler.write_report(option.profile)
+    if option.profile_stats:
+        profiler.dump_stats(option.profile_stats)
 
     logger.debug("END")
 
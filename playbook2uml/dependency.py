@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+'''
+Find the files a playbook or a role pulls in, without loading ansible-core.
+
+The YAML files are read directly and only the keywords which include other files
+are followed: `import_playbook`, `vars_files`, `roles`, `import_role`/`include_role`,
+`import_tasks`/`include_tasks` and the role dependencies in `meta/main.yml`.
+Paths which contain Jinja2 templates can not be resolved statically and are
+reported as unresolved.
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import Any, Iterable, NamedTuple, Optional
+import os
+import yaml
+from playbook2uml.logger import getLogger
+
+logger = getLogger(__name__)
+
+class _YAMLLoader(getattr(yaml, 'CSafeLoader', yaml.SafeLoader)):
+    '''
+    Safe YAML loader (libyaml when available) ignoring Ansible's custom tags like `!vault`
+    '''
+
+_YAMLLoader.add_multi_constructor('!', lambda loader, suffix, node: None)
+
+def load_yaml(path:str) -> Any:
+    '''
+    Load a YAML file without Ansible
+    '''
+    with open(path, 'rb') as f:
+        return yaml.load(f, Loader=_YAMLLoader)
+
+FQCN_PREFIXES = ('ansible.builtin.', 'ansible.legacy.')
+
+def short_action(name:str) -> str:
+    '''
+    Strip the `ansible.builtin.` or `ansible.legacy.` prefix from the action name
+    '''
+    for prefix in FQCN_PREFIXES:
+        if name.startswith(prefix):
+            return name[len(prefix):]
+    return name
+
+def is_template(value:str) -> bool:
+    return '{{' in value or '{%' in value
+
+def roles_search_dirs(base_dir:str) -> list[str]:
+    '''
+    Get the directories to look for roles: `BASE_DIR/roles`, `BASE_DIR` and `ANSIBLE_ROLES_PATH`
+    '''
+    dirs = [os.path.join(base_dir, 'roles'), base_dir]
+    for path in os.environ.get('ANSIBLE_ROLES_PATH', '').split(os.pathsep):
+        if path:
+            dirs.append(os.path.expanduser(path))
+    return dirs
+
+def find_role_dir(name:str, base_dir:str) -> Optional[str]:
+    '''
+    Find the directory of the role `name`. Returns `None` when not found.
+    '''
+    if os.sep in name or name.startswith('~'):
+        path = os.path.join(base_dir, os.path.expanduser(name))
+        return path if os.path.isdir(path) else None
+    for search_dir in roles_search_dirs(base_dir):
+        path = os.path.join(search_dir, name)
+        if os.path.isdir(path):
+            return path
+    return None
+
+def find_role_tasks_file(role_dir:str, tasks_from:str='main') -> Optional[str]:
+    '''
+    Find `ROLE_DIR/tasks/TASKS_FROM(.yml|.yaml)`. Returns `None` when not found.
+    '''
+    base = os.path.join(role_dir, 'tasks', tasks_from)
+    candidates = (base,) if os.path.splitext(tasks_from)[1] else (base + '.yml', base + '.yaml')
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return None
+
+class Dependencies(NamedTuple):
+    '''
+    The files pulled in by a playbook or a role.
+    '''
+    files: tuple[str, ...]
+    """
+    The existing files, in the order found. The playbook itself is the first one.
+    """
+    unresolved: tuple[str, ...]
+    """
+    The references which could not be resolved (templated or missing paths, collection roles)
+    """
+
+class DependencyCollector:
+    '''
+    Collect the files pulled in by playbooks and roles.
+
+    Example:
+        >>> collector = DependencyCollector()
+        >>> collector.add_playbook('site.yml')
+        >>> collector.result()
+    '''
+
+    def __init__(self) -> None:
+        self._files: dict[str, None] = {}
+        self._unresolved: dict[str, None] = {}
+        self._roles: set[str] = set()
+
+    def result(self) -> Dependencies:
+        return Dependencies(tuple(self._files), tuple(self._unresolved))
+
+    def _add_file(self, path:str) -> bool:
+        '''
+        Returns `False` when the file was already added (or does not exist)
+        '''
+        path = os.path.normpath(path)
+        if path in self._files:
+            return False
+        if not os.path.isfile(path):
+            self._unresolved.setdefault(f'file:{path}', None)
+            return False
+        self._files[path] = None
+        return True
+
+    def _load(self, path:str) -> Any:
+        try:
+            return load_yaml(path)
+        except (OSError, yaml.YAMLError) as e:
+            logger.warning('failed to read %s: %s', path, e)
+            return None
+
+    def _resolve(self, ref:str, search_dirs:Iterable[str]) -> Optional[str]:
+        if is_template(ref):
+            self._unresolved.setdefault(f'template:{ref}', None)
+            return None
+        for search_dir in search_dirs:
+            path = os.path.join(search_dir, ref)
+            if os.path.isfile(path):
+                return path
+        self._unresolved.setdefault(f'file:{ref}', None)
+        return None
+
+    def add_playbook(self, path:str) -> None:
+        if not self._add_file(path):
+            return
+        base_dir = os.path.dirname(path) or '.'
+        plays = self._load(path)
+        if not isinstance(plays, list):
+            return
+        for play in plays:
+            if not isinstance(play, dict):
+                continue
+            for key, value in play.items():
+                if short_action(key) in ('import_playbook', 'include') and isinstance(value, str):
+                    if target := self._resolve(value.split()[0], (base_dir,)):
+                        self.add_playbook(target)
+            self._add_vars_files(play.get('vars_files'), base_dir)
+            for role in play.get('roles') or ():
+                if isinstance(role, dict):
+                    role = role.get('role', role.get('name'))
+                if isinstance(role, str):
+                    self.add_role(role, base_dir)
+            for section in ('pre_tasks', 'tasks', 'post_tasks', 'handlers'):
+                self._walk_tasks(play.get(section), base_dir, (base_dir,))
+
+    def _add_vars_files(self, vars_files:Any, base_dir:str) -> None:
+        if not isinstance(vars_files, list):
+            return
+        for vars_file in vars_files:
+            # a list of files means "the first found"; depend on all of them
+            for candidate in (vars_file if isinstance(vars_file, list) else [vars_file]):
+                if isinstance(candidate, str) and (path := self._resolve(candidate, (base_dir,))):
+                    self._add_file(path)
+
+    def add_role(self, name:str, base_dir:str, tasks_from:str='main') -> None:
+        '''
+        Add all task files and `meta/main.yml` of the role.
+        `tasks_from` is only checked to exist, because all task files are added.
+        '''
+        if is_template(name):
+            self._unresolved.setdefault(f'role:{name}', None)
+            return
+        role_dir = find_role_dir(name, base_dir)
+        if role_dir is None:
+            self._unresolved.setdefault(f'role:{name}', None)
+            return
+        if find_role_tasks_file(role_dir, tasks_from) is None:
+            self._unresolved.setdefault(f'role:{name}/tasks/{tasks_from}', None)
+        role_dir = os.path.normpath(role_dir)
+        if role_dir in self._roles:
+            return
+        self._roles.add(role_dir)
+
+        for meta_file in ('main.yml', 'main.yaml'):
+            path = os.path.join(role_dir, 'meta', meta_file)
+            if os.path.isfile(path) and self._add_file(path):
+                meta = self._load(path)
+                if isinstance(meta, dict):
+                    for dependency in meta.get('dependencies') or ():
+                        if isinstance(dependency, dict):
+                            dependency = dependency.get('role', dependency.get('name'))
+                        if isinstance(dependency, str):
+                            self.add_role(dependency, base_dir)
+
+        tasks_dir = os.path.join(role_dir, 'tasks')
+        for dir_path, dir_names, file_names in os.walk(tasks_dir):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                if os.path.splitext(file_name)[1] in ('.yml', '.yaml'):
+                    self._add_tasks_file(os.path.join(dir_path, file_name), base_dir, (dir_path, tasks_dir))
+
+    def _add_tasks_file(self, path:str, base_dir:str, search_dirs:Iterable[str]) -> None:
+        if self._add_file(path):
+            self._walk_tasks(self._load(path), base_dir, (os.path.dirname(path), *search_dirs))
+
+    def _walk_tasks(self, tasks:Any, base_dir:str, search_dirs:tuple[str, ...]) -> None:
+        if not isinstance(tasks, list):
+            return
+        for task in tasks:
+            if not isinstance(task, dict):
+                continue
+            for section in ('block', 'rescue', 'always'):
+                self._walk_tasks(task.get(section), base_dir, search_dirs)
+            for key, value in task.items():
+                action = short_action(key)
+                if action in ('import_tasks', 'include_tasks', 'include'):
+                    if isinstance(value, dict):
+                        value = value.get('file', value.get('_raw_params'))
+                    if isinstance(value, str) and (path := self._resolve(value.strip(), search_dirs)):
+                        self._add_tasks_file(path, base_dir, search_dirs)
+                elif action in ('import_role', 'include_role') and isinstance(value, dict):
+                    if isinstance(name := value.get('name'), str):
+                        self.add_role(name, base_dir, str(value.get('tasks_from', 'main')))
+
+def collect_dependencies(playbook:str, role:str='', tasks_from:str='main', base_dir:Optional[str]=None) -> Dependencies:
+    '''
+    Collect the files pulled in by the playbook, or by the role when `role` is given.
+    '''
+    collector = DependencyCollector()
+    if role:
+        collector.add_role(role, base_dir or '.', tasks_from)
+    else:
+        collector.add_playbook(playbook)
+    return collector.result()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+'''
+Structural diff of two versions of a playbook.
+
+The states are matched by their identity instead of their `task_N` names, which shift
+whenever a task is inserted. The identity of a state is its path in the playbook
+(see `playbook2uml.umlstate.naming`): the play, the section (`pre_tasks`, `roles/ROLE`,
+`tasks`, `post_tasks`), the enclosing blocks (and their `always`/`rescue`) and the task
+name with its action, e.g.
+
+    site/tasks/block:install/rescue/report failure (debug)
+
+A state whose path appears several times in the same parent gets the number of the
+occurrence (` #2`, ` #3` ...), so inserting a task only changes the identities of the tasks
+with the same name and action after it, not of the whole playbook.
+
+The states which are not matched by their path are matched by their name and action
+(with the occurrence number) in a second pass, they are reported as moved.
+Both passes are dictionary lookups, the diff runs in linear time of the number of tasks.
+
+Example:
+    >>> changes = diff_playbooks(old_umlplaybook, new_umlplaybook)
+    >>> write_lines(format_changes(changes), sys.stdout)
+    + site/tasks/restart nginx (service)
+    ~ site/tasks/install (apt)
+        args: {'name': 'nginx'} -> {'name': 'nginx-full'}
+    - site/post_tasks/cleanup (file)
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import Any, Iterable, Iterator, NamedTuple, Optional
+from collections import Counter
+import re
+from playbook2uml.logger import getLogger
+from playbook2uml.umlstate.naming import occurrence, state_key, walk_paths
+
+logger = getLogger(__name__)
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+MOVED = 'moved'
+
+MARKS = {ADDED: '+', REMOVED: '-', CHANGED: '~', MOVED: '>'}
+
+COLORS = {ADDED: 'palegreen', CHANGED: 'khaki', MOVED: 'lightblue', REMOVED: 'lightpink'}
+"""
+The colors of the changed states in the highlighted diagram
+"""
+
+class StateEntry(NamedTuple):
+    '''
+    A task (or a summary state) of a playbook with its identity
+    '''
+    path: str
+    """
+    The path of the state in the playbook, the identity in the first pass
+    """
+    key: str
+    """
+    The name and the action (with the occurrence number in the playbook), the identity in the second pass
+    """
+    state: Any
+    """
+    The state, `UMLStateTaskBase` or `UMLStateSummaryBase`
+    """
+
+class Change(NamedTuple):
+    '''
+    A changed state
+    '''
+    kind: str
+    """
+    `added`, `removed`, `changed` or `moved`
+    """
+    path: str
+    """
+    The path of the state, in the old playbook for `removed`
+    """
+    name: str
+    """
+    The name of the state in the diagram of the new playbook (of the old one for `removed`)
+    """
+    old_path: Optional[str] = None
+    """
+    The path in the old playbook of a `moved` state
+    """
+    fields: tuple[tuple[str, Any, Any], ...] = ()
+    """
+    The changed attributes: the name, the old value and the new value
+    """
+
+def walk_states(umlplaybook) -> Iterator[StateEntry]:
+    '''
+    Walk the tasks and the summary states of the playbook in the order of the diagram
+    '''
+    keys: Counter[str] = Counter()
+    for path, state in walk_paths(umlplaybook.plays):
+        if hasattr(state, 'play') or hasattr(state, 'block'):
+            continue
+        yield StateEntry(path, occurrence(keys, state_key(state)), state)
+
+def _content(state) -> dict[str, Any]:
+    task = getattr(state, 'task', None)
+    if task is not None:
+        return task.to_dict()
+    return {'label': state.label, 'task_count': state.task_count}
+
+def _changed_fields(old_state, new_state) -> tuple[tuple[str, Any, Any], ...]:
+    old = _content(old_state)
+    new = _content(new_state)
+    return tuple((key, old.get(key), new.get(key)) for key in new if old.get(key) != new.get(key))
+
+def diff_playbooks(old, new) -> list[Change]:
+    '''
+    Get the changes from the old playbook to the new one (`UMLStatePlaybookBase`).
+    The changes are in the order of the new diagram, followed by the removed states.
+    '''
+    old_entries = {entry.path: entry for entry in walk_states(old)}
+    unmatched: dict[str, StateEntry] = {}
+    changes: list[Optional[Change]] = []
+    pending: list[tuple[int, StateEntry]] = []
+    for entry in walk_states(new):
+        old_entry = old_entries.pop(entry.path, None)
+        if old_entry is None:
+            pending.append((len(changes), entry))
+            changes.append(None)
+            continue
+        if fields := _changed_fields(old_entry.state, entry.state):
+            changes.append(Change(CHANGED, entry.path, entry.state.name, fields=fields))
+
+    # the second pass: the states not matched by the path are matched by the name and the action
+    moved_from = {entry.key: entry for entry in old_entries.values()}
+    for index, entry in pending:
+        old_entry = moved_from.pop(entry.key, None)
+        if old_entry is None:
+            changes[index] = Change(ADDED, entry.path, entry.state.name)
+        else:
+            del old_entries[old_entry.path]
+            changes[index] = Change(MOVED, entry.path, entry.state.name, old_path=old_entry.path,
+                                    fields=_changed_fields(old_entry.state, entry.state))
+    result = [change for change in changes if change is not None]
+    result.extend(Change(REMOVED, entry.path, entry.state.name) for entry in old_entries.values())
+    logger.info('%s', ', '.join('%d %s' % (sum(1 for change in result if change.kind == kind), kind) for kind in MARKS))
+    return result
+
+def format_changes(changes:Iterable[Change]) -> Iterator[str]:
+    '''
+    Generate the change list, one line per state followed by the changed attributes
+    '''
+    for change in changes:
+        if change.kind == MOVED:
+            yield '%s %s <- %s' % (MARKS[change.kind], change.path, change.old_path)
+        else:
+            yield '%s %s' % (MARKS[change.kind], change.path)
+        for key, old_value, new_value in change.fields:
+            yield '    %s: %r -> %r' % (key, old_value, new_value)
+
+_PLANTUML_STATE = re.compile(r'^(\s*state ".*" as (\w+))( \{)?$')
+
+def highlight(lines:Iterable[str], changes:list[Change], diagram_type:str) -> Iterator[str]:
+    '''
+    Highlight the changed states in the diagram lines of the new playbook.
+    The removed states are listed in a note (PlantUML) or a state (Mermaid.js).
+    '''
+    colors = {change.name: COLORS[change.kind] for change in changes if change.kind != REMOVED}
+    removed = [change.path for change in changes if change.kind == REMOVED]
+    if diagram_type == 'plantuml':
+        for line in lines:
+            if line == '@enduml':
+                yield from _plantuml_legend(changes, removed)
+            elif (m := _PLANTUML_STATE.match(line)) and m.group(2) in colors:
+                line = '%s #%s%s' % (m.group(1), colors[m.group(2)], m.group(3) or '')
+            yield line
+        return
+
+    yield from lines
+    indent = '    '
+    for kind in (ADDED, CHANGED, MOVED, REMOVED):
+        yield '%sclassDef %s fill:%s' % (indent, kind, COLORS[kind])
+    for kind in (ADDED, CHANGED, MOVED):
+        names = [change.name for change in changes if change.kind == kind]
+        if names:
+            yield '%sclass %s %s' % (indent, ', '.join(names), kind)
+    if removed:
+        yield '%sstate "Removed<hr>%s" as diff_removed' % (indent, '<br>'.join(removed))
+        yield '%sclass diff_removed %s' % (indent, REMOVED)
+
+def _plantuml_legend(changes:list[Change], removed:list[str]) -> Iterator[str]:
+    if removed:
+        yield 'note as diff_removed #%s' % COLORS[REMOVED]
+        yield '    === Removed'
+        for path in removed:
+            yield '    - %s' % path
+        yield 'end note'
+    yield 'legend right'
+    for kind in (ADDED, CHANGED, MOVED, REMOVED):
+        yield '    <back:%s> %s </back> %d' % (COLORS[kind], kind, sum(1 for change in changes if change.kind == kind))
+    yield 'endlegend'
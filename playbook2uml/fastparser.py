@@ -0,0 +1,495 @@
+# -*- coding: utf-8 -*-
+'''
+Fast front end reading playbooks directly, without Ansible's object model.
+
+The YAML is loaded with the libyaml C loader (when available) into small
+`FastPlay`/`FastBlock`/`FastTask` nodes. They have the attributes of Ansible's
+`Play`/`Block`/`Task` which the diagram generators read, so they feed the same
+`UMLStatePlay`/`UMLStateBlock`/`UMLStateTask` classes.
+
+Only what the diagrams need is handled: task names, actions and arguments,
+`when`, loops, `until`/`retries`/`delay`, `become`/`register`/`delegate_to`,
+blocks, `import_playbook`, `import_tasks` and roles (`roles`, `import_role`).
+Dynamic includes (`include_tasks`, `include_role`) are kept as tasks, as Ansible does,
+unless they are expanded by `playbook2uml.includes`.
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import Any, Callable, Iterator, NamedTuple, Optional
+from contextlib import contextmanager
+from functools import partial
+import os
+from playbook2uml.dependency import (
+    load_yaml,
+    short_action,
+    is_template,
+    find_role_dir,
+    find_role_tasks_file,
+)
+from playbook2uml.logger import getLogger
+
+logger = getLogger(__name__)
+
+TASK_KEYWORDS = frozenset((
+    'action', 'any_errors_fatal', 'args', 'async', 'become', 'become_exe', 'become_flags',
+    'become_method', 'become_user', 'changed_when', 'check_mode', 'collections', 'connection',
+    'debugger', 'delay', 'delegate_facts', 'delegate_to', 'diff', 'environment', 'failed_when',
+    'ignore_errors', 'ignore_unreachable', 'listen', 'local_action', 'loop', 'loop_control',
+    'module_defaults', 'name', 'no_log', 'notify', 'poll', 'port', 'register', 'remote_user',
+    'retries', 'run_once', 'tags', 'throttle', 'timeout', 'until', 'vars', 'when',
+))
+"""
+The keywords of a task, any other key is the action
+"""
+
+FREEFORM_ACTIONS = frozenset(('command', 'raw', 'script', 'shell', 'win_command', 'win_shell'))
+"""
+The actions whose `k=v` string arguments are free-form, except `RAW_PARAM_OPTIONS`
+"""
+
+RAW_PARAM_OPTIONS = frozenset(('creates', 'removes', 'chdir', 'executable', 'warn', 'stdin',
+                               'stdin_add_newline', 'strip_empty_ends'))
+
+INCLUDE_TASKS_ACTIONS = frozenset(('include_tasks', 'import_tasks'))
+
+INHERITED_ATTRIBUTES = ('become', 'become_user', 'delegate_to')
+"""
+The attributes of the tasks which are inherited from the play, blocks, roles and imports.
+`when` is inherited too, the conditions of the parents are prepended.
+"""
+
+DEFAULT_DELAY = 5
+
+class FastParserError(ValueError):
+    '''
+    The playbook can not be read by the fast parser
+    '''
+
+class FastNode:
+    '''
+    Base class of the nodes of the fast parser
+    '''
+
+class FastTask(FastNode):
+    '''
+    A task, with the attributes of Ansible's `Task` used by the diagrams
+    '''
+    implicit = False
+
+    def __init__(self, name:str, action:str, args:dict, role_name:Optional[str]=None) -> None:
+        self.name = name
+        self.action = action
+        self.args = args
+        self.role_name = role_name
+        self.when: Any = []
+        self.loop: Any = None
+        self.loop_with: Optional[str] = None
+        self.until: Any = []
+        self.retries: Any = None
+        self.delay: Any = DEFAULT_DELAY
+        self.become: Any = None
+        self.become_user: Any = None
+        self.register: Any = None
+        self.delegate_to: Any = None
+        self.search_path: tuple[str, ...] = ()
+        self.included_from: tuple[str, ...] = ()
+        """
+        The files (and roles) included by `playbook2uml.includes` around the task
+        """
+
+    def get_search_path(self) -> list[str]:
+        return list(self.search_path)
+
+    def get_name(self) -> str:
+        if short_action(self.action) == 'include_role':
+            return self.name or '%s : %s' % (self.action, self.args.get('name'))
+        name = self.name or self.action
+        if self.role_name:
+            return '%s : %s' % (self.role_name, name)
+        return name
+
+class FastBlock(FastNode):
+    '''
+    A block, with the attributes of Ansible's `Block` used by the diagrams.
+    Implicit blocks (like the tasks of an imported file) have no name.
+    '''
+    def __init__(self, name:str='', block:Optional[list]=None, rescue:Optional[list]=None, always:Optional[list]=None) -> None:
+        self.name = name
+        self.block = block or []
+        self.rescue = rescue or []
+        self.always = always or []
+
+class FastRole:
+    '''
+    A role listed in the `roles` keyword of a play.
+    The task files are read when the blocks are first asked for, so a role
+    whose states are cached (see `playbook2uml.umlstate.rolecache`) is not read.
+    '''
+    from_include = False
+
+    def __init__(self, name:str, path:str, load_blocks:Callable[[], list[FastBlock]],
+                 tasks_from:str='main', inherited:tuple=()) -> None:
+        self.name = name
+        self.path = path
+        self.tasks_from = tasks_from
+        self.inherited = inherited
+        """
+        The conditions and the attributes the tasks inherit, see `Scope`
+        """
+        self._load_blocks = load_blocks
+        self._blocks: Optional[list[FastBlock]] = None
+
+    def get_name(self) -> str:
+        return self.name
+
+    def get_role_path(self) -> str:
+        return self.path
+
+    def get_task_blocks(self) -> list[FastBlock]:
+        if self._blocks is None:
+            self._blocks = self._load_blocks()
+        return self._blocks[:]
+
+class FastPlay(FastNode):
+    '''
+    A play, with the attributes of Ansible's `Play` used by the diagrams
+    '''
+    def __init__(self, ds:dict) -> None:
+        self._ds = ds
+        self.name = ds.get('name') or ''
+        self.hosts = ds.get('hosts')
+        self.strategy = ds.get('strategy')
+        self.serial = ds.get('serial')
+        self.gather_facts = ds.get('gather_facts')
+        self.vars_files = ds.get('vars_files') or []
+        self.vars_prompt = ds.get('vars_prompt') or []
+        self.pre_tasks: list = []
+        self.roles: list[FastRole] = []
+        self.tasks: list = []
+        self.post_tasks: list = []
+
+    def get_name(self) -> str:
+        if self.name:
+            return self.name
+        if isinstance(self.hosts, list):
+            return ','.join(self.hosts)
+        return self.hosts or ''
+
+def split_args(args:str) -> list[str]:
+    '''
+    Split the `k=v` string on white spaces, keeping quoted strings and Jinja2 blocks.
+    A simplified version of `ansible.parsing.splitter.split_args`.
+    '''
+    tokens = []
+    token = ''
+    quote = None
+    depth = 0
+    i = 0
+    while i < len(args):
+        c = args[i]
+        pair = args[i:i+2]
+        if quote:
+            if c == quote and args[i-1] != '\\':
+                quote = None
+        elif pair in ('{{', '{%', '{#'):
+            depth += 1
+            token += pair
+            i += 2
+            continue
+        elif pair in ('}}', '%}', '#}') and depth:
+            depth -= 1
+            token += pair
+            i += 2
+            continue
+        elif c in ('"', "'") and not depth:
+            quote = c
+        elif c.isspace() and not depth:
+            if token:
+                tokens.append(token)
+                token = ''
+            i += 1
+            continue
+        token += c
+        i += 1
+    if token:
+        tokens.append(token)
+    return tokens
+
+def unquote(value:str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in ('"', "'"):
+        return value[1:-1]
+    return value
+
+def parse_kv(args:str, check_raw:bool=False) -> dict:
+    '''
+    Convert `k=v` string arguments to a dict, the free-form part goes to `_raw_params`
+    '''
+    options = {}
+    raw_params = []
+    for token in split_args(args):
+        key, sep, value = token.partition('=')
+        if not sep or (check_raw and key not in RAW_PARAM_OPTIONS):
+            raw_params.append(token)
+        else:
+            options[key.strip()] = unquote(value.strip())
+    if raw_params:
+        options['_raw_params'] = ' '.join(raw_params)
+    return options
+
+class Scope(NamedTuple):
+    '''
+    Where the tasks are loaded, and the attributes they inherit
+    '''
+    base_dir: str
+    """
+    The directory of the playbook, to look for roles
+    """
+    tasks_dir: str
+    """
+    The directory to look for the files of `import_tasks`
+    """
+    role_name: Optional[str] = None
+    when: tuple = ()
+    """
+    The conditions of the parents, prepended to the conditions of the tasks
+    """
+    attributes: tuple[tuple[str, Any], ...] = ()
+    """
+    The `INHERITED_ATTRIBUTES` set by the parents
+    """
+    included_from: tuple[str, ...] = ()
+    """
+    The files (and roles) included by `playbook2uml.includes` around the tasks
+    """
+
+    def inherit(self, ds:dict, **kwargs) -> Scope:
+        '''
+        Get the scope of the children of the play, block, role or import in `ds`
+        '''
+        when = self.when
+        if 'when' in ds:
+            when += tuple(ds['when']) if isinstance(ds['when'], list) else (ds['when'],)
+        attributes = dict(self.attributes)
+        attributes.update((key, ds[key]) for key in INHERITED_ATTRIBUTES if key in ds)
+        return self._replace(when=when, attributes=tuple(attributes.items()), **kwargs)
+
+class FastPlaybookParser:
+    '''
+    Read playbooks and roles into `FastPlay` nodes.
+
+    The parsed task files are cached by path, so a role used by many plays is read once.
+    '''
+    def __init__(self) -> None:
+        self._yaml_cache: dict[str, Any] = {}
+        self._recorders: list[dict[str, None]] = []
+
+    @contextmanager
+    def record_files(self) -> Iterator[dict[str, None]]:
+        '''
+        Record the files read (or taken from the cache) in the `with` block
+        '''
+        files: dict[str, None] = {}
+        self._recorders.append(files)
+        try:
+            yield files
+        finally:
+            self._recorders.remove(files)
+
+    def _load(self, path:str) -> Any:
+        path = os.path.normpath(path)
+        for files in self._recorders:
+            files.setdefault(path, None)
+        if path not in self._yaml_cache:
+            logger.debug('load %s', path)
+            try:
+                self._yaml_cache[path] = load_yaml(path)
+            except OSError as e:
+                raise FastParserError(f'failed to read {path}: {e}') from e
+        return self._yaml_cache[path]
+
+    def load_playbook(self, path:str) -> list[FastPlay]:
+        ds = self._load(path)
+        if not isinstance(ds, list) or not ds:
+            raise FastParserError(f'A playbook must be a list of plays: {path}')
+        base_dir = os.path.dirname(path) or '.'
+        plays = []
+        for entry in ds:
+            if not isinstance(entry, dict):
+                raise FastParserError(f'playbook entries must be either valid plays or \'import_playbook\' statements: {path}')
+            imported = [value for key, value in entry.items() if short_action(key) == 'import_playbook']
+            if imported:
+                target = str(imported[0]).split()[0]
+                if is_template(target):
+                    raise FastParserError(f'can not import the templated playbook: {target}')
+                plays.extend(self.load_playbook(os.path.join(base_dir, target)))
+            else:
+                plays.append(self.load_play(entry, base_dir))
+        return plays
+
+    def load_play(self, ds:dict, base_dir:str) -> FastPlay:
+        play = FastPlay(ds)
+        scope = Scope(base_dir, base_dir).inherit(ds)
+        play.pre_tasks = self.load_tasks(ds.get('pre_tasks'), scope)
+        for role in ds.get('roles') or ():
+            role_ds = role if isinstance(role, dict) else {}
+            name = str(role_ds.get('role', role_ds.get('name')) if role_ds else role)
+            role_scope = scope.inherit(role_ds)
+            play.roles.append(FastRole(name, self.find_role(name, base_dir),
+                                       partial(self.load_role, name, role_scope, with_dependencies=False),
+                                       inherited=(role_scope.when, role_scope.attributes)))
+        play.tasks = self.load_tasks(ds.get('tasks'), scope)
+        play.post_tasks = self.load_tasks(ds.get('post_tasks'), scope)
+        return play
+
+    def load_role_play(self, role:str, tasks_from:str, base_dir:str) -> FastPlay:
+        '''
+        Load a dummy play which imports the role only
+        '''
+        return self.load_play({
+            'hosts': 'all',
+            'tasks': [{'import_role': {'name': role, 'tasks_from': tasks_from}}],
+        }, base_dir)
+
+    def find_role(self, name:str, base_dir:str) -> str:
+        '''
+        Get the directory of the role
+        '''
+        if is_template(name):
+            raise FastParserError(f'can not load the templated role: {name}')
+        role_dir = find_role_dir(name, base_dir)
+        if role_dir is None:
+            raise FastParserError(f'the role \'{name}\' was not found')
+        return role_dir
+
+    def load_role(self, name:str, scope:Scope, tasks_from:str='main', with_dependencies:bool=True) -> list[FastBlock]:
+        '''
+        Load the blocks of the role. With `with_dependencies`, the blocks of the roles in
+        `meta/main.yml` come first, as `import_role` does.
+        '''
+        role_dir = self.find_role(name, scope.base_dir)
+        blocks = []
+        if with_dependencies:
+            for meta_file in ('main.yml', 'main.yaml'):
+                meta_path = os.path.join(role_dir, 'meta', meta_file)
+                if not os.path.isfile(meta_path):
+                    continue
+                meta = self._load(meta_path)
+                for dependency in (meta.get('dependencies') or ()) if isinstance(meta, dict) else ():
+                    dependency_ds = dependency if isinstance(dependency, dict) else {}
+                    dependency_name = str(dependency_ds.get('role', dependency_ds.get('name')) if dependency_ds else dependency)
+                    blocks.extend(self.load_role(dependency_name, scope.inherit(dependency_ds)))
+                break
+
+        tasks_file = find_role_tasks_file(role_dir, tasks_from)
+        if tasks_file is None:
+            if tasks_from != 'main':
+                raise FastParserError(f'the tasks file \'{tasks_from}\' was not found in the role \'{name}\'')
+            return blocks
+        role_scope = scope._replace(tasks_dir=os.path.dirname(tasks_file), role_name=os.path.basename(os.path.normpath(name)))
+        blocks.append(FastBlock(block=self.load_tasks(self._load(tasks_file), role_scope)))
+        return blocks
+
+    def load_tasks(self, ds:Any, scope:Scope) -> list:
+        '''
+        Load a list of tasks and blocks.
+        '''
+        if ds is None:
+            return []
+        if not isinstance(ds, list):
+            raise FastParserError(f'A list of tasks is expected, got {type(ds).__name__}')
+        return list(self._load_tasks(ds, scope))
+
+    def _load_tasks(self, ds:list, scope:Scope) -> Iterator[FastNode]:
+        for entry in ds:
+            if not isinstance(entry, dict):
+                raise FastParserError(f'A task must be a dict, got {type(entry).__name__}')
+            if 'block' in entry:
+                block_scope = scope.inherit(entry)
+                yield FastBlock(
+                    name=entry.get('name') or '',
+                    block=self.load_tasks(entry.get('block'), block_scope),
+                    rescue=self.load_tasks(entry.get('rescue'), block_scope),
+                    always=self.load_tasks(entry.get('always'), block_scope),
+                )
+                continue
+
+            task = self.load_task(entry, scope)
+            action = short_action(task.action)
+            if action == 'import_tasks':
+                target = task.args.get('_raw_params', '')
+                if is_template(target):
+                    raise FastParserError(f'can not import the templated file: {target}')
+                path = os.path.join(scope.tasks_dir, target)
+                yield FastBlock(block=self.load_tasks(self._load(path), scope.inherit(entry, tasks_dir=os.path.dirname(path))))
+            elif action == 'import_role':
+                yield FastBlock(block=self.load_role(str(task.args.get('name')), scope.inherit(entry),
+                                                     str(task.args.get('tasks_from', 'main'))))
+            else:
+                yield task
+
+    def load_task(self, ds:dict, scope:Scope) -> FastTask:
+        action, args, delegate_to = self._parse_action(ds)
+        task = FastTask(ds.get('name') or '', action, args, scope.role_name)
+        for attr, value in scope.attributes:
+            setattr(task, attr, value)
+        if delegate_to is not None:
+            task.delegate_to = delegate_to
+        task.search_path = (scope.tasks_dir,)
+        task.included_from = scope.included_from
+        task.when = list(scope.inherit(ds).when)
+        if 'loop' in ds:
+            task.loop = ds['loop']
+        else:
+            for key, value in ds.items():
+                if key.startswith('with_'):
+                    task.loop = value
+                    task.loop_with = key[len('with_'):]
+                    break
+        for attr in ('until', 'retries', 'delay', 'register', *INHERITED_ATTRIBUTES):
+            if attr in ds:
+                setattr(task, attr, ds[attr])
+        return task
+
+    def _parse_action(self, ds:dict) -> tuple[str, dict, Optional[str]]:
+        '''
+        Get the action, its arguments and the implicit `delegate_to` (of `local_action`)
+        '''
+        delegate_to = None
+        value: Any = None
+        action = None
+        for key in ('action', 'local_action'):
+            if key in ds:
+                value = ds[key]
+                if key == 'local_action':
+                    delegate_to = 'localhost'
+                if isinstance(value, dict):
+                    value = dict(value)
+                    action = value.pop('module', None)
+                else:
+                    action, _, value = str(value).strip().partition(' ')
+                break
+        else:
+            for key in ds:
+                if key not in TASK_KEYWORDS and not key.startswith('with_'):
+                    action, value = key, ds[key]
+                    break
+        if not action:
+            raise FastParserError(f'no module/action detected in task: {ds}')
+
+        short = short_action(action)
+        args = dict(ds['args']) if isinstance(ds.get('args'), dict) else {}
+        if isinstance(value, dict):
+            args.update(value)
+            if short in INCLUDE_TASKS_ACTIONS and 'file' in args:
+                args['_raw_params'] = args.pop('file')
+        elif value is not None and value != '':
+            args.update(parse_kv(str(value), check_raw=short in FREEFORM_ACTIONS or short in INCLUDE_TASKS_ACTIONS))
+        return action, args, delegate_to
+
+def load_plays(playbook:str, option, parser:Optional[FastPlaybookParser]=None) -> list[FastPlay]:
+    '''
+    Load the plays of the playbook, or the dummy play of `option.role`
+    '''
+    parser = parser or FastPlaybookParser()
+    if option.role:
+        return [parser.load_role_play(option.role, option.tasks_from, option.BASE_DIR or '.')]
+    return parser.load_playbook(playbook)
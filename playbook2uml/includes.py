@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+'''
+Static resolution of the dynamic includes (`include_tasks`, `include_role`).
+
+Ansible resolves the includes when the play runs, so the parsed playbook has one task
+per include and the diagram misses the included tasks. With `--resolve-includes`, an include
+whose target is literal (not a Jinja2 template) is expanded into a block of the included tasks,
+read by `playbook2uml.fastparser` (not by Ansible's object model).
+The targets are found like Ansible does: in `tasks/` of the role and in the directory
+of the including file, then in the directory of the playbook.
+
+- The included files are parsed once per rendering, however many times they are included
+- The includes nested deeper than `max_depth` are kept as tasks
+- An include of a file (or a role) which is already being included is a cycle and is kept as a task
+- The templated, missing and unreadable targets are kept as tasks
+
+Example:
+    >>> resolver = IncludeResolver('path/to/project', max_depth=5)
+    >>> resolver.resolve(task)
+    <FastBlock ...>
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import Any, Optional
+from collections import Counter
+import os
+from playbook2uml.dependency import short_action, is_template, find_role_dir, find_role_tasks_file
+from playbook2uml.fastparser import (
+    FastBlock,
+    FastParserError,
+    FastPlaybookParser,
+    INHERITED_ATTRIBUTES,
+    Scope,
+)
+from playbook2uml.logger import getLogger
+
+logger = getLogger(__name__)
+
+INCLUDE_ACTIONS = frozenset(('include_tasks', 'include_role'))
+
+DEFAULT_INCLUDE_DEPTH = 5
+
+class IncludeResolver:
+    '''
+    Expand the includes with literal targets into blocks.
+
+    Args:
+        base_dir (str): The directory of the playbook (or `--base-dir` of the role mode), to look for roles
+        max_depth (int): The number of nested includes expanded
+        parser (FastPlaybookParser, optional): The parser reading the included files,
+            shared with the fast parser of the playbook
+    '''
+
+    def __init__(self, base_dir:str, max_depth:int=DEFAULT_INCLUDE_DEPTH, parser:Optional[FastPlaybookParser]=None) -> None:
+        self.base_dir = base_dir or '.'
+        self.max_depth = max_depth
+        self.parser = parser or FastPlaybookParser()
+        self.stats: Counter[str] = Counter()
+        """
+        `resolved`, `dynamic` (templated target), `missing`, `cycles` and `too_deep`
+        """
+        self._paths: dict[tuple[tuple[str, ...], str], Optional[str]] = {}
+
+    def resolve(self, task) -> Optional[FastBlock]:
+        '''
+        Get the block of the tasks included by the task (Ansible's `Task` or `FastTask`),
+        `None` when the task is not an include or the include can not be resolved.
+        '''
+        action = short_action(task.action)
+        if action not in INCLUDE_ACTIONS:
+            return None
+        chain = getattr(task, 'included_from', ())
+        if len(chain) >= self.max_depth:
+            logger.debug('too deep: %s', task.get_name())
+            self.stats['too_deep'] += 1
+            return None
+        try:
+            if action == 'include_tasks':
+                block = self._include_tasks(task, chain)
+            else:
+                block = self._include_role(task, chain)
+        except FastParserError as e:
+            logger.warning('can not resolve %s: %s', task.get_name(), e)
+            self.stats['missing'] += 1
+            return None
+        if block is not None:
+            self.stats['resolved'] += 1
+        return block
+
+    def _scope(self, task, tasks_dir:str, included_from:tuple[str, ...]) -> Scope:
+        role_name = getattr(task, 'role_name', None)
+        if role_name is None and (role := getattr(task, '_role', None)) is not None:
+            role_name = str(role.get_name())
+        # Ansible's unset attributes are None, False or a sentinel
+        attributes = tuple((key, value) for key in INHERITED_ATTRIBUTES
+                           if isinstance(value := getattr(task, key, None), str) or value is True)
+        when = task.when if isinstance(task.when, list) else ()
+        return Scope(self.base_dir, tasks_dir, role_name, tuple(when), attributes, included_from)
+
+    def _target(self, task, value:Any) -> Optional[str]:
+        if not isinstance(value, str) or not value:
+            self.stats['missing'] += 1
+            return None
+        if is_template(value):
+            logger.debug('dynamic: %s', value)
+            self.stats['dynamic'] += 1
+            return None
+        return value
+
+    def _block(self, task, target:str, tasks:list) -> FastBlock:
+        return FastBlock(name=str(task.name or '') or '%s: %s' % (short_action(task.action), target), block=tasks)
+
+    def _include_tasks(self, task, chain:tuple[str, ...]) -> Optional[FastBlock]:
+        args = task.args
+        target = self._target(task, args.get('_raw_params', args.get('file')))
+        if target is None:
+            return None
+        path = self.find_tasks_file(tuple(task.get_search_path()), target)
+        if path is None:
+            logger.warning('the included file was not found: %s', target)
+            self.stats['missing'] += 1
+            return None
+        if path in chain:
+            logger.warning('include cycle: %s', ' -> '.join((*chain, path)))
+            self.stats['cycles'] += 1
+            return None
+        scope = self._scope(task, os.path.dirname(path), chain + (path,))
+        return self._block(task, target, self.parser.load_tasks(self.parser._load(path), scope))
+
+    def _include_role(self, task, chain:tuple[str, ...]) -> Optional[FastBlock]:
+        args = task.args
+        name = self._target(task, args.get('name', args.get('role')))
+        if name is None:
+            return None
+        tasks_from = str(args.get('tasks_from', 'main'))
+        role_dir = find_role_dir(name, self.base_dir)
+        if role_dir is None or find_role_tasks_file(role_dir, tasks_from) is None:
+            logger.warning('the included role was not found: %s', name)
+            self.stats['missing'] += 1
+            return None
+        key = os.path.join(os.path.normpath(role_dir), 'tasks', tasks_from)
+        if key in chain:
+            logger.warning('include cycle: %s', ' -> '.join((*chain, key)))
+            self.stats['cycles'] += 1
+            return None
+        scope = self._scope(task, self.base_dir, chain + (key,))
+        return self._block(task, name, self.parser.load_role(name, scope, tasks_from))
+
+    def find_tasks_file(self, search_path:tuple[str, ...], target:str) -> Optional[str]:
+        '''
+        Find the included file in `tasks/` and in each directory of the search path,
+        then in the directory of the playbook. The results are memoized.
+        '''
+        key = (search_path, target)
+        if key in self._paths:
+            return self._paths[key]
+        path = None
+        target = os.path.expanduser(target)
+        for directory in (*search_path, self.base_dir):
+            for candidate in (os.path.join(directory, 'tasks', target), os.path.join(directory, target)):
+                if os.path.isfile(candidate):
+                    path = os.path.normpath(candidate)
+                    break
+            if path:
+                break
+        self._paths[key] = path
+        return path
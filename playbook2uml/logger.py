@@ -13,10 +13,27 @@ cyan    = '\033[36m'
 white   = '\033[37m'
 reset   = '\033[0m'
 
+class _StreamHandler(logging.StreamHandler):
+    '''
+    The handler added by `getLogger`, to tell it from the handlers added by others
+    '''
+
 def getLogger(name: str, verbose: int = 0) -> logging.Logger:
+    '''
+    Get the logger writing to STDERR with the level of `verbose`.
+
+    The handler is added only once per logger, so calling this again (e.g. for
+    every job of a batch or a long-running process) only changes the level.
+
+    Pass the values of the messages as arguments (`logger.debug('start %s', self)`),
+    not in f-strings, so that nothing is formatted when the level is disabled.
+    '''
     logger = logging.getLogger(name)
     setLoggerLevel(logger, verbose)
 
+    if any(isinstance(handler, _StreamHandler) for handler in logger.handlers):
+        return logger
+
     if sys.stderr.isatty():
         format = f'{yellow}%(filename)s:%(lineno)d{reset}:{cyan}[%(name)s.%(funcName)s]{reset} %(message)s'
     else:
@@ -24,7 +41,7 @@ def getLogger(name: str, verbose: int = 0) -> logging.Logger:
 
     formatter = logging.Formatter(format)
 
-    handler = logging.StreamHandler()
+    handler = _StreamHandler()
     handler.setLevel(logging.DEBUG)
     handler.setFormatter(formatter)
 
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+'''
+Buffered output of the generated diagram lines.
+
+The lines are joined in bounded chunks and written through one buffered stream,
+instead of one `print()` (and one write call) per line. Memory stays flat,
+the whole diagram is never joined into one string.
+
+A file is written to a temporary file in the same directory, which replaces the file
+only when the whole diagram was written: an error while loading or generating the
+playbook keeps the previous diagram.
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import IO, Iterable, Iterator, Optional
+from contextlib import contextmanager
+from itertools import islice
+import gzip
+import io
+import os
+import sys
+
+BUFFER_SIZE = 256 * 1024
+"""
+The size of the write buffer in bytes
+"""
+
+CHUNK_LINES = 1024
+"""
+The number of lines joined into one write
+"""
+
+def is_gzip_path(path:Optional[str]) -> bool:
+    return bool(path) and path.endswith('.gz')
+
+def _open_temp(path:str) -> tuple[int, str]:
+    '''
+    Create a temporary file next to `path`. The umask applies to its mode, as to a file created by `open()`
+    '''
+    directory, name = os.path.split(path)
+    while True:
+        tmp_path = os.path.join(directory, '.%s.%s.tmp' % (name, os.urandom(4).hex()))
+        try:
+            return os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666), tmp_path
+        except FileExistsError:
+            continue
+
+@contextmanager
+def open_output(path:Optional[str]=None, compress:bool=False, binary_mode:bool=False) -> Iterator[IO]:
+    '''
+    Open the output text stream.
+
+    Args:
+        path (str, optional): The output file. `None` or `-` writes to STDOUT.
+            The file is replaced when the block exits without an exception.
+        compress (bool): Write gzip compressed data.
+            The gzip header has no file name and time stamp, so the same
+            diagram always produces the same bytes.
+        binary_mode (bool): Open a binary stream instead, see `write_bytes`
+    '''
+    to_stdout = path is None or path == '-'
+    tmp_path = None
+    if to_stdout:
+        sys.stdout.flush()
+        binary = sys.stdout.buffer
+    else:
+        fd, tmp_path = _open_temp(path)
+        binary = open(fd, 'wb', buffering=BUFFER_SIZE)
+
+    gzip_file = None
+    completed = False
+    try:
+        if compress:
+            gzip_file = gzip.GzipFile(filename='', fileobj=binary, mode='wb', mtime=0)
+        if binary_mode:
+            try:
+                yield gzip_file or binary
+            finally:
+                if gzip_file is not None:
+                    gzip_file.close()
+            completed = True
+            return
+        stream = io.TextIOWrapper(gzip_file or binary, encoding='utf-8', newline='\n')
+        try:
+            yield stream
+        finally:
+            stream.flush()
+            # Keep STDOUT and the file opened, they are closed below
+            stream.detach()
+            if gzip_file is not None:
+                gzip_file.close()
+        completed = True
+    finally:
+        if to_stdout:
+            binary.flush()
+        else:
+            binary.close()
+            if completed:
+                os.replace(tmp_path, path)
+            else:
+                os.unlink(tmp_path)
+
+def write_lines(lines:Iterable[str], stream:IO[str]) -> None:
+    '''
+    Write the lines, each followed by a new line, in chunks of `CHUNK_LINES` lines.
+    '''
+    iterator = iter(lines)
+    while chunk := list(islice(iterator, CHUNK_LINES)):
+        chunk.append('')
+        stream.write('\n'.join(chunk))
+
+def write_bytes(records:Iterable[bytes], stream:IO[bytes]) -> None:
+    '''
+    Write the encoded records as they are, e.g. of `-t msgpack`, in chunks of `CHUNK_LINES` records.
+    '''
+    iterator = iter(records)
+    while chunk := list(islice(iterator, CHUNK_LINES)):
+        stream.write(b''.join(chunk))
+
+def write_output(lines:Iterable, stream:IO, binary_mode:bool=False) -> None:
+    '''
+    Write the lines with `write_lines`, or the records with `write_bytes` in binary mode
+    '''
+    if binary_mode:
+        write_bytes(lines, stream)
+    else:
+        write_lines(lines, stream)
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+'''
+Per-phase timing and allocation profiling of a rendering (`--profile`).
+
+The phases are recorded by `Profiler.phase()` around the steps of the rendering:
+importing ansible-core, initializing the plugin loader, parsing the playbook,
+converting each play (and its pre_tasks, roles, tasks and post_tasks) to states,
+and generating the diagram. Nested phases are named with their parents, e.g.
+`states/play_1/roles/common`.
+
+Example:
+    >>> profiler = Profiler()
+    >>> with profiler:
+    ...     lines = list(umlstate.generate(args, profiler=profiler))
+    >>> profiler.write_report('profile.json')
+    >>> profiler.dump_stats('profile.pstats')   # with Profiler(cprofile=True)
+
+A profiler records one rendering at a time, it is not thread-safe.
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import Any, Iterable, Iterator, Optional
+from contextlib import contextmanager, nullcontext
+import json
+import sys
+import time
+import tracemalloc
+
+class PhaseRecord:
+    """
+    The total of the runs of one phase
+    """
+    __slots__ = ('name', 'count', 'seconds', 'allocated_bytes', 'peak_bytes')
+
+    def __init__(self, name:str) -> None:
+        self.name = name
+        self.count = 0
+        self.seconds = 0.0
+        self.allocated_bytes = 0
+        self.peak_bytes = 0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+class _Frame:
+    __slots__ = ('path', 'start', 'start_memory', 'peak')
+
+    def __init__(self, path:str, start:float, start_memory:int) -> None:
+        self.path = path
+        self.start = start
+        self.start_memory = start_memory
+        self.peak = start_memory
+
+class Profiler:
+    '''
+    Records the wall time and the allocations of the phases.
+
+    Args:
+        allocations (bool): Trace the allocations with tracemalloc.
+            Slows down the rendering, the times are relative to each other.
+        cprofile (bool): Also run cProfile, see `dump_stats`.
+    '''
+    enabled = True
+
+    def __init__(self, allocations:bool=True, cprofile:bool=False) -> None:
+        self.allocations = allocations
+        self._records: dict[str, PhaseRecord] = {}
+        self._stack: list[_Frame] = []
+        self._started_tracemalloc = False
+        self._cprofile = None
+        if cprofile:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+        self._start: Optional[float] = None
+        self._seconds = 0.0
+
+    def __enter__(self) -> Profiler:
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        if self.allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if self._cprofile is not None:
+            self._cprofile.enable()
+        self._start = time.perf_counter()
+
+    def stop(self) -> None:
+        if self._start is not None:
+            self._seconds += time.perf_counter() - self._start
+            self._start = None
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _memory(self) -> tuple[int, int]:
+        if self.allocations and tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()
+        return (0, 0)
+
+    def _record(self, path:str) -> PhaseRecord:
+        record = self._records.get(path)
+        if record is None:
+            record = self._records[path] = PhaseRecord(path)
+        return record
+
+    @contextmanager
+    def phase(self, name:str) -> Iterator[None]:
+        '''
+        Record the time and the allocations of the `with` block as the phase `name`,
+        nested in the current phase.
+        '''
+        current, peak = self._memory()
+        for frame in self._stack:
+            frame.peak = max(frame.peak, peak)
+        if self.allocations and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        path = f'{self._stack[-1].path}/{name}' if self._stack else name
+        # created here to list the phases in the started order
+        record = self._record(path)
+        frame = _Frame(path, time.perf_counter(), current)
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - frame.start
+            self._stack.pop()
+            current, peak = self._memory()
+            frame.peak = max(frame.peak, peak)
+            if self._stack:
+                self._stack[-1].peak = max(self._stack[-1].peak, frame.peak)
+            record.count += 1
+            record.seconds += seconds
+            record.allocated_bytes += current - frame.start_memory
+            record.peak_bytes = max(record.peak_bytes, frame.peak - frame.start_memory)
+
+    def iterate(self, name:str, iterable:Iterable) -> Iterator:
+        '''
+        Pass through the items, recording the time and the allocations spent in
+        producing them (not in consuming them) as the phase `name`.
+        '''
+        record = self._record(name)
+        iterator = iter(iterable)
+        while True:
+            start_memory, _ = self._memory()
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                record.seconds += time.perf_counter() - start
+                record.allocated_bytes += self._memory()[0] - start_memory
+            record.count += 1
+            yield item
+
+    def report(self) -> dict[str, Any]:
+        '''
+        Get the report. `count` of the phases from `iterate()` is the number of items.
+        '''
+        seconds = self._seconds
+        if self._start is not None:
+            seconds += time.perf_counter() - self._start
+        return {
+            'total_seconds': seconds,
+            'allocations': self.allocations,
+            'phases': [record.to_dict() for record in self._records.values()],
+        }
+
+    def write_report(self, path:str) -> None:
+        '''
+        Write the JSON report to the file, `-` writes to STDERR.
+        '''
+        if path == '-':
+            json.dump(self.report(), sys.stderr, indent=2)
+            sys.stderr.write('\n')
+        else:
+            with open(path, 'w') as f:
+                json.dump(self.report(), f, indent=2)
+
+    def dump_stats(self, path:str) -> None:
+        '''
+        Write the cProfile statistics to the file, to be read with `pstats`
+        '''
+        if self._cprofile is None:
+            raise ValueError('cProfile is not enabled')
+        self._cprofile.dump_stats(path)
+
+_NULL_CONTEXT = nullcontext()
+
+class NullProfiler(Profiler):
+    '''
+    A profiler which records nothing, used when profiling is disabled
+    '''
+    enabled = False
+
+    def __init__(self) -> None:
+        super().__init__(allocations=False)
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def phase(self, name:str):
+        return _NULL_CONTEXT
+
+    def iterate(self, name:str, iterable:Iterable) -> Iterable:
+        return iterable
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+'''
+Whole-repository mode: find the playbooks of an Ansible project directory.
+
+The files are walked once without ansible-core. A YAML file is a playbook when it is
+a list of plays (mappings with `hosts`) or `import_playbook` entries; the text is searched
+for these keys before the file is parsed, so the task and vars files are rarely loaded.
+The directories which hold no playbooks (`roles`, `group_vars`, `host_vars`, the parts of
+a role, hidden directories ...) are not walked.
+
+The playbooks are rendered by `playbook2uml.batch` with one Ansible environment
+(and one role cache) per process, the diagrams are written under the output directory
+with the layout of the repository, and `summary.json` records the time and the error
+of each playbook.
+
+Example:
+    >>> playbooks = find_playbooks('path/to/repo', exclude=['tests/*'])
+    >>> with roles_path(repo_roles_dirs('path/to/repo')):
+    ...     results = list(batch.render_batch(batch.create_jobs(playbooks, option, 'diagrams', root='path/to/repo')))
+    >>> write_summary('diagrams/summary.json', 'path/to/repo', results, seconds)
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import Iterable, Iterator
+from contextlib import contextmanager
+from fnmatch import fnmatch
+import json
+import os
+import re
+import sys
+from playbook2uml.logger import getLogger
+
+logger = getLogger(__name__)
+
+SKIP_DIRS = frozenset((
+    'roles', 'collections', 'group_vars', 'host_vars', 'tasks', 'handlers', 'vars', 'defaults',
+    'meta', 'templates', 'files', 'library', 'module_utils', 'filter_plugins', 'node_modules',
+    'venv', '__pycache__',
+))
+"""
+The directories not walked for playbooks, with the hidden directories (`.git`, `.venv` ...)
+"""
+
+PLAYBOOK_EXTENSIONS = ('.yml', '.yaml')
+
+_PLAYBOOK_KEY = re.compile(r'^[ \t-]*(?:hosts|(?:ansible\.builtin\.)?import_playbook)[ \t]*:', re.MULTILINE)
+
+SUMMARY_FILE = 'summary.json'
+
+def is_playbook(path:str) -> bool:
+    '''
+    Whether the YAML file is a playbook: a list of plays or `import_playbook` entries
+    '''
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+    except OSError as e:
+        logger.warning('failed to read %s: %s', path, e)
+        return False
+    if not _PLAYBOOK_KEY.search(text):
+        return False
+    from playbook2uml.dependency import load_yaml, short_action
+    import yaml
+    try:
+        ds = load_yaml(path)
+    except yaml.YAMLError as e:
+        logger.warning('not a valid YAML file %s: %s', path, e)
+        return False
+    if not isinstance(ds, list) or not ds:
+        return False
+    return all(isinstance(entry, dict) and
+               ('hosts' in entry or any(short_action(str(key)) == 'import_playbook' for key in entry))
+               for entry in ds)
+
+def _matches(rel_path:str, patterns:Iterable[str]) -> bool:
+    return any(fnmatch(rel_path, pattern) for pattern in patterns)
+
+def walk_candidates(repo_dir:str) -> Iterator[str]:
+    '''
+    Walk the YAML files which can be playbooks, sorted by path
+    '''
+    for directory, dirs, files in os.walk(repo_dir):
+        dirs[:] = sorted(name for name in dirs if not name.startswith('.') and name not in SKIP_DIRS)
+        for file_name in sorted(files):
+            if file_name.endswith(PLAYBOOK_EXTENSIONS) and not file_name.startswith('.'):
+                yield os.path.join(directory, file_name)
+
+def find_playbooks(repo_dir:str, include:Iterable[str]=(), exclude:Iterable[str]=()) -> list[str]:
+    '''
+    Find the playbooks of the repository.
+
+    Args:
+        repo_dir (str): The repository directory
+        include (list[str]): Glob patterns of the paths relative to `repo_dir`, only the matching files are checked.
+            All files are checked when empty. `*` matches `/` too.
+        exclude (list[str]): Glob patterns of the paths relative to `repo_dir` which are skipped
+    '''
+    include = list(include)
+    exclude = list(exclude)
+    playbooks = []
+    candidates = 0
+    for path in walk_candidates(repo_dir):
+        rel_path = os.path.relpath(path, repo_dir).replace(os.sep, '/')
+        if (include and not _matches(rel_path, include)) or _matches(rel_path, exclude):
+            continue
+        candidates += 1
+        if is_playbook(path):
+            playbooks.append(os.path.normpath(path))
+        else:
+            logger.debug('not a playbook: %s', rel_path)
+    logger.info('%d playbooks in %d YAML files: %s', len(playbooks), candidates, repo_dir)
+    return playbooks
+
+def repo_roles_dirs(repo_dir:str) -> list[str]:
+    '''
+    Get the shared role directories of the repository: `roles` at the top
+    '''
+    path = os.path.join(os.path.abspath(repo_dir), 'roles')
+    return [path] if os.path.isdir(path) else []
+
+@contextmanager
+def roles_path(dirs:list[str]) -> Iterator[None]:
+    '''
+    Look for the roles in `dirs` too, so that the playbooks in the sub directories find the shared roles.
+    `ANSIBLE_ROLES_PATH` is set for the fast parser and the worker processes,
+    and ansible-core's `DEFAULT_ROLES_PATH` when it is already imported.
+    '''
+    if not dirs:
+        yield
+        return
+    saved_env = os.environ.get('ANSIBLE_ROLES_PATH')
+    os.environ['ANSIBLE_ROLES_PATH'] = os.pathsep.join([*dirs, *([saved_env] if saved_env else [])])
+    constants = sys.modules.get('ansible.constants')
+    saved_roles_path = getattr(constants, 'DEFAULT_ROLES_PATH', None)
+    if constants is not None:
+        constants.DEFAULT_ROLES_PATH = [*dirs, *(saved_roles_path or [])]
+    try:
+        yield
+    finally:
+        if saved_env is None:
+            os.environ.pop('ANSIBLE_ROLES_PATH', None)
+        else:
+            os.environ['ANSIBLE_ROLES_PATH'] = saved_env
+        if constants is not None:
+            constants.DEFAULT_ROLES_PATH = saved_roles_path
+
+def write_summary(path:str, repo_dir:str, results:list, seconds:float) -> dict:
+    '''
+    Write the summary of the rendering of the repository as JSON, returns it
+    '''
+    failures = [result for result in results if result.error]
+    summary = {
+        'repo': repo_dir,
+        'playbooks': len(results),
+        'succeeded': len(results) - len(failures),
+        'failed': len(failures),
+        'seconds': round(seconds, 3),
+        'slowest': [{'source': result.source, 'seconds': round(result.seconds, 3)}
+                    for result in sorted(results, key=lambda result: result.seconds, reverse=True)[:10]],
+        'failures': [{'source': result.source, 'error': result.error} for result in failures],
+        'results': [{'source': result.source, 'output': result.output, 'seconds': round(result.seconds, 3),
+                     'error': result.error} for result in results],
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2)
+        f.write('\n')
+    return summary
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+'''
+Long-running render server with a warm Ansible environment.
+
+ansible-core is imported and its plugin loader initialized once when the server
+starts, then each request only loads the playbook and generates the diagram.
+
+Requests:
+    GET  /health
+    GET  /render?playbook=PATH&type=mermaid
+    POST /render  {"playbook": "PATH", "type": "plantuml", "title": "...", ...}
+    POST /render  {"yaml": "- hosts: all ...", "basedir": "DIR"}
+    POST /render  {"role": "ROLE_NAME", "basedir": "DIR", "tasks_from": "main"}
+
+`"parser": "fast"` reads the playbook with `playbook2uml.fastparser`.
+`"collapse_roles"`, `"max_depth"`, `"max_args"` and `"max_arg_length"` are the summary options.
+`"stable_ids": true` names the states by the hashes of their paths (`--stable-ids`).
+
+The response is the PlantUML/Mermaid.js text (`text/plain`).
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import Any, Optional
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import urlsplit, parse_qsl
+import json
+import os
+import tempfile
+import threading
+import playbook2uml.umlstate as umlstate
+from playbook2uml.logger import getLogger
+
+logger = getLogger(__name__)
+
+MAX_REQUEST_SIZE = 16 * 1024 * 1024
+
+class RenderError(Exception):
+    '''
+    An error returned to the client with the HTTP status
+    '''
+    def __init__(self, status:HTTPStatus, message:str) -> None:
+        super().__init__(message)
+        self.status = status
+
+def _to_bool(value:Any) -> bool:
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+def _to_count(request:dict, key:str) -> Optional[int]:
+    value = request.get(key)
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        number = -1
+    if number < 0:
+        raise RenderError(HTTPStatus.BAD_REQUEST, f'{key} must be a non-negative number.')
+    return number
+
+class RenderService:
+    '''
+    Renders the requested playbooks with a bounded pool of worker threads.
+
+    Args:
+        workers (int): The number of worker threads.
+        timeout (float): Seconds to wait for a diagram. The client gets `504` when exceeded.
+        queue_size (int): The number of requests which may wait for a worker.
+            The client gets `503` when the queue is full.
+        verbose (int): The verbosity of the loggers of the diagrams.
+    '''
+
+    def __init__(self, workers:int=4, timeout:float=30.0, queue_size:int=16, verbose:int=0) -> None:
+        from playbook2uml.umlstate.extract import AnsibleEnvironment
+        self.timeout = timeout
+        self.verbose = verbose
+        self.environment = AnsibleEnvironment()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='playbook2uml-render')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def create_option(self, request:dict) -> Namespace:
+        '''
+        Create the options of `umlstate.load` from the request parameters
+        '''
+        diagram_type = request.get('type', 'plantuml')
+        if diagram_type not in umlstate.DIAGRAM_TYPES or diagram_type in umlstate.BINARY_TYPES:
+            raise RenderError(HTTPStatus.BAD_REQUEST, f'invalid type: {diagram_type}')
+        parser = request.get('parser', 'ansible')
+        if parser not in ('ansible', 'fast'):
+            raise RenderError(HTTPStatus.BAD_REQUEST, f'invalid parser: {parser}')
+        option = Namespace(type=diagram_type, title=request.get('title'), theme=request.get('theme'),
+                           left_to_right=_to_bool(request.get('left_to_right', False)), verbose=self.verbose,
+                           PLAYBOOK=None, role='', tasks_from=request.get('tasks_from', 'main'), BASE_DIR=None,
+                           parser=parser, collapse_roles=_to_bool(request.get('collapse_roles', False)),
+                           max_depth=_to_count(request, 'max_depth'), max_args=_to_count(request, 'max_args'),
+                           max_arg_length=_to_count(request, 'max_arg_length'),
+                           stable_ids=_to_bool(request.get('stable_ids', False)))
+        basedir = request.get('basedir')
+        if basedir is not None and not os.path.isdir(basedir):
+            raise RenderError(HTTPStatus.BAD_REQUEST, 'basedir must be a directory.')
+
+        if role := request.get('role'):
+            option.role = role
+            option.PLAYBOOK = option.BASE_DIR = basedir or '.'
+        elif playbook := request.get('playbook'):
+            if not os.path.isfile(playbook):
+                raise RenderError(HTTPStatus.BAD_REQUEST, 'playbook must be a file.')
+            option.PLAYBOOK = playbook
+        elif 'yaml' not in request:
+            raise RenderError(HTTPStatus.BAD_REQUEST, 'one of playbook, yaml or role is required.')
+        return option
+
+    def _render(self, option:Namespace, inline_yaml:Optional[str], basedir:Optional[str]) -> str:
+        tmp_path = None
+        try:
+            if inline_yaml is not None:
+                # Written next to the roles of `basedir`, because Ansible looks for roles
+                # relative to the playbook file
+                fd, tmp_path = tempfile.mkstemp(prefix='.playbook2uml-', suffix='.yml', dir=basedir)
+                with os.fdopen(fd, 'w') as f:
+                    f.write(inline_yaml)
+                option.PLAYBOOK = tmp_path
+            self.environment.clear_cache()
+            umlplaybook = umlstate.load(option, environment=self.environment)
+            return ''.join(line + '\n' for line in umlplaybook.generate())
+        finally:
+            if tmp_path is not None:
+                os.unlink(tmp_path)
+
+    def render(self, request:dict) -> str:
+        '''
+        Render the diagram of the request in a worker thread.
+
+        Raises:
+            RenderError: on invalid requests, a full queue, a timeout or a failed rendering
+        '''
+        option = self.create_option(request)
+        if not self._slots.acquire(blocking=False):
+            raise RenderError(HTTPStatus.SERVICE_UNAVAILABLE, 'too many requests.')
+        try:
+            future = self.executor.submit(self._render, option, request.get('yaml'), request.get('basedir'))
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the rendering finishes, even after a timeout
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise RenderError(HTTPStatus.GATEWAY_TIMEOUT, f'timed out after {self.timeout} seconds.')
+        except Exception as e:
+            logger.info('failed to render %s: %s', request, e)
+            raise RenderError(HTTPStatus.UNPROCESSABLE_ENTITY, f'{e.__class__.__name__}: {e}')
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    '''
+    HTTP handler calling the `RenderService` of the server
+    '''
+    server_version = 'playbook2uml'
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self) -> str:
+        # client_address is empty on Unix domain sockets
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format:str, *args) -> None:
+        logger.info('%s %s' % (self.address_string(), format % args))
+
+    def _send(self, status:HTTPStatus, body:str, content_type:str='text/plain; charset=utf-8') -> None:
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _render(self, request:dict) -> None:
+        try:
+            self._send(HTTPStatus.OK, self.server.service.render(request))
+        except RenderError as e:
+            self._send(e.status, f'{e}\n')
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        if url.path == '/health':
+            self._send(HTTPStatus.OK, 'ok\n')
+        elif url.path == '/render':
+            self._render(dict(parse_qsl(url.query)))
+        else:
+            self._send(HTTPStatus.NOT_FOUND, 'not found\n')
+
+    def do_POST(self) -> None:
+        if urlsplit(self.path).path != '/render':
+            self._send(HTTPStatus.NOT_FOUND, 'not found\n')
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_REQUEST_SIZE:
+            self.close_connection = True
+            self._send(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'request too large\n')
+            return
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(request, dict):
+                raise ValueError('the request must be a JSON object')
+        except ValueError as e:
+            self._send(HTTPStatus.BAD_REQUEST, f'invalid request: {e}\n')
+            return
+        self._render(request)
+
+class RenderHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address:tuple[str, int], service:RenderService) -> None:
+        super().__init__(address, RenderRequestHandler)
+        self.service = service
+
+class RenderUnixServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path:str, service:RenderService) -> None:
+        super().__init__(path, RenderRequestHandler)
+        self.service = service
+
+def create_server(service:RenderService, host:str='127.0.0.1', port:int=8080, socket_path:Optional[str]=None):
+    '''
+    Create the HTTP server on `host:port`, or on the Unix domain socket `socket_path`
+    '''
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        return RenderUnixServer(socket_path, service)
+    return RenderHTTPServer((host, port), service)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+'''
+Split output: one diagram per play (and per role) plus an index diagram of the plays.
+
+The playbook is loaded once, then the diagrams are generated from the states of
+`UMLStatePlaybookBase.plays` and written by a pool of threads, without the subtree cache
+when more than one thread is used:
+
+- `index.EXT`: one state per play with its number of tasks, linked to the diagram of the play
+- `play_N.EXT`: the diagram of the N-th play, with the same state names as the whole diagram
+- `roles/ROLE.EXT` (with `split_roles`): the diagram of the tasks of the role.
+  The plays show the role as one state linked to this file.
+
+Example:
+    >>> umlplaybook = umlstate.load(args)
+    >>> write_split(umlplaybook, 'diagrams', '.puml', split_roles=True)
+    ['diagrams/play_1.puml', 'diagrams/roles/common.puml', ..., 'diagrams/index.puml']
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Iterable, NamedTuple, Optional
+import os
+import re
+from playbook2uml.logger import getLogger
+from playbook2uml.output import open_output, write_lines
+
+logger = getLogger(__name__)
+
+INDEX_NAME = 'index'
+
+class SplitFile(NamedTuple):
+    '''
+    A diagram file of the split output
+    '''
+    path: str
+    """
+    The path relative to the output directory
+    """
+    generate: Callable[[], Iterable[str]]
+    """
+    Generates the lines of the diagram
+    """
+
+def role_file_name(name:str) -> str:
+    '''
+    Get the file name (without the extension) of the diagram of the role
+    '''
+    return re.sub(r'[^\w.-]+', '_', name).strip('._') or 'role'
+
+def split_files(umlplaybook, ext:str, split_roles:bool=False) -> list[SplitFile]:
+    '''
+    Get the diagram files of the plays, of the roles (with `split_roles`) and the index.
+    A role used by many plays is written once, from its first use.
+
+    Args:
+        umlplaybook (UMLStatePlaybookBase): The loaded playbook
+        ext (str): The file extension, e.g. `.puml`
+        split_roles (bool): Write the roles to their own diagrams
+
+    Raises:
+        ValueError: The playbook has no index diagram, e.g. the state graph (`-t json`, `-t msgpack`)
+    '''
+    if not hasattr(umlplaybook, 'generate_index'):
+        raise ValueError(f'{type(umlplaybook).__module__} has no index diagram, the plays can not be split')
+    context = umlplaybook.context
+    summary_class = umlplaybook.BLOCK_CLASS.SUMMARY_CLASS
+    files: list[SplitFile] = []
+    role_paths: dict[str, str] = {}
+    links = []
+    for umlplay in umlplaybook.plays:
+        if split_roles and not context.collapse_roles and umlplay.role_groups:
+            summaries = []
+            for name, states in umlplay.role_groups:
+                if not states:
+                    continue
+                role_path = role_paths.get(name)
+                if role_path is None:
+                    role_path = role_paths[name] = 'roles/%s%s' % (role_file_name(name), ext)
+                    role_play = umlplay.replace(pre_tasks=(), roles=states, tasks=(), post_tasks=())
+                    files.append(SplitFile(role_path, partial(umlplaybook.generate_plays, [role_play], True)))
+                task_count = sum(state.count_tasks() for state in states)
+                summaries.append(summary_class('role', 'Role: %s' % name, task_count, context, link=role_path))
+            umlplay = umlplay.replace(roles=tuple(summaries))
+        play_path = umlplay.name + ext
+        files.append(SplitFile(play_path, partial(umlplaybook.generate_plays, [umlplay])))
+        links.append((umlplay, play_path))
+    files.append(SplitFile(INDEX_NAME + ext, partial(umlplaybook.generate_index, links)))
+    return files
+
+def _write_file(split_file:SplitFile, output_dir:str, compress:bool) -> str:
+    path = os.path.join(output_dir, split_file.path + ('.gz' if compress else ''))
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    logger.info('write %s', path)
+    with open_output(path, compress=compress) as stream:
+        write_lines(split_file.generate(), stream)
+    return path
+
+def write_split(umlplaybook, output_dir:str, ext:str, split_roles:bool=False, compress:bool=False,
+                workers:Optional[int]=None) -> list[str]:
+    '''
+    Write the split diagrams of the loaded playbook to the directory, in parallel.
+
+    Args:
+        umlplaybook (UMLStatePlaybookBase): The loaded playbook
+        output_dir (str): The directory to write the diagrams to
+        ext (str): The file extension, e.g. `.puml`
+        split_roles (bool): Write the roles to their own diagrams
+        compress (bool): Write gzip compressed files (with ".gz" suffix)
+        workers (int, optional): The number of writer threads.[default=the number of CPUs]
+
+    Returns:
+        list[str]: The written files, the index is the last one
+    '''
+    files = split_files(umlplaybook, ext, split_roles=split_roles)
+    workers = workers or os.cpu_count() or 1
+    context = umlplaybook.context
+    memoize_subtrees = context.memoize_subtrees
+    if workers > 1 and len(files) > 1:
+        # The threads share the states and the context, and the subtree cache
+        # (`playbook2uml.umlstate.subtree`) renames the states in place
+        context.memoize_subtrees = False
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='playbook2uml-split') as executor:
+            futures = [executor.submit(_write_file, split_file, output_dir, compress) for split_file in files]
+            return [future.result() for future in futures]
+    finally:
+        context.memoize_subtrees = memoize_subtrees
@@ -0,0 +1,100 @@
+import unittest
+import asyncio
+import glob
+import os.path
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import playbook2uml.cli as cli
+import playbook2uml.umlstate as umlstate
+from playbook2uml.aio import render_async, create_option
+
+class Test_Async(unittest.TestCase):
+    '''asyncio API
+    The lines are generated in an executor thread and streamed to the event loop.
+    '''
+    BASE_DIR = 'test_playbook'
+
+    def collect(self, *args, **kwargs) -> list:
+        async def run():
+            return [line async for line in render_async(*args, **kwargs)]
+        return asyncio.run(run())
+
+    def test_expects(self):
+        executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        for book_file in sorted(glob.glob(os.path.join(self.BASE_DIR, '*.yml'))):
+            base_name, _ = os.path.splitext(os.path.basename(book_file))
+            for diagram_type, ext in (('plantuml', '.puml'), ('mermaid', '.mmd')):
+                with self.subTest((book_file, diagram_type)):
+                    with open(os.path.join(self.BASE_DIR, 'expects', base_name + ext), 'r') as f:
+                        expect = f.read().strip().splitlines()
+                    self.assertListEqual(self.collect(book_file, type=diagram_type, executor=executor, chunk_size=3), expect)
+
+    def test_options(self):
+        args = ['--parser', 'fast', '--max-depth', '1', os.path.join(self.BASE_DIR, 'book_3_block_nested.yml')]
+        expect = list(umlstate.generate(cli.parse_args(args)))
+        self.assertListEqual(self.collect(option=cli.parse_args(args)), expect)
+        self.assertListEqual(self.collect(args[-1], parser='fast', max_depth=1), expect)
+        role = self.collect(role='role_1', base_dir=self.BASE_DIR)
+        self.assertIn('state "== role_1 : Role Start" as task_1', role)
+        with self.assertRaises(TypeError):
+            create_option(args[-1], max_dept=1)
+        with self.assertRaises(ValueError):
+            create_option(args[-1], type='msgpack')
+
+    def test_error(self):
+        with self.assertRaises(Exception):
+            self.collect(os.path.join(self.BASE_DIR, 'not_found.yml'), parser='fast')
+
+    def lines_generator(self, count: int, produced: list):
+        def generate(option, environment=None):
+            for i in range(count):
+                produced.append(i)
+                yield 'line %d' % i
+        return generate
+
+    def test_backpressure(self):
+        '''The producer runs at most max_chunks chunks ahead of the consumer'''
+        produced = []
+        async def run():
+            consumed = 0
+            async for _ in render_async('-', parser='fast', chunk_size=10, max_chunks=2):
+                consumed += 1
+                if consumed % 100 == 0:
+                    await asyncio.sleep(0.01)
+                    self.assertLessEqual(len(produced) - consumed, 10 * 3)
+            return consumed
+        with mock.patch.object(umlstate, 'generate', self.lines_generator(1000, produced)):
+            self.assertEqual(asyncio.run(run()), 1000)
+
+    def test_cancel(self):
+        '''The producer stops when the consumer stops'''
+        produced = []
+        stopped = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        async def run():
+            async for line in render_async('-', parser='fast', executor=executor, chunk_size=10, max_chunks=2):
+                self.assertEqual(line, 'line 0')
+                break
+            executor.submit(stopped.set)
+        async def cancel():
+            task = asyncio.ensure_future(consume_slowly())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        async def consume_slowly():
+            async for _ in render_async('-', parser='fast', executor=executor, chunk_size=10, max_chunks=2):
+                await asyncio.sleep(1)
+        with mock.patch.object(umlstate, 'generate', self.lines_generator(100000, produced)):
+            asyncio.run(run())
+            self.assertTrue(stopped.wait(5))
+            self.assertLess(len(produced), 100)
+            produced.clear()
+            stopped.clear()
+            asyncio.run(cancel())
+            executor.submit(stopped.set)
+            self.assertTrue(stopped.wait(5))
+            self.assertLess(len(produced), 100)
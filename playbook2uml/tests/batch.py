@@ -0,0 +1,109 @@
+import unittest
+import logging
+import glob
+import os.path
+import tempfile
+import playbook2uml.cli as cli
+import playbook2uml.batch as batch
+
+class Test_Batch(unittest.TestCase):
+    '''Batch mode
+    Render all test playbooks in one process and compare with the expects.
+    '''
+    BASE_DIR = 'test_playbook'
+
+    def render_all(self, diagram_type: str, ext: str):
+        with tempfile.TemporaryDirectory() as output_dir:
+            option = cli.parse_batch_args(['-t', diagram_type, '-o', output_dir,
+                                           os.path.join(self.BASE_DIR, '*.yml')])
+            playbooks = batch.expand_inputs(option.PLAYBOOK)
+            jobs = batch.create_jobs(playbooks, option, output_dir)
+            results = list(batch.render_batch(jobs))
+            self.assertEqual(len(results), len(playbooks))
+
+            for result in results:
+                with self.subTest(result.source):
+                    self.assertIsNone(result.error)
+                    base_name, _ = os.path.splitext(os.path.basename(result.source))
+                    self.assertEqual(result.output, os.path.join(output_dir, self.BASE_DIR, base_name + ext))
+                    with open(os.path.join(self.BASE_DIR, 'expects', base_name + ext), 'r') as f:
+                        expect_lines = f.read().strip().splitlines()
+                    with open(result.output, 'r') as f:
+                        self.assertListEqual(f.read().splitlines(), expect_lines)
+
+    def test_plantuml(self):
+        self.render_all('plantuml', '.puml')
+
+    def test_mermaid(self):
+        self.render_all('mermaid', '.mmd')
+
+    def test_processes(self):
+        '''
+        The diagrams rendered by worker processes are the same bytes as the serial mode
+        '''
+        playbooks = batch.expand_inputs([os.path.join(self.BASE_DIR, '*.yml')])
+        with tempfile.TemporaryDirectory() as serial_dir, tempfile.TemporaryDirectory() as parallel_dir:
+            for diagram_type in ('plantuml', 'mermaid'):
+                option = cli.parse_batch_args(['-t', diagram_type, '-o', serial_dir, *playbooks])
+                serial = list(batch.render_batch(batch.create_jobs(playbooks, option, serial_dir)))
+                parallel = list(batch.render_batch(batch.create_jobs(playbooks, option, parallel_dir), processes=3))
+                self.assertEqual(len(serial), len(parallel))
+                for serial_result, parallel_result in zip(serial, parallel):
+                    with self.subTest((diagram_type, serial_result.source)):
+                        self.assertEqual(serial_result.source, parallel_result.source)
+                        self.assertIsNone(parallel_result.error)
+                        with open(serial_result.output, 'rb') as f1, open(parallel_result.output, 'rb') as f2:
+                            self.assertEqual(f1.read(), f2.read())
+
+    def test_role(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            option = cli.parse_batch_args(['-o', output_dir, '-R', 'role_1', '--base-dir', self.BASE_DIR])
+            jobs = batch.create_jobs([], option, output_dir, roles=option.role, base_dir=option.base_dir)
+            results = list(batch.render_batch(jobs))
+            self.assertEqual([result._replace(seconds=0.0) for result in results],
+                             [batch.BatchResult('role:role_1', os.path.join(output_dir, 'roles', 'role_1.puml'))])
+            with open(results[0].output, 'r') as f:
+                self.assertIn('state "== role_1 : Role Start" as task_1', f.read().splitlines())
+
+    def test_error(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            broken = os.path.join(output_dir, 'broken.yml')
+            with open(broken, 'w') as f:
+                f.write('- hosts: all\n  tasks: 1\n')
+            option = cli.parse_batch_args(['-o', output_dir, broken, os.path.join(self.BASE_DIR, 'book_1.yml')])
+            jobs = batch.create_jobs(batch.expand_inputs(option.PLAYBOOK), option, output_dir)
+            with self.assertLogs('playbook2uml.batch', 'DEBUG') as logs:
+                results = list(batch.render_batch(jobs))
+            # reported once, by the caller
+            self.assertEqual([record.getMessage() for record in logs.records if record.levelno >= logging.WARNING], [])
+            self.assertIsNotNone(results[0].error)
+            self.assertIsNone(results[1].error)
+
+    def test_outside(self):
+        '''The playbooks outside the root keep their absolute path, the same output file is an error'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            playbooks = [os.path.join(tmp_dir, name, 'site.yml') for name in ('a', 'b')]
+            output_dir = os.path.join(tmp_dir, 'out')
+            option = cli.parse_batch_args(['-o', output_dir, *playbooks])
+            jobs = batch.create_jobs(playbooks, option, output_dir, root=os.path.join(tmp_dir, 'a'))
+            self.assertEqual([job.output for job in jobs], [
+                os.path.join(output_dir, 'site.puml'),
+                os.path.join(output_dir, os.path.splitdrive(tmp_dir)[1].lstrip(os.sep), 'b', 'site.puml'),
+            ])
+            jobs = batch.create_jobs(playbooks, option, output_dir, root=os.path.join(tmp_dir, '..foo'))
+            self.assertEqual(len({job.output for job in jobs}), 2)
+            with self.assertRaises(ValueError):
+                batch.create_jobs([os.path.join('roles', 'common.yml')], option, output_dir, roles=['common'])
+
+    def test_manifest(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write('# comment\n\ntest_playbook/book_1.yml\ntest_playbook/book_[2-3]*.yml\ntest_playbook/book_1.yml\n')
+        try:
+            playbooks = batch.expand_inputs(batch.read_manifest(f.name))
+        finally:
+            os.unlink(f.name)
+        self.assertListEqual(playbooks, [
+            os.path.join(self.BASE_DIR, 'book_1.yml'),
+            os.path.join(self.BASE_DIR, 'book_2_block.yml'),
+            os.path.join(self.BASE_DIR, 'book_3_block_nested.yml'),
+        ])
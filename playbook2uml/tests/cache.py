@@ -0,0 +1,120 @@
+import unittest
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+import playbook2uml.cli as cli
+import playbook2uml.umlstate as umlstate
+import playbook2uml.cache as cache
+
+class Test_Cache(unittest.TestCase):
+    '''Output cache
+    '''
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.book_dir = os.path.join(self.tmp_dir, 'books')
+        shutil.copytree('test_playbook', self.book_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def key(self, *args):
+        return cache.cache_key(cli.parse_args(['--cache-dir', self.cache_dir, *args]))
+
+    def test_key(self):
+        playbook = os.path.join(self.book_dir, 'book_5_role.yml')
+        key = self.key(playbook)
+        with self.subTest('same inputs'):
+            self.assertEqual(key, self.key(playbook))
+
+        for options in (['-t', 'mermaid'], ['--title', 'T'], ['--theme', 'T'], ['--left-to-right']):
+            with self.subTest(options):
+                self.assertNotEqual(key, self.key(*options, playbook))
+
+        with self.subTest('role file changed'):
+            with open(os.path.join(self.book_dir, 'roles', 'role_1', 'tasks', 'main.yml'), 'a') as f:
+                f.write('\n- debug:\n')
+            self.assertNotEqual(key, self.key(playbook))
+
+        with self.subTest('role mode --tasks-from'):
+            self.assertNotEqual(self.key('-R', 'role_1', self.book_dir),
+                                self.key('-R', 'role_1', '--tasks-from', 'other', self.book_dir))
+
+    def test_hit(self):
+        playbook = os.path.join(self.book_dir, 'book_2_block.yml')
+        option = cli.parse_args(['--cache-dir', self.cache_dir, playbook])
+        generated = list(umlstate.generate(option))
+
+        calls = []
+        def generate():
+            calls.append(1)
+            return []
+        self.assertListEqual(list(cache.generate_with_cache(option, generate, '.puml')), generated)
+        self.assertListEqual(calls, [])
+
+        with open(playbook, 'a') as f:
+            f.write('\n')
+        self.assertListEqual(list(cache.generate_with_cache(option, generate, '.puml')), [])
+        self.assertListEqual(calls, [1])
+
+    def test_unresolved(self):
+        '''The playbooks with templated imports are not cached'''
+        playbook = os.path.join(self.book_dir, 'templated.yml')
+        with open(playbook, 'w') as f:
+            f.write('- hosts: all\n  vars:\n    inc: inc.yml\n  tasks:\n    - import_tasks: "{{ inc }}"\n')
+        with open(os.path.join(self.book_dir, 'inc.yml'), 'w') as f:
+            f.write('- name: old task\n  debug:\n')
+        option = cli.parse_args(['--cache-dir', self.cache_dir, playbook])
+        self.assertIsNone(cache.cache_key(option))
+        self.assertIn('    state "== old task" as task_1', list(umlstate.generate(option)))
+        with open(os.path.join(self.book_dir, 'inc.yml'), 'w') as f:
+            f.write('- name: new task\n  debug:\n')
+        self.assertIn('    state "== new task" as task_1', list(umlstate.generate(option)))
+        self.assertFalse(os.path.isdir(self.cache_dir) and any(files for _, _, files in os.walk(self.cache_dir)))
+
+    def test_evict(self):
+        output_cache = cache.OutputCache(self.cache_dir, max_size=350)
+        for i, key in enumerate(('a1', 'b2', 'c3')):
+            list(output_cache.store(key, '.puml', ['x' * 99]))
+            path = os.path.join(self.cache_dir, key[:2], key + '.puml')
+            os.utime(path, (i, i))
+        # a1 is the least recently used after the hit
+        self.assertIsNotNone(output_cache.get('a1', '.puml'))
+        list(output_cache.store('d4', '.puml', ['x' * 99]))
+        self.assertIsNotNone(output_cache.get('a1', '.puml'))
+        self.assertIsNone(output_cache.get('b2', '.puml'))
+        self.assertIsNotNone(output_cache.get('c3', '.puml'))
+        self.assertIsNotNone(output_cache.get('d4', '.puml'))
+
+    def test_evict_walks(self):
+        '''The cache directory is walked once, and when the size counted by the stores exceeds the maximum'''
+        output_cache = cache.OutputCache(self.cache_dir, max_size=1000)
+        with mock.patch.object(cache.os, 'walk', wraps=os.walk) as walk:
+            for i in range(20):
+                list(output_cache.store('%02d' % i, '.puml', ['x' * 99]))
+        # 10 entries fit, then every other store evicts two (down to 90%)
+        self.assertEqual(walk.call_count, 1 + 5)
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(self.cache_dir)), 10)
+
+    def test_encoding(self):
+        '''The entries are UTF-8 whatever the locale'''
+        code = ('import sys, playbook2uml.cache as cache\n'
+                'c = cache.OutputCache(sys.argv[1])\n'
+                'list(c.store("a1", ".puml", ["state \\"== \\u3042\\""]))\n'
+                'print(ascii(c.get("a1", ".puml")))\n')
+        env = dict(os.environ, LC_ALL='C', PYTHONUTF8='0', PYTHONCOERCECLOCALE='0')
+        result = subprocess.run([sys.executable, '-c', code, self.cache_dir], capture_output=True, text=True, env=env)
+        self.assertEqual(result.stderr, '')
+        self.assertEqual(result.stdout, "'state \"== \\u3042\"\\n'\n")
+        with open(os.path.join(self.cache_dir, 'a1', 'a1.puml'), 'rb') as f:
+            self.assertEqual(f.read(), 'state "== \u3042"\n'.encode('utf-8'))
+
+    def test_parse_size(self):
+        for size, expected in (('1024', 1024), ('2k', 2048), ('3M', 3 * 1024 ** 2), ('1GB', 1024 ** 3)):
+            with self.subTest(size):
+                self.assertEqual(cache.parse_size(size), expected)
+        with self.assertRaises(ValueError):
+            cache.parse_size('big')
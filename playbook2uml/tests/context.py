@@ -0,0 +1,64 @@
+import unittest
+import glob
+import os.path
+from concurrent.futures import ThreadPoolExecutor
+import playbook2uml.cli as cli
+import playbook2uml.umlstate as umlstate
+from playbook2uml.umlstate.base import RenderContext
+from playbook2uml.umlstate.extract import AnsibleEnvironment
+
+class Test_RenderContext(unittest.TestCase):
+    '''Per-render ID allocation
+    Many playbooks are loaded and generated at the same time in one process.
+    '''
+    BASE_DIR = 'test_playbook'
+    CASES = []
+
+    @classmethod
+    def setUpClass(cls):
+        cases = []
+        for book_file in sorted(glob.glob(os.path.join(cls.BASE_DIR, '*.yml'))):
+            base_name, _ = os.path.splitext(os.path.basename(book_file))
+            for diagram_type, ext in (('plantuml', '.puml'), ('mermaid', '.mmd')):
+                with open(os.path.join(cls.BASE_DIR, 'expects', base_name + ext), 'r') as f:
+                    cases.append((cli.parse_args(['-t', diagram_type, book_file]), f.read().strip().splitlines()))
+        cls.CASES = cases
+
+    def test_next_id(self):
+        context = RenderContext()
+        self.assertListEqual([context.next_id('task') for _ in range(3)], [1, 2, 3])
+        self.assertEqual(context.next_id('block'), 1)
+        self.assertEqual(RenderContext().next_id('task'), 1)
+
+    def test_interleaved(self):
+        '''
+        Load all playbooks first, then generate them line by line in turn
+        '''
+        environment = AnsibleEnvironment()
+        books = [(umlstate.load(option, environment=environment), expect) for option, expect in self.CASES]
+        generators = [(book.generate(), [], expect) for book, expect in books]
+        active = list(generators)
+        while active:
+            for item in list(active):
+                generator, lines, _ = item
+                try:
+                    lines.append(next(generator))
+                except StopIteration:
+                    active.remove(item)
+
+        for _, lines, expect in generators:
+            self.assertListEqual(lines, expect)
+
+    def test_threads(self):
+        '''
+        Stress test: load and generate concurrently in threads, with shared and own environments
+        '''
+        environment = AnsibleEnvironment()
+        def render(index):
+            option, expect = self.CASES[index % len(self.CASES)]
+            book = umlstate.load(option, environment=environment if index % 2 else None)
+            return list(book.generate()), expect
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for lines, expect in executor.map(render, range(len(self.CASES) * 8)):
+                self.assertListEqual(lines, expect)
@@ -0,0 +1,112 @@
+import unittest
+import contextlib
+import io
+import os
+import tempfile
+from unittest import mock
+import playbook2uml.cli as cli
+import playbook2uml.umlstate as umlstate
+from playbook2uml.diff import diff_playbooks, format_changes, highlight, walk_states
+
+OLD_PLAYBOOK = '''
+- name: site
+  hosts: all
+  tasks:
+    - name: install
+      apt: name=nginx
+    - name: configure
+      template: src=a dest=b
+    - name: group
+      block:
+        - name: inner
+          debug: msg=x
+      rescue:
+        - name: report
+          debug: msg=fail
+    - name: cleanup
+      file: path=/tmp state=absent
+'''
+
+class Test_Diff(unittest.TestCase):
+    '''Structural diff
+    The states are matched by their path in the playbook, not by their `task_N` names.
+    '''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name: str, content: str) -> str:
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def load(self, content: str, name: str, *args: str):
+        return umlstate.load(cli.parse_args([*args, self.write(name, content)]))
+
+    def diff(self, new_content: str, *args: str):
+        return diff_playbooks(self.load(OLD_PLAYBOOK, 'old.yml', *args), self.load(new_content, 'new.yml', *args))
+
+    def test_same(self):
+        self.assertEqual(self.diff(OLD_PLAYBOOK), [])
+
+    def test_paths(self):
+        paths = [entry.path for entry in walk_states(self.load(OLD_PLAYBOOK, 'old.yml'))]
+        self.assertEqual(paths, ['site/tasks/install (apt)', 'site/tasks/configure (template)',
+                                 'site/tasks/block:group/inner (debug)', 'site/tasks/block:group/rescue/report (debug)',
+                                 'site/tasks/cleanup (file)'])
+
+    def test_inserted(self):
+        '''A task inserted at the top does not change the identity of the others'''
+        new_content = OLD_PLAYBOOK.replace('  tasks:\n', '  tasks:\n    - name: first\n      ping:\n')
+        for parser in ('ansible', 'fast'):
+            with self.subTest(parser):
+                changes = self.diff(new_content, '--parser', parser)
+                self.assertEqual([(change.kind, change.path, change.name) for change in changes],
+                                 [('added', 'site/tasks/first (ping)', 'task_1')])
+
+    def test_changed(self):
+        changes = self.diff(OLD_PLAYBOOK.replace('name=nginx', 'name=nginx-full'))
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0].kind, 'changed')
+        self.assertEqual(changes[0].fields, (('args', {'name': 'nginx'}, {'name': 'nginx-full'}),))
+        self.assertEqual(list(format_changes(changes)),
+                         ['~ site/tasks/install (apt)', "    args: {'name': 'nginx'} -> {'name': 'nginx-full'}"])
+
+    def test_moved_and_removed(self):
+        new_content = OLD_PLAYBOOK.replace('name: group', 'name: renamed').split('    - name: cleanup')[0]
+        changes = self.diff(new_content)
+        self.assertEqual([(change.kind, change.path, change.old_path) for change in changes], [
+            ('moved', 'site/tasks/block:renamed/inner (debug)', 'site/tasks/block:group/inner (debug)'),
+            ('moved', 'site/tasks/block:renamed/rescue/report (debug)', 'site/tasks/block:group/rescue/report (debug)'),
+            ('removed', 'site/tasks/cleanup (file)', None),
+        ])
+
+    def test_highlight(self):
+        new_content = OLD_PLAYBOOK.replace('name=nginx', 'name=nginx-full').split('    - name: cleanup')[0]
+        changes = self.diff(new_content)
+        new = self.load(new_content, 'new.yml')
+        lines = list(highlight(new.generate(), changes, 'plantuml'))
+        self.assertIn('    state "== install" as task_1 #khaki', lines)
+        self.assertIn('    - site/tasks/cleanup (file)', lines)
+        self.assertEqual(lines[-1], '@enduml')
+        lines = list(highlight(self.load(new_content, 'new.yml', '-t', 'mermaid').generate(), changes, 'mermaid'))
+        self.assertIn('    class task_1 changed', lines)
+        self.assertIn('    class diff_removed removed', lines)
+
+    def test_cli(self):
+        old = self.write('old.yml', OLD_PLAYBOOK)
+        new = self.write('new.yml', OLD_PLAYBOOK.replace('name=nginx', 'name=nginx-full'))
+        output = os.path.join(self.tmp.name, 'changes.txt')
+        with mock.patch.object(umlstate, 'load', wraps=umlstate.load) as load:
+            self.assertEqual(cli.diff_main(['-o', output, old, new]), 1)
+        environments = [call.kwargs['environment'] for call in load.call_args_list]
+        self.assertEqual(len(environments), 2)
+        self.assertIsNotNone(environments[0])
+        self.assertIs(environments[0], environments[1])
+        with open(output) as f:
+            self.assertEqual(f.readline(), '~ site/tasks/install (apt)\n')
+        self.assertEqual(cli.diff_main(['--parser', 'fast', '-o', output, old, old]), 0)
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                cli.diff_main(['-t', 'json', '-f', 'diagram', old, new])
@@ -0,0 +1,186 @@
+import unittest
+import glob
+import os.path
+import tempfile
+import textwrap
+import playbook2uml.cli as cli
+import playbook2uml.umlstate as umlstate
+from playbook2uml.fastparser import FastParserError, parse_kv, split_args
+
+class Test_FastParser_Conformance(unittest.TestCase):
+    '''`--parser fast` must generate the same diagrams as the Ansible parser
+    '''
+    BASE_DIR = 'test_playbook'
+
+    def generate(self, args: list[str]) -> list[str]:
+        return list(umlstate.load(cli.parse_args(args)).generate())
+
+    def test_expects(self):
+        for book_file in sorted(glob.glob(os.path.join(self.BASE_DIR, '*.yml'))):
+            base_name, _ = os.path.splitext(os.path.basename(book_file))
+            for diagram_type, ext in (('plantuml', '.puml'), ('mermaid', '.mmd')):
+                expect_file = os.path.join(self.BASE_DIR, 'expects', base_name + ext)
+                if not os.path.exists(expect_file):
+                    continue
+                with self.subTest(book_file, type=diagram_type):
+                    with open(expect_file, 'r') as f:
+                        expect_lines = f.read().strip().splitlines()
+                    result_lines = self.generate(['--parser', 'fast', '-t', diagram_type, book_file])
+                    self.assertListEqual(result_lines, expect_lines)
+
+    def test_role(self):
+        for diagram_type in ('plantuml', 'mermaid'):
+            with self.subTest(type=diagram_type):
+                args = ['-t', diagram_type, '-R', 'role_1', self.BASE_DIR]
+                self.assertListEqual(self.generate(['--parser', 'fast', *args]), self.generate(args))
+
+class Test_FastParser_Features(unittest.TestCase):
+    '''Compare with the Ansible parser on the less common task syntaxes
+    '''
+    FILES = {
+        'site.yml': '''
+            - import_playbook: play.yml
+            - hosts: [host1, host2]
+              gather_facts: no
+              become: yes
+              become_user: admin
+              roles:
+                - role: r0
+                  when: role_condition
+              tasks:
+                - name: block
+                  when: block_condition
+                  delegate_to: host3
+                  block:
+                    - command: /bin/false
+                      when: task_condition
+                  rescue:
+                    - debug: msg="rescued"
+                  always:
+                    - ping:
+            ''',
+        'play.yml': '''
+            - hosts: host1, host2
+              serial: 2
+              strategy: free
+              gather_facts: no
+              vars_files: [a.yml, [b.yml, c.yml]]
+              vars_prompt:
+                - name: pw
+                  prompt: pw
+              roles:
+                - r1
+                - role: r0
+              tasks:
+                - command: echo 1
+                  args:
+                    chdir: /tmp
+                - name: until list
+                  ping:
+                  until: [a, b]
+                  retries: 3
+                  delay: 1
+                - debug: msg="hi there" var=x
+                - ansible.builtin.debug:
+                    msg: fq
+                - action: debug msg=act
+                - local_action: command ls chdir=/tmp
+                - name: with items
+                  debug: msg={{ item }}
+                  with_items: "{{ foo }}"
+                  when: a and b
+                - name: with dict
+                  debug:
+                  with_dict: {a: 1}
+                  become: yes
+                  become_user: root
+                  delegate_to: localhost
+                  register: r
+                - import_tasks: inc.yml
+                - include_tasks: inc.yml
+                - include_tasks:
+                    file: inc.yml
+                - include_role:
+                    name: r0
+                - import_role:
+                    name: r1
+                  when: import_condition
+                  become_user: bob
+                - name: loop
+                  debug:
+                  loop: "{{ x }}"
+                  when:
+                    - a
+                    - b
+                - meta: flush_handlers
+                - name: multi line
+                  debug:
+                    msg: |
+                      a
+                      b
+            ''',
+        'inc.yml': '''
+            - name: included
+              shell: ls -l
+            - ansible.builtin.debug:
+                var: x
+            ''',
+        'roles/r0/tasks/main.yml': '''
+            - name: r0 task
+              ping:
+            ''',
+        'roles/r1/meta/main.yml': '''
+            dependencies:
+              - r0
+            ''',
+        'roles/r1/tasks/main.yml': '''
+            - name: r1 task
+              debug: msg=hi
+            - import_tasks: other.yml
+            ''',
+        'roles/r1/tasks/other.yml': '''
+            - name: r1 other
+              command: echo hi
+            ''',
+    }
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        for name, content in self.FILES.items():
+            path = os.path.join(self.tmp_dir.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(textwrap.dedent(content))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def generate(self, args: list[str]) -> list[str]:
+        return list(umlstate.load(cli.parse_args(args)).generate())
+
+    def test_playbook(self):
+        playbook = os.path.join(self.tmp_dir.name, 'site.yml')
+        for diagram_type in ('plantuml', 'mermaid'):
+            with self.subTest(type=diagram_type):
+                args = ['-t', diagram_type, playbook]
+                self.assertListEqual(self.generate(['--parser', 'fast', *args]), self.generate(args))
+
+    def test_role(self):
+        for tasks_from in ('main', 'other'):
+            with self.subTest(tasks_from=tasks_from):
+                args = ['-R', 'r1', '--tasks-from', tasks_from, self.tmp_dir.name]
+                self.assertListEqual(self.generate(['--parser', 'fast', *args]), self.generate(args))
+
+    def test_errors(self):
+        with self.assertRaises(FastParserError):
+            self.generate(['--parser', 'fast', '-R', 'no_such_role', self.tmp_dir.name])
+        playbook = os.path.join(self.tmp_dir.name, 'bad.yml')
+        with open(playbook, 'w') as f:
+            f.write('- hosts: all\n  tasks:\n    - name: no action\n')
+        with self.assertRaises(FastParserError):
+            self.generate(['--parser', 'fast', playbook])
+
+    def test_parse_kv(self):
+        self.assertListEqual(split_args('msg="a b" x={{ y | default("c d") }}'), ['msg="a b"', 'x={{ y | default("c d") }}'])
+        self.assertDictEqual(parse_kv('msg="a b" var=x'), {'msg': 'a b', 'var': 'x'})
+        self.assertDictEqual(parse_kv('echo a=1 chdir=/tmp', check_raw=True), {'chdir': '/tmp', '_raw_params': 'echo a=1'})
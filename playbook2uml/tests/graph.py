@@ -0,0 +1,126 @@
+import unittest
+import contextlib
+import glob
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+import playbook2uml.cli as cli
+import playbook2uml.split as split
+import playbook2uml.umlstate as umlstate
+from playbook2uml.output import open_output, write_output
+import playbook2uml.umlstate.graph as graph
+from playbook2uml.umlstate.graph import read_records
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class Test_Graph(unittest.TestCase):
+    '''State graph
+    `-t json` and `-t msgpack` write the states as a stream of records,
+    the diagrams rendered from the graph are the same as from the playbook.
+    '''
+    BASE_DIR = 'test_playbook'
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write_graph(self, diagram_type: str, *args: str, compress: bool = False) -> str:
+        option = cli.parse_args(['-t', diagram_type, *args])
+        path = os.path.join(self.tmp.name, 'graph' + umlstate.FILE_EXTENSIONS[diagram_type] + ('.gz' if compress else ''))
+        binary_mode = diagram_type in umlstate.BINARY_TYPES
+        with open_output(path, compress=compress, binary_mode=binary_mode) as stream:
+            write_output(umlstate.generate(option), stream, binary_mode)
+        return path
+
+    def assertSameDiagrams(self, graph: str, *args: str):
+        for diagram_type in ('plantuml', 'mermaid'):
+            with self.subTest((graph, diagram_type)):
+                expect = list(umlstate.generate(cli.parse_args(['-t', diagram_type, *args])))
+                result = list(umlstate.generate(cli.parse_args(['-t', diagram_type, '--from-graph', graph])))
+                self.assertEqual(result, expect)
+
+    def test_json(self):
+        for playbook in sorted(glob.glob(os.path.join(self.BASE_DIR, '*.yml'))):
+            self.assertSameDiagrams(self.write_graph('json', playbook), playbook)
+
+    @unittest.skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack(self):
+        for playbook in sorted(glob.glob(os.path.join(self.BASE_DIR, '*.yml'))):
+            self.assertSameDiagrams(self.write_graph('msgpack', playbook, compress=True), playbook)
+
+    def test_options(self):
+        '''The role mode and the summaries are kept in the graph'''
+        cases = [
+            ('-R', 'role_1', self.BASE_DIR),
+            ('--collapse-roles', os.path.join(self.BASE_DIR, 'book_5_role.yml')),
+            ('--max-depth', '1', os.path.join(self.BASE_DIR, 'book_3_block_nested.yml')),
+            ('--parser', 'fast', os.path.join(self.BASE_DIR, 'book_4_import_role.yml')),
+        ]
+        for args in cases:
+            self.assertSameDiagrams(self.write_graph('json', *args, compress=True), *args)
+
+    def test_records(self):
+        path = self.write_graph('json', os.path.join(self.BASE_DIR, 'book_9_until_and_retry.yml'))
+        with open(path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records, list(read_records(path)))
+        self.assertEqual(records[0]['format'], 'playbook2uml-graph')
+        self.assertEqual(records[-1], {'type': 'end', 'plays': 1})
+        tasks = {record['id']: record for record in records if record['type'] == 'task'}
+        self.assertEqual(tasks['task_1']['parent'], 'play_1')
+        self.assertEqual(tasks['task_1']['section'], 'tasks')
+        self.assertEqual(tasks['task_1']['end'], 'task_1_until')
+        transitions = [(record['from'], record['to'], record['label']) for record in records if record['type'] == 'transition']
+        self.assertIn(('[*]', 'task_1', None), transitions)
+        self.assertIn(('task_1_until', 'task_1', 'retry'), transitions)
+
+    def test_roles(self):
+        path = self.write_graph('json', os.path.join(self.BASE_DIR, 'book_5_role.yml'))
+        records = list(read_records(path))
+        roles = [record for record in records if record['type'] == 'role']
+        self.assertEqual([(role['name'], role['parent']) for role in roles], [('role_1', 'play_1')])
+        self.assertTrue(any(record.get('parent') == roles[0]['id'] for record in records))
+
+    def test_incremental(self):
+        '''A play is built when its records are read, before the records of the next play'''
+        path = self.write_graph('json', os.path.join(self.BASE_DIR, 'book_8_multi_plays.yml'))
+        build_play = mock.patch.object(graph._GraphBuilder, 'build_play', autospec=True,
+                                       side_effect=graph._GraphBuilder.build_play).start()
+        self.addCleanup(mock.patch.stopall)
+        built = []
+        def records(path):
+            plays = 0
+            for record in read_records(path):
+                built.append((plays, build_play.call_count))
+                plays += record['type'] == 'play'
+                yield record
+        with mock.patch.object(graph, 'read_records', records):
+            umlplaybook = umlstate.load(cli.parse_args(['-t', 'plantuml', '--from-graph', path]))
+        self.assertEqual(len(umlplaybook.plays), 3)
+        self.assertEqual(build_play.call_count, 3)
+        self.assertTrue(all(count >= plays - 1 for plays, count in built), built)
+        self.assertEqual(built[-1], (3, 2))
+
+    def test_invalid(self):
+        path = os.path.join(self.tmp.name, 'invalid.jsonl')
+        with open(path, 'w') as f:
+            f.write('{"type": "play"}\n')
+        with self.assertRaises(ValueError):
+            umlstate.load(cli.parse_args(['--from-graph', path]))
+        with gzip.open(path, 'wt') as f:
+            f.write('{"type": "graph", "format": "playbook2uml-graph", "version": 99}\n')
+        with self.assertRaises(ValueError):
+            umlstate.load(cli.parse_args(['--from-graph', path]))
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                cli.parse_args(['--from-graph', '-R', 'role_1', self.BASE_DIR])
+            with self.assertRaises(SystemExit):
+                cli.parse_args(['-t', 'json', '--split', self.tmp.name, os.path.join(self.BASE_DIR, 'book_1.yml')])
+        with self.assertRaises(ValueError):
+            split.split_files(umlstate.load(cli.parse_args(['-t', 'json', os.path.join(self.BASE_DIR, 'book_1.yml')])), '.jsonl')
@@ -0,0 +1,88 @@
+import unittest
+import os
+import subprocess
+import sys
+import tempfile
+
+class Test_Lazy_Import(unittest.TestCase):
+    '''ansible-core must be imported only when a playbook is actually parsed
+    '''
+    RUN_CLI = '''
+import runpy, sys
+sys.argv = ['playbook2uml', *sys.argv[1:]]
+try:
+    runpy.run_module('playbook2uml', run_name='__main__')
+except SystemExit:
+    pass
+'''
+    PRINT_ANSIBLE_LOADED = '''
+print('ANSIBLE_LOADED=%s' % any(name == 'ansible' or name.startswith('ansible.') for name in sys.modules), file=sys.stderr)
+'''
+
+    def run_python(self, code: str, *args: str) -> bool:
+        '''
+        Run the code in a new interpreter, returns whether ansible was imported
+        '''
+        result = subprocess.run([sys.executable, '-c', code + self.PRINT_ANSIBLE_LOADED, *args],
+                                capture_output=True, text=True)
+        self.assertIn('ANSIBLE_LOADED=', result.stderr)
+        return 'ANSIBLE_LOADED=True' in result.stderr
+
+    def test_import_modules(self):
+        code = 'import sys, playbook2uml.cli, playbook2uml.batch, playbook2uml.umlstate.plantuml, playbook2uml.umlstate.mermaid'
+        self.assertFalse(self.run_python(code))
+
+    def test_help(self):
+        self.assertFalse(self.run_python(self.RUN_CLI, '--help'))
+        self.assertFalse(self.run_python(self.RUN_CLI, 'batch', '--help'))
+
+    def test_argument_error(self):
+        self.assertFalse(self.run_python(self.RUN_CLI, 'no/such/playbook.yml'))
+        self.assertFalse(self.run_python(self.RUN_CLI, '--type', 'unknown', 'test_playbook/book_1.yml'))
+
+    def test_parse_playbook(self):
+        self.assertTrue(self.run_python(self.RUN_CLI, 'test_playbook/book_1.yml'))
+
+    def test_cache_hit(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            args = ('--cache-dir', cache_dir, 'test_playbook/book_5_role.yml')
+            self.assertTrue(self.run_python(self.RUN_CLI, *args))
+            self.assertFalse(self.run_python(self.RUN_CLI, *args))
+
+    def test_fast_parser(self):
+        self.assertFalse(self.run_python(self.RUN_CLI, '--parser', 'fast', 'test_playbook/book_4_import_role.yml'))
+        self.assertFalse(self.run_python(self.RUN_CLI, '--parser', 'fast', '-R', 'role_1', 'test_playbook'))
+
+    def test_from_graph(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            graph = os.path.join(tmp, 'book_5_role.jsonl')
+            self.assertTrue(self.run_python(self.RUN_CLI, '-t', 'json', '-o', graph, 'test_playbook/book_5_role.yml'))
+            self.assertFalse(self.run_python(self.RUN_CLI, '--from-graph', graph))
+
+    def test_from_graph_without_ansible(self):
+        '''Rendering from a graph works when ansible-core and PyYAML are not installed'''
+        block_imports = '''
+import importlib.abc
+class Blocker(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path=None, target=None):
+        if name.split('.')[0] in ('ansible', 'yaml'):
+            raise ModuleNotFoundError(name)
+sys.meta_path.insert(0, Blocker())
+'''
+        with tempfile.TemporaryDirectory() as tmp:
+            graph = os.path.join(tmp, 'book_5_role.jsonl')
+            self.run_python(self.RUN_CLI, '-t', 'json', '-o', graph, 'test_playbook/book_5_role.yml')
+            for diagram_type in ('plantuml', 'mermaid'):
+                result = subprocess.run([sys.executable, '-c', 'import sys' + block_imports + self.RUN_CLI,
+                                         '-t', diagram_type, '--from-graph', graph],
+                                        capture_output=True, text=True)
+                self.assertEqual(result.stderr, '')
+                self.assertIn('role_1', result.stdout)
+            with self.subTest('ansible parser'):
+                result = subprocess.run([sys.executable, '-c', 'import sys' + block_imports.replace("'yaml'", "") + self.RUN_CLI,
+                                         'test_playbook/book_5_role.yml'], capture_output=True, text=True)
+                self.assertIn("pip install 'playbook2uml[ansible]'", result.stderr)
+                result = subprocess.run([sys.executable, '-c', 'import sys' + block_imports.replace("'yaml'", "") + self.RUN_CLI,
+                                         '--parser', 'fast', 'test_playbook/book_5_role.yml'], capture_output=True, text=True)
+                self.assertEqual(result.stderr, '')
+                self.assertIn('role_1', result.stdout)
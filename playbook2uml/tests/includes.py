@@ -0,0 +1,133 @@
+import unittest
+import os
+import tempfile
+import textwrap
+from unittest import mock
+import playbook2uml.cli as cli
+import playbook2uml.fastparser as fastparser
+import playbook2uml.umlstate as umlstate
+
+FILES = {
+    'site.yml': '''
+        - hosts: all
+          tasks:
+            - include_tasks: a.yml
+            - name: named include
+              include_tasks:
+                file: a.yml
+              when: x
+            - include_role:
+                name: r1
+                tasks_from: other
+            - include_tasks: "{{ target }}.yml"
+            - include_tasks: missing.yml
+        ''',
+    'a.yml': '''
+        - name: a task
+          debug: msg=a
+        ''',
+    'roles/r1/tasks/main.yml': '''
+        - name: r1 main
+          ping:
+        ''',
+    'roles/r1/tasks/other.yml': '''
+        - name: r1 other
+          ping:
+        - include_tasks: nested.yml
+        ''',
+    'roles/r1/tasks/nested.yml': '''
+        - name: r1 nested
+          debug: msg=nested
+        ''',
+    'cycle.yml': '''
+        - hosts: all
+          tasks:
+            - include_tasks: b.yml
+        ''',
+    'b.yml': '''
+        - name: b task
+          ping:
+        - include_tasks: c.yml
+        ''',
+    'c.yml': '''
+        - name: c task
+          ping:
+        - include_tasks: b.yml
+        ''',
+}
+
+class Test_Includes(unittest.TestCase):
+    '''Static resolution of the includes
+    `--resolve-includes` expands `include_tasks`/`include_role` with literal targets into blocks.
+    '''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        for name, content in FILES.items():
+            self.write(name, content)
+
+    def write(self, name: str, content: str) -> str:
+        path = os.path.join(self.tmp.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(textwrap.dedent(content))
+        return path
+
+    def load(self, name: str, *args: str):
+        return umlstate.load(cli.parse_args(['--no-role-cache', *args, os.path.join(self.tmp.name, name)]))
+
+    def names(self, states) -> list:
+        result = []
+        for state in states:
+            if hasattr(state, 'block'):
+                result.append((state.block.name, self.names(state.tasks)))
+            else:
+                result.append(state.task.get_name())
+        return result
+
+    def test_not_resolved(self):
+        play = self.load('site.yml').plays[0]
+        self.assertEqual(self.names(play.tasks), ['include_tasks', 'named include', 'include_role : r1', 'include_tasks', 'include_tasks'])
+
+    def test_resolved(self):
+        for parser in ('ansible', 'fast'):
+            with self.subTest(parser), self.assertLogs('playbook2uml.includes', 'WARNING') as logs:
+                umlplaybook = self.load('site.yml', '--parser', parser, '--resolve-includes')
+                self.assertEqual(len(logs.records), 1)
+                tasks = umlplaybook.plays[0].tasks
+                self.assertEqual(self.names(tasks), [
+                    ('include_tasks: a.yml', ['a task']),
+                    ('named include', ['a task']),
+                    ('include_role: r1', ['r1 : r1 other', ('include_tasks: nested.yml', ['r1 : r1 nested'])]),
+                    'include_tasks',
+                    'include_tasks',
+                ])
+                self.assertEqual(list(tasks[1].tasks[0].task.when), ['x'])
+                stats = umlplaybook.context.includes.stats
+                self.assertEqual((stats['resolved'], stats['dynamic'], stats['missing']), (4, 1, 1))
+
+    def test_parsed_once(self):
+        '''A file included many times is parsed once'''
+        self.write('many.yml', '- hosts: all\n  tasks:\n' + '    - include_tasks: a.yml\n' * 200)
+        for parser in ('ansible', 'fast'):
+            with self.subTest(parser), mock.patch.object(fastparser, 'load_yaml', wraps=fastparser.load_yaml) as load_yaml:
+                umlplaybook = self.load('many.yml', '--parser', parser, '--resolve-includes')
+                self.assertEqual(len(umlplaybook.plays[0].tasks), 200)
+                loaded = [call.args[0] for call in load_yaml.call_args_list]
+                self.assertEqual(loaded.count(os.path.join(self.tmp.name, 'a.yml')), 1)
+
+    def test_cycle(self):
+        for parser in ('ansible', 'fast'):
+            with self.subTest(parser), self.assertLogs('playbook2uml.includes', 'WARNING'):
+                umlplaybook = self.load('cycle.yml', '--parser', parser, '--resolve-includes')
+                self.assertEqual(self.names(umlplaybook.plays[0].tasks), [
+                    ('include_tasks: b.yml', ['b task', ('include_tasks: c.yml', ['c task', 'include_tasks'])]),
+                ])
+                self.assertEqual(umlplaybook.context.includes.stats['cycles'], 1)
+
+    def test_depth(self):
+        umlplaybook = self.load('cycle.yml', '--resolve-includes', '--include-depth', '1')
+        self.assertEqual(self.names(umlplaybook.plays[0].tasks), [('include_tasks: b.yml', ['b task', 'include_tasks'])])
+        self.assertEqual(umlplaybook.context.includes.stats['too_deep'], 1)
+        umlplaybook = self.load('cycle.yml', '--resolve-includes', '--include-depth', '0')
+        self.assertEqual(self.names(umlplaybook.plays[0].tasks), ['include_tasks'])
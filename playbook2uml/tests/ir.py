@@ -0,0 +1,65 @@
+import unittest
+import gc
+import weakref
+from ansible.playbook.play import Play
+from ansible.playbook import Playbook
+from ansible.parsing.dataloader import DataLoader
+from ansible.vars.manager import VariableManager
+import playbook2uml.cli as cli
+import playbook2uml.umlstate as umlstate
+import playbook2uml.umlstate.plantuml as plantuml
+from playbook2uml.umlstate.ir import to_plain
+
+def walk(states):
+    for state in states:
+        yield state
+        if isinstance(state, plantuml.UMLStatePlay):
+            yield from walk(state.get_all_tasks())
+        elif isinstance(state, plantuml.UMLStateBlock):
+            yield from walk(state.tasks + state.always + state.rescue)
+
+class Test_IR(unittest.TestCase):
+    '''The states hold compact records of plain values, not the Ansible objects
+    '''
+    def test_slots(self):
+        book = umlstate.load(cli.parse_args(['test_playbook/book_3_block_nested.yml']))
+        states = list(walk(book.plays))
+        self.assertTrue(states)
+        for state in states:
+            with self.subTest(state=str(state)):
+                self.assertFalse(hasattr(state, '__dict__'))
+                record = getattr(state, 'task', None) or getattr(state, 'block', None) or state.play
+                self.assertFalse(hasattr(record, '__dict__'))
+
+    def test_plain_values(self):
+        book = umlstate.load(cli.parse_args(['test_playbook/book_7_loop_and_when.yml']))
+        for state in walk(book.plays):
+            if isinstance(state, plantuml.UMLStateTask):
+                self.assertIs(type(state.task.action), str)
+                for key, value in state.task.args.items():
+                    self.assertIs(type(key), str)
+                for when in state.when:
+                    self.assertIn(type(when), (str, bool))
+
+    def test_release(self):
+        dataloader = DataLoader()
+        variable_manager = VariableManager(loader=dataloader)
+        pb = Playbook(loader=dataloader)
+        play = Play.load({'hosts': 'localhost', 'tasks': [{'ping': None}]},
+                         variable_manager=variable_manager, loader=pb._loader, vars=None)
+        umlplay = plantuml.UMLStatePlay(play)
+        play_ref = weakref.ref(play)
+        task_ref = weakref.ref(play.tasks[0].block[0])
+        del play
+        gc.collect()
+        self.assertIsNone(play_ref())
+        self.assertIsNone(task_ref())
+        self.assertEqual(umlplay.tasks[0].task.action, 'ping')
+
+    def test_to_plain(self):
+        class Tagged(str):
+            pass
+        value = to_plain({Tagged('a'): [Tagged('b'), 1, None, (Tagged('c'),)]})
+        self.assertEqual(value, {'a': ['b', 1, None, ['c']]})
+        self.assertIs(type(next(iter(value))), str)
+        self.assertIs(type(value['a'][0]), str)
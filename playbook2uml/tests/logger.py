@@ -0,0 +1,33 @@
+import unittest
+import logging
+from unittest import mock
+import playbook2uml.cli as cli
+import playbook2uml.logger as umlLogger
+import playbook2uml.umlstate as umlstate
+from playbook2uml.umlstate.base import UMLStateBase
+
+class Test_Logger(unittest.TestCase):
+    def test_handler_once(self):
+        name = 'playbook2uml.tests.logger.test_handler_once'
+        logger = umlLogger.getLogger(name)
+        for verbose in (0, 1, 2, 0):
+            self.assertIs(umlLogger.getLogger(name, verbose), logger)
+        self.assertEqual(len(logger.handlers), 1)
+        self.assertEqual(logger.level, logging.WARNING)
+
+    def test_keep_other_handlers(self):
+        name = 'playbook2uml.tests.logger.test_keep_other_handlers'
+        other = logging.NullHandler()
+        logging.getLogger(name).addHandler(other)
+        logger = umlLogger.getLogger(name)
+        umlLogger.getLogger(name)
+        self.assertEqual(len(logger.handlers), 2)
+        self.assertIn(other, logger.handlers)
+
+    def test_lazy(self):
+        '''The states are not formatted when DEBUG is disabled'''
+        args = cli.parse_args(['--parser', 'fast', 'test_playbook/book_3_block_nested.yml'])
+        with mock.patch.object(UMLStateBase, '__str__', autospec=True, return_value='state') as to_str:
+            lines = list(umlstate.load(args).generate())
+        self.assertTrue(lines)
+        to_str.assert_not_called()
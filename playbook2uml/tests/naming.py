@@ -0,0 +1,116 @@
+import unittest
+import glob
+import os
+import re
+import tempfile
+import playbook2uml.cli as cli
+import playbook2uml.umlstate as umlstate
+from playbook2uml.umlstate.naming import stable_name, walk_paths
+
+PLAYBOOK = '''
+- name: site
+  hosts: all
+  roles:
+    - role_1
+  tasks:
+    - name: install
+      apt: name=nginx
+      when: install
+    - name: group
+      block:
+        - name: inner
+          debug: msg=x
+          until: done
+      rescue:
+        - name: report
+          debug: msg=fail
+'''
+
+NAME = re.compile(r'\b((?:task|block|play|role)_[0-9a-f]+)')
+
+def normalize(lines: list) -> list:
+    '''Replace the names of the states by their order of appearance'''
+    names = {}
+    return [NAME.sub(lambda m: names.setdefault(m.group(1), 'S%d' % len(names)), line) for line in lines]
+
+class Test_StableIds(unittest.TestCase):
+    '''Stable names
+    With `--stable-ids`, the states are named by the hashes of their paths.
+    '''
+    BASE_DIR = 'test_playbook'
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        os.symlink(os.path.abspath(os.path.join(self.BASE_DIR, 'roles')), os.path.join(self.tmp.name, 'roles'))
+
+    def generate(self, content: str, *args: str) -> list:
+        path = os.path.join(self.tmp.name, 'site.yml')
+        with open(path, 'w') as f:
+            f.write(content)
+        return list(umlstate.generate(cli.parse_args([*args, path])))
+
+    def test_same_diagrams(self):
+        '''Only the names differ from the diagrams named by the counters'''
+        for book_file in sorted(glob.glob(os.path.join(self.BASE_DIR, '*.yml'))):
+            for diagram_type in ('plantuml', 'mermaid'):
+                with self.subTest((book_file, diagram_type)):
+                    expect = list(umlstate.generate(cli.parse_args(['-t', diagram_type, book_file])))
+                    result = list(umlstate.generate(cli.parse_args(['-t', diagram_type, '--stable-ids', book_file])))
+                    self.assertNotEqual(result, expect)
+                    self.assertEqual(normalize(result), normalize(expect))
+
+    def test_inserted(self):
+        '''Inserting a task keeps the lines of the other states'''
+        old = self.generate(PLAYBOOK, '--stable-ids')
+        new = self.generate(PLAYBOOK.replace('  tasks:\n', '  tasks:\n    - name: first\n      ping:\n'), '--stable-ids')
+        self.assertEqual(self.generate(PLAYBOOK, '--stable-ids', '--parser', 'fast'), old)
+        definitions = [line for line in old if ' --> ' not in line]
+        self.assertTrue(all(line in new for line in definitions))
+        added = [line for line in new if line not in old and ' --> ' not in line]
+        self.assertEqual(len(added), 2)
+        self.assertIn('"== first"', added[0])
+        self.assertIn('Action **ping**', added[1])
+        # counters rename the states after the inserted task
+        old = self.generate(PLAYBOOK)
+        new = self.generate(PLAYBOOK.replace('  tasks:\n', '  tasks:\n    - name: first\n      ping:\n'))
+        self.assertFalse(all(line in new for line in old if ' --> ' not in line))
+
+    def test_paths(self):
+        path = os.path.join(self.tmp.name, 'site.yml')
+        with open(path, 'w') as f:
+            f.write(PLAYBOOK + PLAYBOOK)
+        umlplaybook = umlstate.load(cli.parse_args(['--stable-ids', path]))
+        paths = [path for path, _ in walk_paths(umlplaybook.plays)]
+        self.assertEqual(paths[:7], [
+            'site',
+            'site/roles/role_1/role_1 : Role Start (debug)',
+            'site/roles/role_1/role_1 : Role End (debug)',
+            'site/tasks/install (apt)',
+            'site/tasks/block:group',
+            'site/tasks/block:group/inner (debug)',
+            'site/tasks/block:group/rescue/report (debug)',
+        ])
+        self.assertEqual(paths[7], 'site #2')
+        names = [state.name for _, state in walk_paths(umlplaybook.plays)]
+        self.assertEqual(len(set(names)), len(names))
+
+    def test_collision(self):
+        used = set()
+        for _ in range(12):
+            used.add(stable_name('task', 'site/tasks/a (ping)', used))
+        self.assertEqual(len(used), 12)
+        self.assertIn(stable_name('task', 'site/tasks/a (ping)', set()), used)
+        self.assertEqual(len({len(name) for name in used}), 9 + 1)
+
+    def test_graph(self):
+        '''The names are kept in the state graph'''
+        path = os.path.join(self.tmp.name, 'site.yml')
+        with open(path, 'w') as f:
+            f.write(PLAYBOOK)
+        graph = os.path.join(self.tmp.name, 'site.jsonl')
+        with open(graph, 'w') as f:
+            for line in umlstate.generate(cli.parse_args(['-t', 'json', '--stable-ids', path])):
+                f.write(line + '\n')
+        self.assertEqual(list(umlstate.generate(cli.parse_args(['--from-graph', graph]))),
+                         self.generate(PLAYBOOK, '--stable-ids'))
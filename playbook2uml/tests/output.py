@@ -0,0 +1,83 @@
+import unittest
+import gzip
+import io
+import os.path
+import tempfile
+import playbook2uml.cli as cli
+import playbook2uml.output as output
+
+class Test_Output(unittest.TestCase):
+    '''Buffered output writer
+    '''
+    def test_write_lines(self):
+        for count in (0, 1, output.CHUNK_LINES, output.CHUNK_LINES * 2 + 1):
+            with self.subTest(count):
+                lines = ['line %d' % i for i in range(count)]
+                stream = io.StringIO()
+                output.write_lines(iter(lines), stream)
+                self.assertEqual(stream.getvalue(), ''.join(line + '\n' for line in lines))
+
+    def test_open_output(self):
+        lines = ['@startuml', 'state "== あ" as task_1', '@enduml']
+        expected = ''.join(line + '\n' for line in lines).encode('utf-8')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with self.subTest('file'):
+                path = os.path.join(tmp_dir, 'out.puml')
+                with output.open_output(path) as stream:
+                    output.write_lines(lines, stream)
+                with open(path, 'rb') as f:
+                    self.assertEqual(f.read(), expected)
+                # the mode of a file created by open()
+                reference = os.path.join(tmp_dir, 'reference')
+                open(reference, 'w').close()
+                self.assertEqual(os.stat(path).st_mode, os.stat(reference).st_mode)
+                self.assertEqual(sorted(os.listdir(tmp_dir)), ['out.puml', 'reference'])
+                os.unlink(reference)
+
+            with self.subTest('gzip'):
+                path = os.path.join(tmp_dir, 'out.puml.gz')
+                with output.open_output(path, compress=True) as stream:
+                    output.write_lines(lines, stream)
+                with gzip.open(path, 'rb') as f:
+                    self.assertEqual(f.read(), expected)
+
+                # reproducible
+                with open(path, 'rb') as f:
+                    data = f.read()
+                with output.open_output(path, compress=True) as stream:
+                    output.write_lines(lines, stream)
+                with open(path, 'rb') as f:
+                    self.assertEqual(f.read(), data)
+
+    def test_failed(self):
+        '''An error while writing keeps the previous file
+        '''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'out.puml')
+            with open(path, 'w') as f:
+                f.write('@startuml\n@enduml\n')
+            with self.assertRaises(ValueError):
+                with output.open_output(path) as stream:
+                    stream.write('@startuml\n')
+                    raise ValueError('broken playbook')
+            with open(path) as f:
+                self.assertEqual(f.read(), '@startuml\n@enduml\n')
+            self.assertEqual(os.listdir(tmp_dir), ['out.puml'])
+
+            with self.subTest('cli'):
+                playbook = os.path.join(tmp_dir, 'broken.yml')
+                with open(playbook, 'w') as f:
+                    f.write('- hosts: all\n  tasks: [\n')
+                with self.assertRaises(Exception):
+                    cli.main(['-o', path, playbook])
+                with open(path) as f:
+                    self.assertEqual(f.read(), '@startuml\n@enduml\n')
+                self.assertEqual(sorted(os.listdir(tmp_dir)), ['broken.yml', 'out.puml'])
+
+    def test_args(self):
+        args = cli.parse_args(['test_playbook/book_1.yml'])
+        self.assertEqual(args.output, '-')
+        self.assertFalse(args.gzip)
+        args = cli.parse_args(['-o', 'out.puml.gz', '--gzip', 'test_playbook/book_1.yml'])
+        self.assertEqual(args.output, 'out.puml.gz')
+        self.assertTrue(args.gzip)
@@ -1,4 +1,5 @@
 import unittest
+import unittest.mock
 import re
 from ansible.playbook.play import Play
 from ansible.playbook import Playbook
@@ -16,7 +17,6 @@ class Test_PlantUML_Play(unittest.TestCase):
         pb = Playbook(loader=dataloader)
         play = Play.load(play_data, variable_manager=variable_manager, loader=pb._loader, vars=None)
 
-        plantuml.UMLStatePlay.ID = 1
         return plantuml.UMLStatePlay(play)
 
     def test_defaults(self):
@@ -76,3 +76,21 @@ class Test_PlantUML_Play(unittest.TestCase):
         })
         play_def = tuple(umlplay.generateDefinition())
         self.assertIn('    play_1 : | serial | 2 |', play_def)
+
+    def test_nested_points(self):
+        '''
+        The entry and end points of nested blocks are resolved when loaded,
+        not by walking the nested blocks on every relation
+        '''
+        nested = { 'ping': None, 'when': 'first' }
+        for depth in range(5):
+            nested = { 'name': f'block {depth}', 'block': [ nested ], 'always': [ { 'ping': None } ] }
+        umlplay = self.create_play({
+            'hosts': 'localhost',
+            'tasks': [ nested, { 'ping': None } ]
+        })
+        self.assertEqual(umlplay.get_all_tasks(), umlplay.tasks)
+        with unittest.mock.patch.object(plantuml.UMLStateTask, 'get_entry_point_name', side_effect=AssertionError), \
+             unittest.mock.patch.object(plantuml.UMLStateTask, 'get_end_point_name', side_effect=AssertionError):
+            self.assertEqual(umlplay.get_entry_point_name(), 'task_1_when')
+            self.assertEqual(umlplay.tasks[0].get_end_point_name(), 'task_6')
@@ -0,0 +1,61 @@
+import unittest
+import json
+import os.path
+import pstats
+import subprocess
+import sys
+import tempfile
+import playbook2uml.cli as cli
+import playbook2uml.umlstate as umlstate
+from playbook2uml.profiling import Profiler, NULL_PROFILER
+
+class Test_Profiler(unittest.TestCase):
+    '''`--profile` records the phases of the rendering
+    '''
+    def phases(self, report: dict) -> dict:
+        return {phase['name']: phase for phase in report['phases']}
+
+    def test_api(self):
+        args = cli.parse_args(['test_playbook/book_5_role.yml'])
+        with Profiler() as profiler:
+            lines = list(umlstate.generate(args, profiler=profiler))
+        report = profiler.report()
+        phases = self.phases(report)
+        for name in ('parse', 'states', 'states/play_1', 'states/play_1/roles',
+                     'states/play_1/roles/role_1', 'states/play_1/tasks', 'generate/play_1/definitions'):
+            with self.subTest(name):
+                self.assertIn(name, phases)
+                self.assertGreater(phases[name]['count'], 0)
+                self.assertGreaterEqual(phases[name]['seconds'], 0)
+        self.assertGreaterEqual(phases['states']['peak_bytes'], phases['states/play_1']['peak_bytes'])
+        self.assertGreaterEqual(report['total_seconds'], phases['states']['seconds'])
+        self.assertListEqual(lines, list(umlstate.generate(args)))
+
+    def test_fast_parser(self):
+        args = cli.parse_args(['--parser', 'fast', 'test_playbook/book_5_role.yml'])
+        with Profiler(allocations=False) as profiler:
+            list(umlstate.generate(args, profiler=profiler))
+        phases = self.phases(profiler.report())
+        self.assertIn('states/play_1/roles/role_1', phases)
+        self.assertEqual(phases['parse']['allocated_bytes'], 0)
+
+    def test_null_profiler(self):
+        items = [1, 2]
+        self.assertIs(NULL_PROFILER.iterate('x', items), items)
+        with NULL_PROFILER.phase('x'):
+            pass
+        self.assertListEqual(NULL_PROFILER.report()['phases'], [])
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report_file = os.path.join(tmp_dir, 'profile.json')
+            stats_file = os.path.join(tmp_dir, 'profile.pstats')
+            result = subprocess.run([sys.executable, '-m', 'playbook2uml', '--profile', report_file,
+                                     '--profile-stats', stats_file, 'test_playbook/book_1.yml'],
+                                    capture_output=True, text=True, check=True)
+            self.assertTrue(result.stdout.startswith('@startuml'))
+            with open(report_file) as f:
+                phases = self.phases(json.load(f))
+            for name in ('import', 'init_plugin_loader', 'parse', 'states', 'generate'):
+                self.assertIn(name, phases)
+            self.assertGreater(pstats.Stats(stats_file).total_calls, 0)
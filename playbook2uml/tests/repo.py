@@ -0,0 +1,105 @@
+import unittest
+import contextlib
+import io
+import json
+import os
+import tempfile
+import textwrap
+import playbook2uml.cli as cli
+import playbook2uml.repo as repo
+
+FILES = {
+    'site.yml': '''
+        - import_playbook: playbooks/web/web.yml
+        - hosts: all
+          roles: [common]
+        ''',
+    'playbooks/web/web.yml': '''
+        - hosts: web
+          roles:
+            - common
+          tasks:
+            - name: web
+              ping:
+        ''',
+    'playbooks/db.yml': '''
+        - hosts: db
+          roles: [common]
+        ''',
+    'playbooks/broken.yml': '''
+        - hosts: x
+          roles: [missing_role]
+        ''',
+    'playbooks/tasks_only.yml': '''
+        - name: not a playbook
+          ping:
+        ''',
+    'playbooks/hosts_in_vars.yml': '''
+        hosts: [a, b]
+        ''',
+    'roles/common/tasks/main.yml': '''
+        - name: common task
+          ping:
+        ''',
+    'group_vars/all.yml': '''
+        - hosts: not walked
+        ''',
+    '.github/workflows/ci.yml': '''
+        - hosts: not walked
+        ''',
+}
+
+class Test_Repo(unittest.TestCase):
+    '''Whole-repository mode
+    The playbooks of a repository are found and rendered with the layout of the repository.
+    '''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.repo_dir = os.path.join(self.tmp.name, 'repo')
+        self.output_dir = os.path.join(self.tmp.name, 'diagrams')
+        for name, content in FILES.items():
+            path = os.path.join(self.repo_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(textwrap.dedent(content))
+
+    def relative(self, paths) -> list:
+        return [os.path.relpath(path, self.repo_dir) for path in paths]
+
+    def test_find_playbooks(self):
+        self.assertEqual(self.relative(repo.find_playbooks(self.repo_dir)),
+                         ['site.yml', 'playbooks/broken.yml', 'playbooks/db.yml', 'playbooks/web/web.yml'])
+        self.assertEqual(self.relative(repo.find_playbooks(self.repo_dir, include=['playbooks/*'], exclude=['*/broken.yml'])),
+                         ['playbooks/db.yml', 'playbooks/web/web.yml'])
+
+    def test_render(self):
+        for parser in ('ansible', 'fast'):
+            with self.subTest(parser), contextlib.redirect_stderr(io.StringIO()) as stderr:
+                output_dir = os.path.join(self.output_dir, parser)
+                status = cli.batch_main(['--parser', parser, '-o', output_dir, '--repo', self.repo_dir])
+                self.assertEqual(status, 1)
+                self.assertIn('playbooks/broken.yml', stderr.getvalue())
+                for name in ('site.puml', 'playbooks/db.puml', 'playbooks/web/web.puml'):
+                    with open(os.path.join(output_dir, name)) as f:
+                        self.assertIn('    state "== common : common task" as task_1', f.read().splitlines())
+                with open(os.path.join(output_dir, repo.SUMMARY_FILE)) as f:
+                    summary = json.load(f)
+                self.assertEqual((summary['playbooks'], summary['succeeded'], summary['failed']), (4, 3, 1))
+                self.assertEqual(self.relative(failure['source'] for failure in summary['failures']), ['playbooks/broken.yml'])
+                self.assertTrue(all(result['seconds'] >= 0 for result in summary['results']))
+        self.assertNotIn(os.path.join(self.repo_dir, 'roles'), os.environ.get('ANSIBLE_ROLES_PATH', ''))
+
+    def test_exclude(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            status = cli.batch_main(['--parser', 'fast', '-o', self.output_dir, '--repo', self.repo_dir, '--exclude', '*/broken.yml'])
+        self.assertEqual(status, 0)
+
+    def test_invalid(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                cli.parse_batch_args(['-o', self.output_dir, '--repo', os.path.join(self.repo_dir, 'site.yml')])
+            with self.assertRaises(SystemExit):
+                cli.parse_batch_args(['-o', self.output_dir, '--repo', self.repo_dir, 'site.yml'])
+            with self.assertRaises(SystemExit):
+                cli.parse_batch_args(['-o', self.output_dir, '--include', '*.yml', 'site.yml'])
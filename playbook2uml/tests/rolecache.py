@@ -0,0 +1,175 @@
+import unittest
+import os
+import tempfile
+from unittest import mock
+import playbook2uml.cli as cli
+import playbook2uml.umlstate as umlstate
+import playbook2uml.umlstate.extract as extract
+from playbook2uml.umlstate.rolecache import ROLE_CACHE, RoleCache, RoleKey
+
+PLAYBOOK = '''\
+- name: play 1
+  hosts: localhost
+  roles:
+    - common
+- name: play 2
+  hosts: localhost
+  roles:
+    - common
+  tasks:
+    - name: own task
+      debug: msg=own
+- name: play 3
+  hosts: localhost
+  roles:
+    - role: common
+      when: enabled
+'''
+
+ROLE_TASKS = '''\
+- name: first
+  debug: msg=first
+- name: nested
+  block:
+    - name: second
+      debug: msg=second
+      until: done
+  always:
+    - name: third
+      debug: msg=third
+'''
+
+def write(path: str, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+class Test_RoleCache(unittest.TestCase):
+    '''Role cache
+    The states of a role are created from the cache with their own IDs,
+    the diagrams are the same as without the cache.
+    '''
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.playbook = os.path.join(self.tmp.name, 'site.yml')
+        self.role_file = os.path.join(self.tmp.name, 'roles', 'common', 'tasks', 'main.yml')
+        write(self.playbook, PLAYBOOK)
+        write(self.role_file, ROLE_TASKS)
+        ROLE_CACHE.clear()
+        self.addCleanup(ROLE_CACHE.clear)
+
+    def load(self, *args: str):
+        option = cli.parse_args([*args, self.playbook])
+        return umlstate.load(option)
+
+    def generate(self, *args: str) -> list[str]:
+        return list(self.load(*args).generate())
+
+    def test_same_diagram(self):
+        for parser in ('ansible', 'fast'):
+            for diagram_type in ('plantuml', 'mermaid'):
+                with self.subTest((parser, diagram_type)):
+                    args = ('--parser', parser, '-t', diagram_type)
+                    expect = self.generate(*args, '--no-role-cache')
+                    self.assertEqual(self.generate(*args), expect)
+                    # from the cache only
+                    self.assertEqual(self.generate(*args), expect)
+
+    def test_hits(self):
+        for parser in ('ansible', 'fast'):
+            with self.subTest(parser):
+                ROLE_CACHE.clear()
+                book = self.load('--parser', parser)
+                # stored from the second use, play 3 inherits `when`, it is another entry
+                self.assertEqual(book.context.stats['role_cache_hits'], 0)
+                self.assertEqual(book.context.stats['role_cache_misses'], 3)
+                self.assertEqual(len(ROLE_CACHE), 1)
+                book = self.load('--parser', parser)
+                self.assertEqual(book.context.stats['role_cache_hits'], 2)
+                self.assertEqual(book.context.stats['role_cache_misses'], 1)
+                book = self.load('--parser', parser)
+                self.assertEqual(book.context.stats['role_cache_hits'], 3)
+                self.assertEqual(book.context.stats['role_cache_misses'], 0)
+                self.assertEqual(tuple(ROLE_CACHE.stats()), (5, 4))
+                self.assertAlmostEqual(ROLE_CACHE.stats().hit_rate, 5 / 9)
+
+    def test_ids(self):
+        book = self.load('--parser', 'fast')
+        names = [[state.name for state in play.roles] for play in book.plays]
+        self.assertEqual(names, [['task_1', 'block_1'], ['task_4', 'block_2'], ['task_8', 'block_3']])
+        self.assertEqual(book.plays[1].roles[1].get_end_point_name(), 'task_6')
+        self.assertEqual(book.plays[2].roles[0].get_entry_point_name(), 'task_8_when')
+
+    def test_not_read(self):
+        '''The fast parser does not read the task files of a cached role'''
+        self.load('--parser', 'fast')
+        self.load('--parser', 'fast')
+        book = umlstate.load(cli.parse_args(['--parser', 'fast', self.playbook]))
+        self.assertEqual(book.context.stats['role_cache_hits'], 3)
+        from playbook2uml.fastparser import load_plays
+        plays = load_plays(self.playbook, cli.parse_args(['--parser', 'fast', self.playbook]))
+        self.assertIsNone(plays[0].roles[0]._blocks)
+
+    def test_modified(self):
+        for parser in ('ansible', 'fast'):
+            with self.subTest(parser):
+                write(self.role_file, ROLE_TASKS)
+                self.load('--parser', parser)
+                stat = os.stat(self.role_file)
+                write(self.role_file, ROLE_TASKS.replace('first', 'changed'))
+                os.utime(self.role_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+                book = self.load('--parser', parser)
+                self.assertEqual(book.context.stats['role_cache_hits'], 1)
+                self.assertEqual(book.context.stats['role_cache_misses'], 2)
+                self.assertIn('common : changed', [state.task.name for state in book.plays[0].roles[:1]])
+
+    def test_imported(self):
+        '''A file imported from outside the role directory is checked'''
+        shared = os.path.join(self.tmp.name, 'shared', 'x.yml')
+        write(shared, '- name: shared\n  debug: msg=shared\n')
+        write(self.role_file, ROLE_TASKS + '- import_tasks: ../../../shared/x.yml\n')
+        for parser in ('ansible', 'fast'):
+            with self.subTest(parser):
+                write(shared, '- name: shared\n  debug: msg=shared\n')
+                book = self.load('--parser', parser)
+                self.assertIn('common : shared', [state.task.name for state in book.plays[0].roles[2:]])
+                stat = os.stat(shared)
+                write(shared, '- name: changed\n  debug: msg=changed\n')
+                os.utime(shared, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+                book = self.load('--parser', parser)
+                self.assertEqual(book.context.stats['role_cache_hits'], 1)
+                self.assertEqual(book.context.stats['role_cache_misses'], 2)
+                self.assertIn('common : changed', [state.task.name for state in book.plays[0].roles[2:]])
+
+        with self.subTest('template'):
+            ROLE_CACHE.clear()
+            write(self.playbook, '- hosts: localhost\n  vars:\n    shared: ../../../shared/x.yml\n  roles: [common, common]\n')
+            write(self.role_file, ROLE_TASKS + '- import_tasks: "{{ shared }}"\n')
+            book = self.load('--parser', 'ansible')
+            self.assertIn('common : changed', [state.task.name for state in book.plays[0].roles if hasattr(state, 'task')])
+            self.assertEqual(book.context.stats['role_cache_misses'], 2)
+            self.assertEqual(len(ROLE_CACHE), 0)
+
+    def test_once(self):
+        '''A role used once is not cached, the stats of its files are not read'''
+        write(self.playbook, '- hosts: localhost\n  roles: [common]\n')
+        with mock.patch.object(extract, 'role_files', wraps=extract.role_files) as role_files:
+            book = self.load('--parser', 'fast')
+        self.assertEqual(role_files.call_count, 0)
+        self.assertEqual(book.context.stats['role_cache_misses'], 1)
+        self.assertEqual(len(ROLE_CACHE), 0)
+        # the next rendering of the process stores it
+        self.load('--parser', 'fast')
+        self.assertEqual(len(ROLE_CACHE), 1)
+
+    def test_lru(self):
+        cache = RoleCache(max_entries=2)
+        keys = [RoleKey(f'/roles/{i}', 'main', str(i), '[]') for i in range(3)]
+        for key in keys:
+            cache.put(key, (), ())
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(keys[0], ()))
+        self.assertEqual(cache.get(keys[2], ()), ())
+        self.assertIsNone(cache.get(keys[2], (('/roles/2/tasks/main.yml', 1, 1),)))
@@ -0,0 +1,90 @@
+import unittest
+import json
+import os.path
+import threading
+import urllib.error
+import urllib.request
+from playbook2uml.server import RenderService, create_server
+
+class Test_Server(unittest.TestCase):
+    '''Render server
+    '''
+    BASE_DIR = 'test_playbook'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.service = RenderService(workers=2, timeout=30)
+        cls.httpd = create_server(cls.service, port=0)
+        cls.url = 'http://%s:%d' % cls.httpd.server_address[:2]
+        cls.thread = threading.Thread(target=cls.httpd.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        cls.service.shutdown()
+
+    def post(self, request: dict):
+        req = urllib.request.Request(self.url + '/render', data=json.dumps(request).encode(),
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req) as res:
+                return res.status, res.read().decode()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode()
+
+    def expect(self, file_name: str):
+        with open(os.path.join(self.BASE_DIR, 'expects', file_name), 'r') as f:
+            return f.read().strip().splitlines()
+
+    def test_playbook(self):
+        for file_name, diagram_type in (('book_2_block.puml', 'plantuml'), ('book_2_block.mmd', 'mermaid')):
+            with self.subTest(diagram_type):
+                status, body = self.post({'playbook': os.path.join(self.BASE_DIR, 'book_2_block.yml'), 'type': diagram_type})
+                self.assertEqual(status, 200)
+                self.assertListEqual(body.splitlines(), self.expect(file_name))
+
+    def test_get(self):
+        with urllib.request.urlopen(self.url + '/render?type=mermaid&playbook=' + os.path.join(self.BASE_DIR, 'book_1.yml')) as res:
+            self.assertListEqual(res.read().decode().splitlines(), self.expect('book_1.mmd'))
+        with urllib.request.urlopen(self.url + '/health') as res:
+            self.assertEqual(res.status, 200)
+
+    def test_inline_yaml(self):
+        with open(os.path.join(self.BASE_DIR, 'book_5_role.yml'), 'r') as f:
+            yaml = f.read()
+        status, body = self.post({'yaml': yaml, 'basedir': self.BASE_DIR})
+        self.assertEqual(status, 200)
+        self.assertListEqual(body.splitlines(), self.expect('book_5_role.puml'))
+        self.assertListEqual([name for name in os.listdir(self.BASE_DIR) if name.startswith('.playbook2uml-')], [])
+
+    def test_role(self):
+        status, body = self.post({'role': 'role_1', 'basedir': self.BASE_DIR, 'title': 'ROLE'})
+        self.assertEqual(status, 200)
+        self.assertIn('title ROLE', body.splitlines())
+        self.assertIn('state "== role_1 : Role Start" as task_1', body.splitlines())
+
+    def test_errors(self):
+        for request, expected_status in (
+            ({}, 400),
+            ({'playbook': 'no/such/file.yml'}, 400),
+            ({'playbook': os.path.join(self.BASE_DIR, 'book_1.yml'), 'type': 'svg'}, 400),
+            ({'yaml': '- hosts: all\n  tasks: 1\n'}, 422),
+        ):
+            with self.subTest(request):
+                status, _ = self.post(request)
+                self.assertEqual(status, expected_status)
+
+    def test_concurrent(self):
+        results = [None] * 8
+        def request(index):
+            results[index] = self.post({'playbook': os.path.join(self.BASE_DIR, 'book_3_block_nested.yml')})
+        threads = [threading.Thread(target=request, args=(i,)) for i in range(len(results))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for status, body in results:
+            self.assertEqual(status, 200)
+            self.assertListEqual(body.splitlines(), self.expect('book_3_block_nested.puml'))
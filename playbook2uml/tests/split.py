@@ -0,0 +1,117 @@
+import unittest
+import contextlib
+import gzip
+import io
+import os
+import tempfile
+import playbook2uml.cli as cli
+import playbook2uml.umlstate as umlstate
+import playbook2uml.split as split
+
+class Test_Split(unittest.TestCase):
+    '''Split output
+    One diagram per play (and per role) plus the index, from one load of the playbook.
+    '''
+    BASE_DIR = 'test_playbook'
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def read(self, path: str) -> list[str]:
+        with open(path) as f:
+            return f.read().splitlines()
+
+    def write_split(self, playbook: str, *args: str, **kwargs) -> tuple[object, list[str]]:
+        option = cli.parse_args([*args, '--split', self.tmp.name, os.path.join(self.BASE_DIR, playbook)])
+        umlplaybook = umlstate.load(option)
+        paths = split.write_split(umlplaybook, self.tmp.name, umlstate.FILE_EXTENSIONS[option.type], **kwargs)
+        return umlplaybook, [os.path.relpath(path, self.tmp.name) for path in paths]
+
+    def test_plays(self):
+        for diagram_type in ('plantuml', 'mermaid'):
+            with self.subTest(diagram_type):
+                ext = umlstate.FILE_EXTENSIONS[diagram_type]
+                umlplaybook, paths = self.write_split('book_8_multi_plays.yml', '-t', diagram_type)
+                self.assertEqual(paths, [f'play_1{ext}', f'play_2{ext}', f'play_3{ext}', f'index{ext}'])
+                whole = list(umlplaybook.generate())
+                for umlplay in umlplaybook.plays:
+                    lines = self.read(os.path.join(self.tmp.name, umlplay.name + ext))
+                    self.assertEqual(lines, list(umlplaybook.generate_plays([umlplay])))
+                    # the definitions are the same as in the whole diagram
+                    definitions = list(umlplay.generateDefinition(**({'level': 1} if diagram_type == 'mermaid' else {})))
+                    self.assertTrue(set(definitions) <= set(whole))
+
+    def test_workers(self):
+        '''The diagrams written by many threads are the same as by one thread, the subtree cache is not shared'''
+        playbook = os.path.join(self.tmp.name, 'site.yml')
+        os.symlink(os.path.abspath(os.path.join(self.BASE_DIR, 'roles')), os.path.join(self.tmp.name, 'roles'))
+        with open(playbook, 'w') as f:
+            f.write(''.join(f'- name: play {i}\n  hosts: all\n  roles: [role_1, role_1, role_1]\n' for i in range(20)))
+        for diagram_type in ('plantuml', 'mermaid'):
+            for split_roles in (False, True):
+                with self.subTest((diagram_type, split_roles)):
+                    ext = umlstate.FILE_EXTENSIONS[diagram_type]
+                    results = []
+                    for workers in (1, 8):
+                        umlplaybook = umlstate.load(cli.parse_args(['-t', diagram_type, playbook]))
+                        output_dir = os.path.join(self.tmp.name, f'out_{workers}')
+                        paths = split.write_split(umlplaybook, output_dir, ext, split_roles=split_roles, workers=workers)
+                        results.append({os.path.relpath(path, output_dir): self.read(path) for path in paths})
+                        self.assertTrue(umlplaybook.context.memoize_subtrees)
+                        # the role repeated in a play is memoized by one thread only
+                        self.assertEqual(umlplaybook.context.stats['subtree_cache_hits'] > 0, workers == 1 and not split_roles)
+                    self.assertEqual(results[1], results[0])
+
+    def test_index(self):
+        _, paths = self.write_split('book_8_multi_plays.yml')
+        self.assertEqual(self.read(os.path.join(self.tmp.name, paths[-1])), [
+            '@startuml',
+            'state "= Play: play 1" as play_1',
+            'play_1 : //1 task//',
+            'play_1 : [[play_1.puml]]',
+            'state "= Play: play 2" as play_2',
+            'play_2 : //1 task//',
+            'play_2 : [[play_2.puml]]',
+            'state "= Play: Test 1" as play_3',
+            'play_3 : //1 task//',
+            'play_3 : [[play_3.puml]]',
+            '[*] --> play_1',
+            'play_1 --> play_2',
+            'play_2 --> play_3',
+            'play_3 --> [*]',
+            '@enduml',
+        ])
+
+    def test_roles(self):
+        umlplaybook, paths = self.write_split('book_5_role.yml', split_roles=True, compress=True)
+        self.assertEqual(paths, ['roles/role_1.puml.gz', 'play_1.puml.gz', 'index.puml.gz'])
+        with gzip.open(os.path.join(self.tmp.name, 'play_1.puml.gz'), 'rt') as f:
+            play_lines = f.read().splitlines()
+        self.assertIn('    state "Role: role_1" as role_1', play_lines)
+        self.assertIn('    role_1 : [[roles/role_1.puml]]', play_lines)
+        self.assertIn('task_1 --> role_1', play_lines)
+        with gzip.open(os.path.join(self.tmp.name, 'roles/role_1.puml.gz'), 'rt') as f:
+            role_lines = f.read().splitlines()
+        role_states = umlplaybook.plays[0].roles
+        self.assertIn('[*] --> %s' % role_states[0].get_entry_point_name(), role_lines)
+        self.assertIn('%s --> [*]' % role_states[-1].get_end_point_name(), role_lines)
+        self.assertFalse(any('Play:' in line for line in role_lines))
+
+    def test_parallel(self):
+        '''The files are the same with one and many threads'''
+        _, paths = self.write_split('book_8_multi_plays.yml', workers=1)
+        serial = {path: self.read(os.path.join(self.tmp.name, path)) for path in paths}
+        _, paths = self.write_split('book_8_multi_plays.yml', workers=4)
+        self.assertEqual({path: self.read(os.path.join(self.tmp.name, path)) for path in paths}, serial)
+
+    def test_cli(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                cli.parse_args(['--split-roles', os.path.join(self.BASE_DIR, 'book_1.yml')])
+            with self.assertRaises(SystemExit):
+                cli.parse_args(['--split', self.tmp.name, '--watch', os.path.join(self.BASE_DIR, 'book_1.yml')])
+
+    def test_role_file_name(self):
+        self.assertEqual(split.role_file_name('ns.collection.role'), 'ns.collection.role')
+        self.assertEqual(split.role_file_name('../roles/my role'), 'roles_my_role')
@@ -0,0 +1,102 @@
+import unittest
+import glob
+import os
+import tempfile
+import playbook2uml.cli as cli
+import playbook2uml.umlstate as umlstate
+
+BLOCK = '''
+    - name: "task_1 %(name)s 100%"
+      block:
+        - name: install
+          apt: name=nginx
+          when: install
+          loop: [a, b]
+        - name: wait
+          uri: url=http://localhost
+          until: result.status == 200
+          retries: 3
+      rescue:
+        - name: report
+          debug: msg=fail
+      always:
+        - name: cleanup
+          file: path=/tmp/x state=absent
+'''
+
+PLAY = '''
+- name: play {}
+  hosts: all
+  roles:
+    - role_1
+  tasks:
+'''
+
+class Test_SubtreeCache(unittest.TestCase):
+    '''Subtree cache
+    The lines of the repeated roles and blocks are reused with the names of their states.
+    '''
+    BASE_DIR = 'test_playbook'
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        os.symlink(os.path.abspath(os.path.join(self.BASE_DIR, 'roles')), os.path.join(self.tmp.name, 'roles'))
+        self.playbook = os.path.join(self.tmp.name, 'site.yml')
+        with open(self.playbook, 'w') as f:
+            f.write(''.join(PLAY.format(i) + BLOCK for i in range(4)))
+
+    def generate(self, *args: str) -> tuple[list, dict]:
+        book = umlstate.load(cli.parse_args([*args]))
+        return list(book.generate()), dict(book.context.stats)
+
+    def test_same_diagrams(self):
+        book_files = sorted(glob.glob(os.path.join(self.BASE_DIR, '*.yml'))) + [self.playbook]
+        for book_file in book_files:
+            for diagram_type in ('plantuml', 'mermaid'):
+                for args in ([], ['--stable-ids'], ['--parser', 'fast'], ['--no-role-cache'], ['--max-depth', '1']):
+                    with self.subTest((book_file, diagram_type, *args)):
+                        expect, _ = self.generate('-t', diagram_type, '--no-subtree-cache', *args, book_file)
+                        result, _ = self.generate('-t', diagram_type, *args, book_file)
+                        self.assertEqual(result, expect)
+
+    def test_reused(self):
+        lines, stats = self.generate(self.playbook)
+        # the definitions and the relations of the role and of the block in 4 plays:
+        # generated, then templated and reused 3 times
+        self.assertEqual(stats['subtree_cache_templates'], 4)
+        self.assertEqual(stats['subtree_cache_hits'], 12)
+        self.assertEqual([line for line in lines if 'Block:' in line],
+                         ['    state "Block: task_1 %%(name)s 100%%" as block_%d {' % i for i in range(1, 5)])
+        self.assertEqual([line for line in lines if line.endswith(' : skip')],
+                         ['task_%d_when --> task_%d : skip' % (i, i + 1) for i in (3, 9, 15, 21)])
+        _, stats = self.generate('--no-subtree-cache', self.playbook)
+        self.assertNotIn('subtree_cache_hits', stats)
+
+    def test_levels(self):
+        '''The definitions of the blocks at other levels are not reused'''
+        with open(self.playbook, 'w') as f:
+            f.write(PLAY.format(0) + BLOCK + '    - name: outer\n      block:\n' + BLOCK.replace('\n    ', '\n        ') * 2)
+        expect, _ = self.generate('--no-subtree-cache', self.playbook)
+        result, stats = self.generate(self.playbook)
+        self.assertEqual(result, expect)
+        # the definitions at level 2 and the relations (not indented) are reused
+        self.assertEqual(stats['subtree_cache_templates'], 2)
+        self.assertEqual(stats['subtree_cache_hits'], 3)
+
+    def test_mark(self):
+        '''A block whose names hold the mark of the placeholders is not memoized'''
+        with open(self.playbook, 'w') as f:
+            f.write(''.join(PLAY.format(i) + BLOCK.replace('name: install', 'name: "inst\\0all"') for i in range(4)))
+        for diagram_type in ('plantuml', 'mermaid'):
+            with self.subTest(diagram_type):
+                expect, _ = self.generate('-t', diagram_type, '--no-subtree-cache', self.playbook)
+                result, stats = self.generate('-t', diagram_type, self.playbook)
+                self.assertEqual(result, expect)
+                self.assertTrue(any('inst\0all' in line for line in result))
+                # the role, and the relations of the block (without the names of the tasks)
+                self.assertEqual(stats['subtree_cache_hits'], 9)
+
+    def test_graph(self):
+        _, stats = self.generate('-t', 'json', self.playbook)
+        self.assertNotIn('subtree_cache_hits', stats)
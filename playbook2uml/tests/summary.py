@@ -0,0 +1,112 @@
+import unittest
+import unittest.mock
+import contextlib
+import io
+import os
+import tempfile
+import playbook2uml.cli as cli
+import playbook2uml.umlstate as umlstate
+import playbook2uml.umlstate.plantuml as plantuml
+
+PLAYBOOK = '''\
+- name: play
+  hosts: localhost
+  roles:
+    - common
+  tasks:
+    - name: outer
+      block:
+        - name: first
+          debug: msg=first
+        - name: inner
+          block:
+            - name: second
+              debug: msg=second
+            - name: third
+              debug: msg=third
+          rescue:
+            - name: fourth
+              debug: msg=fourth
+    - name: copy
+      copy:
+        src: a_very_long_source_file_name.conf
+        dest: /etc/app.conf
+        mode: '0644'
+'''
+
+ROLE_TASKS = '''\
+- name: role first
+  debug: msg=first
+- name: role block
+  block:
+    - name: role second
+      debug: msg=second
+'''
+
+class Test_Summary(unittest.TestCase):
+    '''Summary options
+    `--collapse-roles`, `--max-depth`, `--max-args` and `--max-arg-length`
+    '''
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.playbook = os.path.join(self.tmp.name, 'site.yml')
+        role_file = os.path.join(self.tmp.name, 'roles', 'common', 'tasks', 'main.yml')
+        os.makedirs(os.path.dirname(role_file))
+        with open(self.playbook, 'w') as f:
+            f.write(PLAYBOOK)
+        with open(role_file, 'w') as f:
+            f.write(ROLE_TASKS)
+
+    def generate(self, *args: str) -> list[str]:
+        return list(umlstate.generate(cli.parse_args([*args, self.playbook])))
+
+    def test_collapse_roles(self):
+        for parser in ('ansible', 'fast'):
+            with self.subTest(parser):
+                lines = self.generate('--parser', parser, '--collapse-roles')
+                self.assertIn('    state "Role: common" as role_1', lines)
+                self.assertIn('    role_1 : //2 tasks//', lines)
+                self.assertIn('[*] --> role_1', lines)
+                self.assertIn('role_1 --> task_1', lines)
+                self.assertFalse(any('role first' in line for line in lines))
+
+                lines = self.generate('--parser', parser, '-t', 'mermaid', '--collapse-roles')
+                self.assertIn('        state "Role: common<hr>2 tasks" as role_1', lines)
+                self.assertIn('    role_1 --> task_1', lines)
+
+    def test_max_depth(self):
+        for parser in ('ansible', 'fast'):
+            with self.subTest(parser):
+                lines = self.generate('--parser', parser, '--max-depth', '1')
+                self.assertIn('        state "Block: inner" as block_3', lines)
+                self.assertIn('        block_3 : //3 tasks//', lines)
+                self.assertIn('task_3 --> block_3', lines)
+                self.assertIn('block_3 --> task_4', lines)
+                self.assertFalse(any('== second' in line for line in lines))
+                # the block of the role is in another entry of the role cache
+                self.assertIn('    state "Block: role block" as block_1 {', lines)
+
+                lines = self.generate('--parser', parser, '--max-depth', '0')
+                self.assertIn('    state "Block: outer" as block_2', lines)
+                self.assertIn('    block_2 : //4 tasks//', lines)
+                self.assertIn('    block_1 : //1 task//', lines)
+
+    def test_not_loaded(self):
+        '''The hidden tasks are not converted to states'''
+        with unittest.mock.patch.object(plantuml.UMLStateTask, '__init__', autospec=True,
+                                        side_effect=plantuml.UMLStateTask.__init__) as init:
+            self.generate('--no-role-cache', '--collapse-roles', '--max-depth', '0')
+        self.assertEqual(init.call_count, 1)
+
+    def test_arg_table(self):
+        lines = self.generate('--max-args', '2', '--max-arg-length', '10')
+        self.assertIn('    task_7 : | src | a_very_lon... |', lines)
+        self.assertIn('    task_7 : | dest | /etc/app.c... |', lines)
+        self.assertIn('    task_7 : | ... | (+1 args) |', lines)
+        self.assertFalse(any('| mode |' in line for line in lines))
+
+    def test_invalid(self):
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            cli.parse_args(['--max-depth', '-1', self.playbook])
@@ -0,0 +1,136 @@
+import unittest
+import os
+import tempfile
+import threading
+import playbook2uml.cli as cli
+import playbook2uml.batch as batch
+import playbook2uml.watch as watch
+
+PLAYBOOK_WITH_ROLE = '''\
+- name: play with role
+  hosts: localhost
+  vars_files:
+    - vars.yml
+  roles:
+    - common
+'''
+
+PLAYBOOK_WITHOUT_ROLE = '''\
+- name: play without role
+  hosts: localhost
+  tasks:
+    - name: task
+      debug: msg=hello
+'''
+
+def write(path: str, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+def role_tasks(name: str) -> str:
+    return f'- name: {name}\n  debug: msg={name}\n'
+
+class Test_Watch(unittest.TestCase):
+    '''Watch mode
+    Only the diagrams made of the changed files are rendered again.
+    '''
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        base_dir = self.tmp.name
+        self.with_role = os.path.join(base_dir, 'with_role.yml')
+        self.without_role = os.path.join(base_dir, 'without_role.yml')
+        self.role_file = os.path.join(base_dir, 'roles', 'common', 'tasks', 'main.yml')
+        self.vars_file = os.path.join(base_dir, 'vars.yml')
+        write(self.with_role, PLAYBOOK_WITH_ROLE)
+        write(self.without_role, PLAYBOOK_WITHOUT_ROLE)
+        write(self.role_file, role_tasks('first'))
+        write(self.vars_file, 'foo: 1\n')
+        self.output_dir = os.path.join(base_dir, 'out')
+
+    def create_watcher(self, *args: str, **kwargs) -> watch.Watcher:
+        option = cli.parse_batch_args(['-o', self.output_dir, *args, self.with_role, self.without_role])
+        jobs = batch.create_jobs(option.PLAYBOOK, option, self.output_dir)
+        return watch.Watcher(jobs, interval=0.01, debounce=0.05, **kwargs)
+
+    def bump(self, path: str, content: str):
+        '''Rewrite the file with a later mtime, the file system may have coarse timestamps'''
+        stat = os.stat(path)
+        write(path, content)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    def read_output(self, index: int, watcher: watch.Watcher) -> str:
+        with open(watcher.jobs[index].output) as f:
+            return f.read()
+
+    def test_dependency_graph(self):
+        watcher = self.create_watcher()
+        results = watcher.render_all()
+        self.assertEqual([result.error for result in results], [None, None])
+        self.assertEqual(watcher.graph.affected([self.role_file]), [0])
+        self.assertEqual(watcher.graph.affected([self.vars_file]), [0])
+        self.assertEqual(watcher.graph.affected([self.without_role]), [1])
+        self.assertEqual(watcher.graph.affected([os.path.join(self.tmp.name, 'unknown.yml')]), [])
+
+    def test_poll(self):
+        watcher = self.create_watcher()
+        watcher.render_all()
+        self.assertEqual(watcher.poll(), [])
+        self.bump(self.role_file, role_tasks('second'))
+        self.assertEqual(watcher.poll(), [os.path.abspath(self.role_file)])
+        self.assertEqual(watcher.poll(), [])
+
+    def test_rerender_affected(self):
+        for parser in ('ansible', 'fast'):
+            with self.subTest(parser):
+                rendered = []
+                self.bump(self.role_file, role_tasks('first'))
+                watcher = self.create_watcher('--parser', parser, on_render=rendered.append)
+                watcher.render_all()
+                self.assertIn('first', self.read_output(0, watcher))
+                rendered.clear()
+
+                self.bump(self.role_file, role_tasks(f'second_{parser}'))
+                changed = watcher.wait_changes()
+                watcher.render(watcher.graph.affected(changed))
+                self.assertEqual([result.source for result in rendered], [self.with_role])
+                self.assertIsNone(rendered[0].error)
+                self.assertIn(f'second_{parser}', self.read_output(0, watcher))
+
+    def test_new_dependency(self):
+        '''A file pulled in by the changed playbook is watched after the rendering'''
+        watcher = self.create_watcher()
+        watcher.render_all()
+        extra_file = os.path.join(self.tmp.name, 'extra.yml')
+        write(extra_file, 'bar: 2\n')
+        self.assertEqual(watcher.graph.affected([extra_file]), [])
+
+        self.bump(self.without_role, PLAYBOOK_WITHOUT_ROLE.replace('  tasks:', '  vars_files:\n    - extra.yml\n  tasks:'))
+        watcher.render(watcher.graph.affected(watcher.wait_changes()))
+        self.assertEqual(watcher.graph.affected([extra_file]), [1])
+
+    def test_run(self):
+        rendered = []
+        stop = threading.Event()
+        watcher = self.create_watcher('--parser', 'fast')
+
+        def on_render(result):
+            rendered.append(result)
+            if len(rendered) == 3:
+                stop.set()
+        watcher.on_render = on_render
+
+        thread = threading.Thread(target=watcher.run, args=(stop,))
+        thread.start()
+        try:
+            # wait until the files of the first rendering are watched
+            while not watcher._stats and thread.is_alive():
+                threading.Event().wait(0.01)
+            self.bump(self.vars_file, 'foo: 2\n')
+            thread.join(timeout=10)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual([result.source for result in rendered], [self.with_role, self.without_role, self.with_role])
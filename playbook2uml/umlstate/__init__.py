@@ -1,19 +1,58 @@
 import importlib
 from argparse import Namespace
+from typing import Iterable
 from playbook2uml.logger import getLogger, setLoggerLevel
 logger = getLogger(__name__)
 
 DIAGRAM_TYPES = (
     'plantuml',
-    'mermaid'
+    'mermaid',
+    'json',
+    'msgpack',
 )
 
-def load(args:Namespace):
+GRAPH_TYPES = ('json', 'msgpack')
+"""
+The types writing the state graph instead of a diagram, see `playbook2uml.umlstate.graph`
+"""
+
+BINARY_TYPES = ('msgpack',)
+"""
+The types generating `bytes` instead of lines
+"""
+
+FILE_EXTENSIONS = {
+    'plantuml': '.puml',
+    'mermaid': '.mmd',
+    'json': '.jsonl',
+    'msgpack': '.msgpack',
+}
+
+def load(args:Namespace, environment=None, profiler=None):
     setLoggerLevel(logger, args.verbose)
     if args.type not in DIAGRAM_TYPES:
         raise ValueError(f'invalid type: {args.type}')
 
-    umlstate = importlib.import_module('playbook2uml.umlstate.' + args.type)
-    logger.debug(f'loaded {umlstate.__name__}')
+    module_name = 'graph' if args.type in GRAPH_TYPES else args.type
+    umlstate = importlib.import_module('playbook2uml.umlstate.' + module_name)
+    logger.debug('loaded %s', umlstate.__name__)
+
+    if getattr(args, 'from_graph', False):
+        from playbook2uml.umlstate.graph import load_graph
+        return load_graph(args.PLAYBOOK, umlstate.UMLStatePlaybook, args, profiler=profiler)
+
+    return umlstate.UMLStatePlaybook(args.PLAYBOOK, option=args, environment=environment, profiler=profiler)
+
+def generate(args:Namespace, environment=None, profiler=None) -> Iterable[str]:
+    '''
+    Generate the diagram lines.
+    When `args.cache_dir` is set, the lines come from the output cache if the playbook
+    and the files it pulls in are unchanged (without loading ansible-core).
+    With `profiler` (a `playbook2uml.profiling.Profiler`), the phases are recorded.
+    The binary types and the diagrams of graph files (`args.from_graph`) are not cached.
+    '''
+    if getattr(args, 'cache_dir', None) and args.type not in BINARY_TYPES and not getattr(args, 'from_graph', False):
+        from playbook2uml.cache import generate_with_cache
+        return generate_with_cache(args, lambda: load(args, environment=environment, profiler=profiler).generate(), FILE_EXTENSIONS[args.type])
 
-    return umlstate.UMLStatePlaybook(args.PLAYBOOK, option=args)
+    return load(args, environment=environment, profiler=profiler).generate()
@@ -1,23 +1,98 @@
 from __future__ import (absolute_import, division, print_function, annotations)
-from typing import ClassVar, Iterator, Optional
-from collections.abc import Iterable
+from typing import TYPE_CHECKING, ClassVar, Iterable, Iterator, Optional, Union
 from abc import ABCMeta, abstractmethod
 from argparse import Namespace
+from collections import Counter
+import copy
+from functools import partial
+from itertools import chain, count
 from playbook2uml.umlstate import logger
+from playbook2uml.umlstate.ir import TaskIR, BlockIR, PlayIR
+from playbook2uml.umlstate.rolecache import ROLE_CACHE, RoleCache, BlockTree, SummaryTree, StateTree
+from playbook2uml.umlstate.subtree import SubtreeCache
+from playbook2uml.profiling import Profiler, NULL_PROFILER
 from logging import Logger
 
-from ansible.parsing.dataloader import DataLoader
-from ansible.vars.manager import VariableManager
-from ansible.playbook import Playbook
-from ansible.playbook.play import Play
-from ansible.playbook.block import Block
-from ansible.playbook.task import Task
-from ansible.utils.sentinel import Sentinel
-from ansible.plugins.loader import init_plugin_loader
+# The states and the emitters only use the records of `playbook2uml.umlstate.ir`.
+# Converting the objects of ansible-core (or of the fast parser) to the states is done
+# by `playbook2uml.umlstate.extract`, imported when a playbook is actually loaded.
+if TYPE_CHECKING:
+    from ansible.playbook.play import Play
+    from ansible.playbook.block import Block
+    from ansible.playbook.task import Task
+    from playbook2uml.umlstate.extract import AnsibleEnvironment
+    from playbook2uml.includes import IncludeResolver
+    from playbook2uml.fastparser import FastPlaybookParser
 __metaclass__ = type
 
 indent = '    '
 
+class RenderContext:
+    """
+    The state of one rendering.
+
+    Hands out the IDs of the states (`task_N`, `block_N`, `play_N`) and holds
+    the logger, the options, the profiler and the role cache. Every UMLStatePlaybook has its own context, so
+    multiple playbooks can be loaded and generated at the same time in one process.
+
+    The summary options (`collapse_roles`, `max_depth`, `max_args` and `max_arg_length`)
+    bound the size of the diagram, the hidden tasks are not converted to states.
+    """
+
+    def __init__(self, option:Optional[Namespace]=None, logger:Logger=logger, profiler:Optional[Profiler]=None) -> None:
+        self.option = option
+        self.logger = logger
+        self.profiler = profiler or NULL_PROFILER
+        self.role_cache: Optional[RoleCache] = None if getattr(option, 'no_role_cache', False) else ROLE_CACHE
+        self.collapse_roles: bool = getattr(option, 'collapse_roles', False)
+        self.max_depth: Optional[int] = getattr(option, 'max_depth', None)
+        self.max_args: Optional[int] = getattr(option, 'max_args', None)
+        self.max_arg_length: Optional[int] = getattr(option, 'max_arg_length', None)
+        self.stable_ids: bool = getattr(option, 'stable_ids', False)
+        """
+        Name the states by the hashes of their paths instead of the counters, see `playbook2uml.umlstate.naming`
+        """
+        self.memoize_subtrees: bool = not getattr(option, 'no_subtree_cache', False)
+        """
+        Reuse the lines of the repeated blocks and roles, see `playbook2uml.umlstate.subtree`
+        """
+        self.subtree_cache: Optional[SubtreeCache] = None
+        """
+        The cache of the lines of the current `generate()`, set by the diagram types generating lines
+        """
+        self.includes: Optional[IncludeResolver] = None
+        """
+        The resolver of `--resolve-includes`, set when the playbook is loaded
+        """
+        self.fast_parser: Optional[FastPlaybookParser] = None
+        """
+        The parser of `--parser fast` and of the files of `--resolve-includes`, set when the playbook is loaded
+        """
+        self.stats: Counter[str] = Counter()
+        """
+        Counts of this rendering, e.g. `role_cache_hits` and `role_cache_misses`
+        """
+        self._counters: dict[str, Iterator[int]] = {}
+
+    def new_subtree_cache(self) -> Optional[SubtreeCache]:
+        """
+        Set a new cache of the lines of the blocks for a `generate()`, `None` with `--no-subtree-cache`
+        """
+        self.subtree_cache = SubtreeCache(self.stats) if self.memoize_subtrees else None
+        return self.subtree_cache
+
+    def next_id(self, kind:str) -> int:
+        """
+        Get the next ID of the kind of states, starting from 1.
+
+        Args:
+            kind (str): The kind of the state, e.g. "task", "block" or "play"
+        """
+        counter = self._counters.get(kind)
+        if counter is None:
+            counter = self._counters.setdefault(kind, count(1))
+        return next(counter)
+
 class UMLStateBase(metaclass=ABCMeta):
     """
     Abstract base class for UML State diagram elements.
@@ -25,7 +100,12 @@ class UMLStateBase(metaclass=ABCMeta):
     This class defines the interface for objects that can be represented in UML State diagrams.
     It provides abstract methods for generating diagram definitions, managing state relations,
     and handling entry/exit points.
+
+    The states are slotted and keep only the compact records of `playbook2uml.umlstate.ir`,
+    not the Ansible objects, so that large playbooks can be held with little memory.
+    Subclasses must define `__slots__` too.
     """
+    __slots__ = ()
 
     name: str
     """
@@ -63,6 +143,13 @@ class UMLStateBase(metaclass=ABCMeta):
         """
         pass
 
+    def rename(self, name:str) -> None:
+        """
+        Set the name of the state, e.g. the stable name of `--stable-ids`
+        (see `playbook2uml.umlstate.naming`).
+        """
+        self.name = name
+
     def __str__(self) -> str:
         return f"<{self.__class__.__name__}({self.name})>"
 
@@ -93,43 +180,63 @@ class UMLStateTaskBase(UMLStateBase, metaclass=ABCMeta):
 
     This class manages the lifecycle and metadata of a task within a UML state diagram,
     including task naming, conditional logic (when), and loop logic (until).
+
+    The attributes of the task are copied to `self.task` (a `TaskIR`) when created,
+    the Ansible `Task` is not referenced after that.
     """
 
-    ID: ClassVar[int] = 1
+    __slots__ = ('task', 'context', 'id', 'name', '_entry_point_name', '_end_point_name')
     logger : ClassVar[Logger] = logger.getChild("UMLStateTask")
 
-    def __init__(self, task:Task) -> None:
+    def __init__(self, task:Task, context:Optional[RenderContext]=None) -> None:
+        from playbook2uml.umlstate.extract import when_list
         self.logger.debug('start')
+        self._init_state(TaskIR.from_task(task, when_list(task)), context)
+        self.logger.debug('end')
+
+    @classmethod
+    def from_ir(cls, task:TaskIR, context:RenderContext, name:Optional[str]=None) -> UMLStateTaskBase:
+        '''
+        Create the state from the record of a task, with a new ID.
+        `name` keeps the name of the state, e.g. read from a graph file.
+        '''
+        self = cls.__new__(cls)
+        self._init_state(task, context, name)
+        return self
+
+    def _init_state(self, task:TaskIR, context:Optional[RenderContext], name:Optional[str]=None) -> None:
         self.task = task
-        self.id = self.__class__.ID
-        self.__class__.ID += 1
+        self.context = context or RenderContext()
+        self.id = self.context.next_id('task')
+        self.rename(name or 'task_%d' % self.id)
 
-        self.name = 'task_%d' % self.id
-        self.logger.debug(f'set name "{self.name}"')
+    def rename(self, name:str) -> None:
+        """
+        Set the name of the state and of its entry and end points
+        """
+        self.name = name
+        self.logger.debug('set name "%s"', self.name)
         self._entry_point_name = self.name
         self._end_point_name = self.name
-        self.when = self._get_when_list(self.task)
-        self.has_when = bool(self.when)
         if self.has_when:
             self._entry_point_name = '%s_when' % self.name
-            self.logger.debug(f'{self.name} has `when`. set `_entry_point_name "{self._entry_point_name}"')
+            self.logger.debug('%s has `when`. set `_entry_point_name "%s"', self.name, self._entry_point_name)
 
-        self.has_until = False
-        if self.task.until:
-            self.has_until = True
+        if self.has_until:
             self._end_point_name = '%s_until' % self.name
-            self.logger.debug(f'{self.name} has `until`. set `_end_point_name "{self._end_point_name}"')
+            self.logger.debug('%s has `until`. set `_end_point_name "%s"', self.name, self._end_point_name)
 
-        self.logger.debug('end')
+    @property
+    def when(self) -> tuple:
+        return self.task.when
 
-    def _get_when_list(self, task) -> list[str]:
-        when = task.when
-        if when is Sentinel:
-            return []
-        elif isinstance(when, list):
-            return when
-        else:
-            return [when]
+    @property
+    def has_when(self) -> bool:
+        return bool(self.task.when)
+
+    @property
+    def has_until(self) -> bool:
+        return bool(self.task.until)
 
     def get_entry_point_name(self) -> str:
         return self._entry_point_name
@@ -137,6 +244,12 @@ class UMLStateTaskBase(UMLStateBase, metaclass=ABCMeta):
     def get_end_point_name(self) -> str:
         return self._end_point_name
 
+    def to_tree(self) -> StateTree:
+        return self.task
+
+    def count_tasks(self) -> int:
+        return 1
+
 class UMLStateBlockBase(UMLStateBase, metaclass=ABCMeta):
     """
     Abstract base class for UML state blocks in Ansible playbook diagrams.
@@ -146,62 +259,105 @@ class UMLStateBlockBase(UMLStateBase, metaclass=ABCMeta):
     elements.
     """
 
-    ID: ClassVar[int] = 1
+    __slots__ = ('block', 'context', 'id', 'name', 'tasks', 'always', 'rescue', '_entry_point', '_end_point')
     TASK_CLASS: ClassVar[type[UMLStateTaskBase]]
+    SUMMARY_CLASS: ClassVar[type[UMLStateSummaryBase]]
     logger : ClassVar[Logger] = logger.getChild("UMLStateBlock")
 
     @classmethod
-    def load(cls, block:Block) -> Iterator[UMLStateBlockBase | UMLStateTaskBase]:
-        if block.name or block.always or block.rescue:
-            cls.logger.debug(f'load block as explicit: {cls.ID}')
-            yield cls(block)
-        elif isinstance(block.block, Iterable):
-            cls.logger.debug(f'load block as implicit')
-            for task in block.block:
-                if isinstance(task, Block):
-                    yield from cls.load(task)
-                elif getattr(task, 'implicit', False):
-                    cls.logger.debug(f'skip: {task.get_name()} is implicit')
-                    continue
-                else:
-                    yield cls.TASK_CLASS(task)
+    def from_tree(cls, tree:StateTree, context:RenderContext) -> UMLStateBaseType:
+        '''
+        Create the states from the records of a task or a block (see `to_tree()`),
+        with new IDs in the same order as loading them
+        '''
+        if isinstance(tree, SummaryTree):
+            return cls.SUMMARY_CLASS(tree.kind, tree.label, tree.task_count, context)
+        if not isinstance(tree, BlockTree):
+            return cls.TASK_CLASS.from_ir(tree, context)
+        self = cls.__new__(cls)
+        self._init_state(tree.block, context)
+        self.tasks = tuple(cls.from_tree(child, context) for child in tree.tasks)
+        self.always = tuple(cls.from_tree(child, context) for child in tree.always)
+        self.rescue = tuple(cls.from_tree(child, context) for child in tree.rescue)
+        self._resolve_points()
+        return self
 
     @classmethod
-    def load_tasks(cls, tasks:Iterable[Block|Task]) -> Iterator[UMLStateBlockBase | UMLStateTaskBase]:
-        for task in tasks:
-            if isinstance(task, Block):
-                yield from cls.load(task)
-            elif getattr(task, 'implicit', False):
-                cls.logger.debug(f'skip: {task.get_name()} is implicit')
-                # Skip when the tasks is implicit `role_complete` block
-                # See: https://github.com/ansible/ansible/commit/1b70260d5aa2f6c9782fd2b848e8d16566e50d85
-                continue
-            else:
-                yield cls.TASK_CLASS(task)
-
-    def __init__(self, block:Block) -> None:
+    def from_states(cls, block:BlockIR, context:RenderContext, tasks:tuple=(), always:tuple=(), rescue:tuple=(),
+                    name:Optional[str]=None) -> UMLStateBlockBase:
+        '''
+        Create the block from the record and the states of its children, e.g. read from a graph file
+        '''
+        self = cls.__new__(cls)
+        self._init_state(block, context, name)
+        self.tasks = tuple(tasks)
+        self.always = tuple(always)
+        self.rescue = tuple(rescue)
+        self._resolve_points()
+        return self
+
+    def __init__(self, block:Block, context:Optional[RenderContext]=None, depth:int=0) -> None:
+        '''
+        Load the block and its children. `depth` is the number of the explicit blocks around it.
+        '''
+        from playbook2uml.umlstate.extract import init_block
+        init_block(self, block, context, depth)
+
+    def _init_state(self, block:BlockIR, context:Optional[RenderContext], name:Optional[str]=None) -> None:
         self.block = block
-        self.id = self.__class__.ID
-        self.__class__.ID += 1
-        self.name = 'block_%d' % self.id
-        self.logger.debug(f'start: {self}')
-        if isinstance(block.block, Iterable):
-            self.tasks = tuple(self.load_tasks(block.block))
-        self.always = tuple(self.load_tasks(block.always)) if isinstance(block.always, Iterable) else ()
-        self.rescue = tuple(task for task in self.load_tasks(block.rescue)) if isinstance(block.rescue, Iterable) else ()
-
-        self.logger.debug(f'end: {self}')
+        self.context = context or RenderContext()
+        self.id = self.context.next_id('block')
+        self.name = name or 'block_%d' % self.id
+
+    def _resolve_points(self) -> None:
+        # resolved once here, the nested blocks are already resolved
+        self._entry_point = self.tasks[0].get_entry_point_name() if self.tasks else None
+        last_tasks = self.always or self.tasks
+        self._end_point = last_tasks[-1].get_end_point_name() if last_tasks else None
+
+    def count_tasks(self) -> int:
+        return sum(task.count_tasks() for task in (*self.tasks, *self.always, *self.rescue))
+
+    def to_tree(self) -> StateTree:
+        '''
+        Get the records of the block and of its children, to create the same states again
+        '''
+        return BlockTree(self.block,
+                         tuple(task.to_tree() for task in self.tasks),
+                         tuple(task.to_tree() for task in self.always),
+                         tuple(task.to_tree() for task in self.rescue))
 
     def get_entry_point_name(self) -> str:
-        return self.tasks[0].get_entry_point_name()
+        if self._entry_point is None:
+            raise IndexError(f'{self.name} has no tasks')
+        return self._entry_point
 
     def get_end_point_name(self) -> str:
-        if self.always:
-            return self.always[-1].get_end_point_name()
-        return self.tasks[-1].get_end_point_name()
+        if self._end_point is None:
+            raise IndexError(f'{self.name} has no tasks')
+        return self._end_point
+
+    def generateDefinition(self, level:int=0) -> Iterator[str]:
+        cache = self.context.subtree_cache
+        if cache is None:
+            return self._generateBlockDefinition(level)
+        return iter(cache.definition(self, level, lambda: self._generateBlockDefinition(level)))
+
+    @abstractmethod
+    def _generateBlockDefinition(self, level:int=0) -> Iterator[str]:
+        """
+        Generate the definition lines of the block and of its children, without the subtree cache
+        """
+        pass
 
     def generateRelation(self, next:Optional[UMLStateBase], level:int=0) -> Iterator[str]:
-        self.logger.debug(f'start {self}')
+        cache = self.context.subtree_cache
+        if cache is None:
+            return self._generateBlockRelation(next, level)
+        return iter(cache.relation(self, next, level, lambda next: self._generateBlockRelation(next, level)))
+
+    def _generateBlockRelation(self, next:Optional[UMLStateBase], level:int=0) -> Iterator[str]:
+        self.logger.debug('start %s', self)
         for current_state, next_state in pair_state_iter(*self.tasks, *self.always, next):
             yield from current_state.generateRelation(next_state, level=level)
 
@@ -210,7 +366,45 @@ class UMLStateBlockBase(UMLStateBase, metaclass=ABCMeta):
             for current_state, next_state in states:
                 yield from current_state.generateRelation(next_state, level=level)
 
-        self.logger.debug(f'end {self}')
+        self.logger.debug('end %s', self)
+
+class UMLStateSummaryBase(UMLStateBase, metaclass=ABCMeta):
+    """
+    A state standing for the tasks hidden by the summary options:
+    a role collapsed by `--collapse-roles` or a block deeper than `--max-depth`.
+
+    Only the label and the number of the hidden tasks are kept,
+    the hidden tasks are not converted to states.
+    """
+    __slots__ = ('context', 'id', 'name', 'kind', 'label', 'task_count', 'link')
+    logger : ClassVar[Logger] = logger.getChild("UMLStateSummary")
+
+    def __init__(self, kind:str, label:str, task_count:int, context:RenderContext, link:Optional[str]=None,
+                 name:Optional[str]=None) -> None:
+        self.context = context
+        self.kind = kind
+        self.label = label
+        self.task_count = task_count
+        self.link = link
+        """
+        The file of the diagram of the hidden tasks, see `playbook2uml.split`
+        """
+        self.id = context.next_id(kind)
+        self.name = name or '%s_%d' % (kind, self.id)
+
+    def get_entry_point_name(self) -> str:
+        return self.name
+
+    def get_end_point_name(self) -> str:
+        return self.name
+
+    def to_tree(self) -> StateTree:
+        return SummaryTree(self.kind, self.label, self.task_count)
+
+    def count_tasks(self) -> int:
+        return self.task_count
+
+UMLStateBaseType = Union[UMLStateBlockBase, UMLStateTaskBase, UMLStateSummaryBase]
 
 class UMLStateStart(UMLStateBase):
     """
@@ -219,6 +413,8 @@ class UMLStateStart(UMLStateBase):
     This class generates the start point notation '[*]' for UML state diagrams
     and handles transitions from the start state to the next state.
     """
+    __slots__ = ()
+    name = 'start'
     logger = logger.getChild('UMLStateStart')
 
     def generateDefinition(self, level: int = 0) -> Iterator[str]:
@@ -245,38 +441,109 @@ class UMLStatePlayBase(UMLStateBase, metaclass=ABCMeta):
     pre-tasks, roles, tasks, and post-tasks.
     """
 
-    ID: ClassVar[int] = 1
+    __slots__ = ('play', 'context', 'id', 'name', 'pre_tasks', 'roles', 'role_groups', 'tasks', 'post_tasks', '_all_tasks')
     BLOCK_CLASS: ClassVar[type[UMLStateBlockBase]]
     logger = logger.getChild("UMLStatePlay")
 
-    def __init__(self, play:Play) -> None:
-        self.logger.debug('start')
+    def __init__(self, play:Play, context:Optional[RenderContext]=None) -> None:
+        from playbook2uml.umlstate.extract import init_play
+        init_play(self, play, context or RenderContext())
+
+    @classmethod
+    def from_states(cls, play:PlayIR, context:RenderContext, pre_tasks:tuple=(), role_groups:tuple=(),
+                    tasks:tuple=(), post_tasks:tuple=(), name:Optional[str]=None) -> UMLStatePlayBase:
+        '''
+        Create the play from the record and the states of its sections, e.g. read from a graph file.
+        `role_groups` is a tuple of the role names and their states.
+        '''
+        self = cls.__new__(cls)
         self.play = play
-        self.id = self.__class__.ID
-        self.__class__.ID += 1
-        self.name = 'play_%d' % self.id
-        if isinstance(play.pre_tasks, Iterable):
-            self.pre_tasks = tuple(self.BLOCK_CLASS.load_tasks(play.pre_tasks))
-        if isinstance(play.roles, Iterable):
-            self.roles = tuple(self.BLOCK_CLASS.load_tasks(
-                block for role in play.roles if not getattr(role, 'from_include', getattr(role, '_from_include', False))
-                for block in role.get_task_blocks()))
-        if isinstance(play.tasks, Iterable):
-            self.tasks = tuple(self.BLOCK_CLASS.load_tasks(play.tasks))
-        if isinstance(play.post_tasks, Iterable):
-            self.post_tasks = tuple(self.BLOCK_CLASS.load_tasks(play.post_tasks))
-        self.logger.debug(f'{self}: {len(self.pre_tasks)} pre_tasks: {[str(t) for t in self.pre_tasks]}')
-        self.logger.debug(f'{self}: {len(self.roles)} roles: {[str(t) for t in self.roles]}')
-        self.logger.debug(f'{self}: {len(self.tasks)} tasks: {[str(t) for t in self.tasks]}')
-        self.logger.debug(f'{self}: {len(self.post_tasks)} post_tasks: {[str(t) for t in self.post_tasks]}')
-        self.logger.debug('end')
+        self.context = context
+        self.id = context.next_id('play')
+        self.name = name or 'play_%d' % self.id
+        self.pre_tasks = tuple(pre_tasks)
+        self.role_groups = tuple(role_groups)
+        self.roles = tuple(state for _, states in self.role_groups for state in states)
+        self.tasks = tuple(tasks)
+        self.post_tasks = tuple(post_tasks)
+        self._all_tasks = self.pre_tasks + self.roles + self.tasks + self.post_tasks
+        return self
+
+    def replace(self, **kwargs) -> UMLStatePlayBase:
+        '''
+        Get a copy of the play with other states, e.g. `replace(roles=summaries)`.
+        The states are shared, not copied.
+        '''
+        play = copy.copy(self)
+        for key, value in kwargs.items():
+            setattr(play, key, value)
+        play._all_tasks = play.pre_tasks + play.roles + play.tasks + play.post_tasks
+        return play
+
+    def count_tasks(self) -> int:
+        '''
+        Count the tasks in the states of the play
+        '''
+        return sum(state.count_tasks() for state in self._all_tasks)
 
     @abstractmethod
     def generateDefinition(self, level:int=0, only_role=False) -> Iterator[str]:
         pass
 
     def get_all_tasks(self) -> tuple[UMLStateBase, ...]:
-        return self.pre_tasks + self.roles + self.tasks + self.post_tasks
+        '''
+        Get the states of pre_tasks, roles, tasks and post_tasks in the order of execution
+        '''
+        return self._all_tasks
+
+    def get_state_runs(self) -> Iterator[tuple[UMLStateBase, ...]]:
+        '''
+        Get the states of the play in the order of execution, the states of each role together
+        and the other states one by one
+        '''
+        for state in self.pre_tasks:
+            yield (state,)
+        # the roles of a play copied by `replace(roles=...)` are not in `role_groups`
+        if self.roles == tuple(state for _, states in self.role_groups for state in states):
+            yield from (states for _, states in self.role_groups if states)
+        else:
+            yield from ((state,) for state in self.roles)
+        for state in (*self.tasks, *self.post_tasks):
+            yield (state,)
+
+    def generateStatesDefinition(self, level:int=0) -> Iterator[str]:
+        '''
+        Generate the definitions of the states of the play, the roles from the subtree cache
+        '''
+        return chain.from_iterable(self._iterateDefinitions(level))
+
+    def _iterateDefinitions(self, level:int) -> Iterator[Iterable[str]]:
+        # the lines of each state (or role) are chained, not passed through another generator
+        cache = self.context.subtree_cache
+        for states in self.get_state_runs():
+            if len(states) == 1:
+                yield states[0].generateDefinition(level)
+            elif cache is not None:
+                yield cache.definition(states, level, partial(_generateDefinitions, states, level))
+            else:
+                yield _generateDefinitions(states, level)
+
+    def generateStatesRelation(self, next:Optional[UMLStateBase], level:int=0) -> Iterator[str]:
+        '''
+        Generate the relations of the states of the play to the next state, the roles from the subtree cache
+        '''
+        return chain.from_iterable(self._iterateRelations(next, level))
+
+    def _iterateRelations(self, next:Optional[UMLStateBase], level:int) -> Iterator[Iterable[str]]:
+        cache = self.context.subtree_cache
+        runs = list(self.get_state_runs())
+        for states, next_state in zip(runs, [*(states[0] for states in runs[1:]), next]):
+            if len(states) == 1:
+                yield states[0].generateRelation(next_state, level=level)
+            elif cache is not None:
+                yield cache.relation(states, next_state, level, partial(_generateRelations, states, level=level))
+            else:
+                yield _generateRelations(states, next_state, level)
 
     def get_entry_point_name(self) -> str:
         return self.get_all_tasks()[0].get_entry_point_name()
@@ -284,6 +551,14 @@ class UMLStatePlayBase(UMLStateBase, metaclass=ABCMeta):
     def get_end_point_name(self) -> str:
         return self.get_all_tasks()[-1].get_end_point_name()
 
+def _generateDefinitions(states:tuple[UMLStateBase, ...], level:int) -> Iterator[str]:
+    for state in states:
+        yield from state.generateDefinition(level)
+
+def _generateRelations(states:tuple[UMLStateBase, ...], next:Optional[UMLStateBase], level:int) -> Iterator[str]:
+    for current_state, next_state in pair_state_iter(*states, next):
+        yield from current_state.generateRelation(next_state, level=level)
+
 class UMLStatePlaybookBase(metaclass=ABCMeta):
     """
     Abstract base class for converting Ansible playbooks to UML state diagrams.
@@ -305,7 +580,8 @@ class UMLStatePlaybookBase(metaclass=ABCMeta):
     BLOCK_CLASS: ClassVar[type[UMLStateBlockBase]]
     TASK_CLASS: ClassVar[type[UMLStateTaskBase]]
 
-    def __init__(self, playbook:str, option:Namespace):
+    def __init__(self, playbook:str, option:Namespace, environment:Optional[AnsibleEnvironment]=None,
+                 profiler:Optional[Profiler]=None):
         """
         Initialize the UML state generator from an Ansible playbook or role.
 
@@ -315,63 +591,55 @@ class UMLStatePlaybookBase(metaclass=ABCMeta):
                 - role (str, optional): Role name to load instead of playbook
                 - tasks_from (str, optional): Specific tasks file to import from the role
                 - BASE_DIR (str): Base directory for loading roles and playbooks
+                - parser (str, optional): `ansible` (default) or `fast`.
+                  `fast` reads the YAML with `playbook2uml.fastparser` instead of Ansible.
+            environment (AnsibleEnvironment, optional): Shared Ansible loaders.
+                A new one is created when omitted. Not used by the fast parser.
+            profiler (Profiler, optional): Records the phases of the loading
+                (`import`, `init_plugin_loader`, `parse`, `states/PLAY/...`) and of `generate()`.
 
         Initializes the playbook parser by:
-        - Setting up Ansible's DataLoader and VariableManager
-        - Creating PLAY, BLOCK, and TASK class instances with ID counters
+        - Setting up (or reusing) Ansible's DataLoader and VariableManager
+        - Creating the RenderContext which hands out the IDs of this playbook's states
         - Loading either a dummy play (if role mode) or the full playbook
         - Storing the plays and options for later processing
 
+        The states copy what they need from the Ansible objects (see `playbook2uml.umlstate.ir`),
+        so the Playbook, the plays and a DataLoader created here are released after loading.
+
         In role mode, creates a dummy playbook that imports the specified role.
         In playbook mode, loads all plays from the given playbook file.
+
+        Multiple instances can be created and generated at the same time, even in threads.
+        Loading with Ansible is serialized, the generation is not.
+
+        The loading is done by `playbook2uml.umlstate.extract.load_plays`.
         """
+        from playbook2uml.umlstate.extract import load_plays
         self.logger.debug('start')
+        self.context = RenderContext(option, self.logger, profiler)
+        self.options = option
+        self.plays = load_plays(self, playbook, option, environment)
 
-        # Since `ID` is a class variable, it is reset to 1 each time an instance is created
-        # Simultaneous use of multiple instances is not supported
-        self.PLAY_CLASS.ID = 1
-        self.BLOCK_CLASS.ID = 1
-        self.TASK_CLASS.ID = 1
-        dataloader = DataLoader()
-        variable_manager = VariableManager(loader=dataloader)
-        import warnings
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore', UserWarning)
-            init_plugin_loader()
-
-        if option.role:
-            '''
-            For only role mode.
-            Load a dummy play data which imports the role only.
-            '''
-            role_name = option.role
-            dummy_play = {
-                'hosts': 'all',
-                'tasks': [
-                    {
-                        'import_role': {
-                            'name': role_name,
-                            'tasks_from': option.tasks_from
-                        }
-                    }
-                ]
-            }
-            self.logger.debug(f'load dummy play: {dummy_play}')
-            dataloader.set_basedir(option.BASE_DIR)
-            pb = Playbook(loader=dataloader)
-            self.plays = [
-                self.PLAY_CLASS(Play.load(dummy_play, variable_manager=variable_manager, loader=pb._loader, vars=None))
-            ]
-        else:
-            '''
-            For whole of the playbook.
-            '''
-            self.logger.debug(f'load playbook: {playbook}')
-            pb = Playbook.load(playbook, variable_manager=variable_manager, loader=dataloader)
-            self.plays = [self.PLAY_CLASS(play) for play in pb.get_plays()]
-
+    @classmethod
+    def empty(cls, option:Namespace, profiler:Optional[Profiler]=None) -> UMLStatePlaybookBase:
+        '''
+        Create the playbook without loading a playbook file, the plays are set by the caller
+        (see `playbook2uml.umlstate.graph.load_graph`)
+        '''
+        self = cls.__new__(cls)
+        self.context = RenderContext(option, self.logger, profiler)
         self.options = option
+        self.plays = []
+        return self
 
     @abstractmethod
     def generate(self) -> Iterator[str]:
         pass
+
+    @abstractmethod
+    def generate_plays(self, plays:list[UMLStatePlayBase], only_role:Optional[bool]=None) -> Iterator[str]:
+        """
+        Generate one diagram of the plays
+        """
+        pass
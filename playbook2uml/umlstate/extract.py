@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+'''
+Extraction: converts the plays read by ansible-core (or `playbook2uml.fastparser`) to the states.
+
+This is the only part of `playbook2uml.umlstate` handling the objects of ansible-core and of
+the fast parser. The states keep the records of `playbook2uml.umlstate.ir`, and the emitters
+of the diagram modules (`plantuml`, `mermaid` and `graph`) only read those records. So a graph
+file written by `-t json`/`-t msgpack` is rendered without this module, ansible-core or PyYAML
+(see `playbook2uml.umlstate.graph.load_graph`).
+
+The constructors of the states taking the Ansible objects (`UMLStateTaskBase(task)`,
+`UMLStateBlockBase(block)`, `UMLStatePlayBase(play)` and `UMLStatePlaybookBase(playbook, option)`)
+call the functions of this module.
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import TYPE_CHECKING, Iterator, Optional
+from collections.abc import Iterable
+from contextlib import nullcontext
+from argparse import Namespace
+from logging import DEBUG
+import os
+import threading
+from playbook2uml.umlstate import logger
+from playbook2uml.umlstate.ir import BlockIR, PlayIR
+from playbook2uml.umlstate.rolecache import role_key, role_files, file_stats, outside_files
+from playbook2uml.profiling import Profiler, NULL_PROFILER
+
+if TYPE_CHECKING:
+    from ansible.playbook.play import Play
+    from ansible.playbook.block import Block
+    from ansible.playbook.task import Task
+    from playbook2uml.umlstate.base import (RenderContext, UMLStateBaseType, UMLStateBlockBase,
+                                            UMLStatePlayBase, UMLStatePlaybookBase)
+
+_ansible_lock = threading.RLock()
+"""
+ansible-core is not thread-safe, loading playbooks is serialized with this lock.
+Generating the diagrams runs concurrently.
+"""
+
+def _require_ansible() -> None:
+    try:
+        import ansible  # noqa: F401
+    except ImportError:
+        raise ImportError("ansible-core is required to load playbooks with `--parser ansible`: "
+                          "pip install 'playbook2uml[ansible]' (or use `--parser fast`)") from None
+
+class AnsibleEnvironment:
+    """
+    Ansible objects shared between the loaded playbooks.
+
+    Initializing the plugin loader and creating the DataLoader/VariableManager
+    are costly compared to converting a playbook, so a batch of playbooks
+    should be loaded with one instance of this class.
+    The DataLoader also caches the parsed YAML files, so roles used by several
+    playbooks are read only once.
+    """
+
+    logger = logger.getChild('AnsibleEnvironment')
+
+    def __init__(self, profiler:Profiler=NULL_PROFILER) -> None:
+        self.logger.debug('start')
+        with profiler.phase('import'):
+            _require_ansible()
+            from ansible.parsing.dataloader import DataLoader
+            from ansible.vars.manager import VariableManager
+            from ansible.plugins.loader import init_plugin_loader
+        import warnings
+        with _ansible_lock, warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            with profiler.phase('init_plugin_loader'):
+                init_plugin_loader()
+            with profiler.phase('environment'):
+                self.dataloader = DataLoader()
+                self.variable_manager = VariableManager(loader=self.dataloader)
+        self.logger.debug('end')
+
+    def clear_cache(self) -> None:
+        """
+        Forget the YAML files cached by the DataLoader, so that modified files are read again.
+        Long-running processes should call this before loading playbooks.
+        """
+        with _ansible_lock:
+            self.dataloader._FILE_CACHE.clear()
+
+def is_block(task) -> bool:
+    """
+    Whether the task is a block of Ansible or of the fast parser
+    """
+    from playbook2uml.fastparser import FastNode, FastBlock
+    if isinstance(task, FastNode):
+        return isinstance(task, FastBlock)
+    from ansible.playbook.block import Block
+    return isinstance(task, Block)
+
+def count_tasks(tasks:Iterable[Block|Task]) -> int:
+    """
+    Count the tasks shown in the diagram without converting them to states
+    """
+    number = 0
+    for task in tasks if isinstance(tasks, Iterable) else ():
+        if is_block(task):
+            number += count_tasks(task.block) + count_tasks(task.rescue) + count_tasks(task.always)
+        elif not getattr(task, 'implicit', False):
+            number += 1
+    return number
+
+def when_list(task) -> list[str]:
+    """
+    Get the conditions of the task as a list
+    """
+    when = task.when
+    if isinstance(when, list):
+        return when
+    from ansible.utils.sentinel import Sentinel
+    if when is Sentinel:
+        return []
+    else:
+        return [when]
+
+def load_block(block_class:type[UMLStateBlockBase], block:Block, context:RenderContext, depth:int=0) -> Iterator[UMLStateBaseType]:
+    """
+    Load the block. `depth` is the number of the explicit blocks around it,
+    a block deeper than `--max-depth` is loaded as a summary state.
+    The tasks of an implicit block are loaded without the block.
+    """
+    logger = block_class.logger
+    if block.name or block.always or block.rescue:
+        if context.max_depth is not None and depth >= context.max_depth:
+            logger.debug('summarize block: %s', block.name)
+            yield block_class.SUMMARY_CLASS('block', 'Block: %s' % (block.name or ''),
+                                            count_tasks((block,)), context)
+            return
+        logger.debug('load block as explicit: %s', block.name)
+        yield block_class(block, context, depth)
+    elif isinstance(block.block, Iterable):
+        logger.debug('load block as implicit')
+        yield from load_tasks(block_class, block.block, context, depth)
+
+def load_tasks(block_class:type[UMLStateBlockBase], tasks:Iterable[Block|Task], context:RenderContext, depth:int=0) -> Iterator[UMLStateBaseType]:
+    """
+    Load the tasks and the blocks
+    """
+    for task in tasks:
+        if is_block(task):
+            yield from load_block(block_class, task, context, depth)
+        elif getattr(task, 'implicit', False):
+            block_class.logger.debug('skip: %s is implicit', task.get_name())
+            # Skip when the tasks is implicit `role_complete` block
+            # See: https://github.com/ansible/ansible/commit/1b70260d5aa2f6c9782fd2b848e8d16566e50d85
+            continue
+        elif context.includes is not None and (included := context.includes.resolve(task)) is not None:
+            block_class.logger.debug('include: %s', included.name)
+            yield from load_block(block_class, included, context, depth)
+        else:
+            yield block_class.TASK_CLASS(task, context)
+
+def init_block(state:UMLStateBlockBase, block:Block, context:Optional[RenderContext], depth:int) -> None:
+    """
+    Initialize the block state and load its children, see `UMLStateBlockBase.__init__`
+    """
+    state._init_state(BlockIR.from_block(block), context)
+    state.logger.debug('start: %s', state)
+    block_class = type(state)
+    depth += 1
+    context = state.context
+    state.tasks = tuple(load_tasks(block_class, block.block, context, depth)) if isinstance(block.block, Iterable) else ()
+    state.always = tuple(load_tasks(block_class, block.always, context, depth)) if isinstance(block.always, Iterable) else ()
+    state.rescue = tuple(load_tasks(block_class, block.rescue, context, depth)) if isinstance(block.rescue, Iterable) else ()
+    state._resolve_points()
+    state.logger.debug('end: %s', state)
+
+def init_play(state:UMLStatePlayBase, play:Play, context:RenderContext) -> None:
+    """
+    Initialize the play state and load its tasks and roles, see `UMLStatePlayBase.__init__`
+    """
+    logger = state.logger
+    logger.debug('start')
+    state.play = PlayIR.from_play(play)
+    state.context = context
+    state.id = context.next_id('play')
+    state.name = 'play_%d' % state.id
+    state.pre_tasks = state.roles = state.role_groups = state.tasks = state.post_tasks = ()
+    block_class = state.BLOCK_CLASS
+    profiler = context.profiler
+    with profiler.phase(state.name):
+        if isinstance(play.pre_tasks, Iterable):
+            with profiler.phase('pre_tasks'):
+                state.pre_tasks = tuple(load_tasks(block_class, play.pre_tasks, context))
+        if isinstance(play.roles, Iterable):
+            with profiler.phase('roles'):
+                state.role_groups = tuple(load_roles(state, play.roles, play))
+                state.roles = tuple(role_state for _, states in state.role_groups for role_state in states)
+        if isinstance(play.tasks, Iterable):
+            with profiler.phase('tasks'):
+                state.tasks = tuple(load_tasks(block_class, play.tasks, context))
+        if isinstance(play.post_tasks, Iterable):
+            with profiler.phase('post_tasks'):
+                state.post_tasks = tuple(load_tasks(block_class, play.post_tasks, context))
+    state._all_tasks = state.pre_tasks + state.roles + state.tasks + state.post_tasks
+    if logger.isEnabledFor(DEBUG):
+        logger.debug('%s: %s pre_tasks: %s', state, len(state.pre_tasks), [str(t) for t in state.pre_tasks])
+        logger.debug('%s: %s roles: %s', state, len(state.roles), [str(t) for t in state.roles])
+        logger.debug('%s: %s tasks: %s', state, len(state.tasks), [str(t) for t in state.tasks])
+        logger.debug('%s: %s post_tasks: %s', state, len(state.post_tasks), [str(t) for t in state.post_tasks])
+    logger.debug('end')
+
+def load_roles(state:UMLStatePlayBase, roles:Iterable, play:Play) -> Iterator[tuple[str, tuple[UMLStateBaseType, ...]]]:
+    '''
+    Load the states of each role of the play, yields the role name and the states
+    '''
+    context = state.context
+    block_class = state.BLOCK_CLASS
+    role_cache = context.role_cache
+    for role in roles:
+        if getattr(role, 'from_include', getattr(role, '_from_include', False)):
+            continue
+        name = str(role.get_name())
+        with context.profiler.phase(name):
+            if context.collapse_roles:
+                yield name, (block_class.SUMMARY_CLASS('role', 'Role: %s' % name,
+                                                       count_tasks(role.get_task_blocks()), context),)
+                continue
+            include_depth = context.includes.max_depth if context.includes is not None else None
+            key = role_key(role, play, context.max_depth, include_depth) if role_cache is not None else None
+            if key is None:
+                yield name, tuple(load_tasks(block_class, role.get_task_blocks(), context))
+                continue
+            imports = role_cache.imports(key)
+            if imports is not None:
+                files = role_files(key.path)
+                trees = role_cache.get(key, files + file_stats(imports))
+                if trees is not None:
+                    context.stats['role_cache_hits'] += 1
+                    state.logger.debug('role cache hit: %s', key.name)
+                    yield name, tuple(block_class.from_tree(tree, context) for tree in trees)
+                    continue
+            elif not role_cache.seen(key):
+                # stored from the second use, a role used once is not worth the stats of its files
+                context.stats['role_cache_misses'] += 1
+                yield name, tuple(load_tasks(block_class, role.get_task_blocks(), context))
+                continue
+            else:
+                files = role_files(key.path)
+            context.stats['role_cache_misses'] += 1
+            parser = context.fast_parser
+            with parser.record_files() if parser is not None else nullcontext({}) as read_files:
+                blocks = role.get_task_blocks()
+                states = tuple(load_tasks(block_class, blocks, context))
+            loaded = loaded_files(blocks, dict(read_files))
+            if loaded is None:
+                state.logger.debug('role not cached, a file is imported from a templated path: %s', key.name)
+                yield name, states
+                continue
+            imports = outside_files(key.path, loaded)
+            role_cache.put(key, files + file_stats(imports), tuple(role_state.to_tree() for role_state in states), imports)
+            yield name, states
+
+def loaded_files(tasks:Iterable, files:dict[str, None]) -> Optional[dict[str, None]]:
+    '''
+    Add the files the tasks and the blocks of Ansible were loaded from to `files`,
+    `None` when a block was imported from a templated path.
+    The files read by the fast parser are recorded by `FastPlaybookParser.record_files()`.
+    '''
+    from playbook2uml.dependency import is_template
+    for task in tasks:
+        # the blocks of `import_tasks` and `import_role` are children of the import
+        args = getattr(getattr(task, '_parent', None), 'args', None)
+        if isinstance(args, dict) and any(isinstance(value, str) and is_template(value) for value in args.values()):
+            return None
+        if is_block(task):
+            for section in (task.block, task.rescue, task.always):
+                if isinstance(section, Iterable) and loaded_files(section, files) is None:
+                    return None
+        elif (get_path := getattr(task, 'get_path', None)) is not None and (path := get_path()):
+            files.setdefault(os.path.normpath(path.rpartition(':')[0] or path), None)
+    return files
+
+def load_plays(umlplaybook:UMLStatePlaybookBase, playbook:str, option:Namespace,
+               environment:Optional[AnsibleEnvironment]=None) -> list[UMLStatePlayBase]:
+    """
+    Load the plays of the playbook (or of the dummy playbook of the role mode) as the states,
+    see `UMLStatePlaybookBase.__init__`
+    """
+    context = umlplaybook.context
+    play_class = umlplaybook.PLAY_CLASS
+    logger = umlplaybook.logger
+    profiler = context.profiler
+    fast_parser = None
+    if getattr(option, 'resolve_includes', False):
+        with profiler.phase('import'):
+            from playbook2uml.fastparser import FastPlaybookParser
+            from playbook2uml.includes import IncludeResolver, DEFAULT_INCLUDE_DEPTH
+        fast_parser = FastPlaybookParser()
+        base_dir = (option.BASE_DIR if option.role else os.path.dirname(playbook)) or '.'
+        context.includes = IncludeResolver(base_dir, getattr(option, 'include_depth', DEFAULT_INCLUDE_DEPTH), fast_parser)
+    if getattr(option, 'parser', 'ansible') == 'fast':
+        with profiler.phase('import'):
+            from playbook2uml.fastparser import FastPlaybookParser, load_plays as fast_load_plays
+        fast_parser = fast_parser or FastPlaybookParser()
+        context.fast_parser = fast_parser
+        logger.debug('load playbook with the fast parser: %s', option.role or playbook)
+        with profiler.phase('parse'):
+            # the included files are read by the same parser, each file is parsed once
+            plays = fast_load_plays(playbook, option, fast_parser)
+        with profiler.phase('states'):
+            umlplays = [play_class(play, context) for play in plays]
+        name_states(umlplays, context)
+        log_role_cache(umlplaybook)
+        log_includes(umlplaybook)
+        return umlplays
+
+    context.fast_parser = fast_parser
+    with profiler.phase('import'):
+        _require_ansible()
+        from ansible.playbook import Playbook
+        from ansible.playbook.play import Play
+    if environment is None:
+        environment = AnsibleEnvironment(profiler)
+    dataloader = environment.dataloader
+    variable_manager = environment.variable_manager
+
+    if option.role:
+        '''
+        For only role mode.
+        Load a dummy play data which imports the role only.
+        '''
+        role_name = option.role
+        dummy_play = {
+            'hosts': 'all',
+            'tasks': [
+                {
+                    'import_role': {
+                        'name': role_name,
+                        'tasks_from': option.tasks_from
+                    }
+                }
+            ]
+        }
+        logger.debug('load dummy play: %s', dummy_play)
+        with _ansible_lock:
+            with profiler.phase('parse'):
+                dataloader.set_basedir(option.BASE_DIR)
+                pb = Playbook(loader=dataloader)
+                plays = [Play.load(dummy_play, variable_manager=variable_manager, loader=pb._loader, vars=None)]
+            with profiler.phase('states'):
+                umlplays = [play_class(play, context) for play in plays]
+    else:
+        '''
+        For whole of the playbook.
+        '''
+        logger.debug('load playbook: %s', playbook)
+        with _ansible_lock:
+            with profiler.phase('parse'):
+                pb = Playbook.load(playbook, variable_manager=variable_manager, loader=dataloader)
+            with profiler.phase('states'):
+                umlplays = [play_class(play, context) for play in pb.get_plays()]
+    name_states(umlplays, context)
+    log_role_cache(umlplaybook)
+    log_includes(umlplaybook)
+    return umlplays
+
+def name_states(umlplays:list[UMLStatePlayBase], context:RenderContext) -> None:
+    '''
+    Rename the states by their paths with `--stable-ids`, they are named by the counters when loaded
+    '''
+    if context.stable_ids:
+        from playbook2uml.umlstate.naming import assign_stable_names
+        with context.profiler.phase('names'):
+            assign_stable_names(umlplays)
+
+def log_role_cache(umlplaybook:UMLStatePlaybookBase) -> None:
+    context = umlplaybook.context
+    role_cache = context.role_cache
+    hits = context.stats['role_cache_hits']
+    misses = context.stats['role_cache_misses']
+    if role_cache is None or not (hits or misses):
+        return
+    total = role_cache.stats()
+    umlplaybook.logger.info('role cache: %d hits, %d misses (%.0f%%), process total: %d hits, %d misses (%.0f%%)',
+                            hits, misses, 100 * hits / (hits + misses), total.hits, total.misses, 100 * total.hit_rate)
+
+def log_includes(umlplaybook:UMLStatePlaybookBase) -> None:
+    resolver = umlplaybook.context.includes
+    if resolver is None:
+        return
+    stats = resolver.stats
+    umlplaybook.logger.info('includes: %d resolved, %d dynamic, %d missing, %d cycles, %d too deep, %d files parsed',
+                            stats['resolved'], stats['dynamic'], stats['missing'], stats['cycles'], stats['too_deep'],
+                            len(resolver.parser._yaml_cache))
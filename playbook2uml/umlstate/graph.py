@@ -0,0 +1,343 @@
+#!env python
+# -*- coding: utf-8 -*-
+'''
+The state graph as a stream of records: `-t json` (JSON Lines) and `-t msgpack`.
+
+Other tools (search, dashboards, diff) can reuse the plays, blocks and tasks read
+by playbook2uml without parsing the playbook again, and `load_graph` renders the
+PlantUML/Mermaid.js diagram from the file without ansible-core.
+
+The records are written one at a time while the states are walked, the whole
+document is never built in memory. Each record is a map with a `type`:
+
+- `graph`: the first record, `format` ("playbook2uml-graph"), `version`, `playbook`, `role` and `tasks_from`
+- `play`: `id`, the attributes of the play (see `PlayIR`), `entry` and `end`
+- `role`: `id` and `name` of a role of the play
+- `block`: `id`, `name`, `entry` and `end`
+- `task`: `id`, the attributes of the task (see `TaskIR`), `entry` and `end`
+- `summary`: `id`, `kind`, `label`, `task_count` and `link`, see `UMLStateSummaryBase`
+- `transition`: `from`, `to` and `label` (`null`, `"skip"`, `"loop"` or `"retry"`)
+- `end`: the last record, with the number of `plays`
+
+`id` is the name of the state in the diagrams. `entry` and `end` are the names of the states
+the transitions into and out of the state use, e.g. `task_1_when` for a task with `when`.
+
+`role`, `block`, `task` and `summary` have the `id` of their `parent` and the `section` of
+the parent they are in: `pre_tasks`, `roles`, `tasks` or `post_tasks` of a play,
+`tasks` of a role, `tasks`, `always` or `rescue` of a block.
+A parent is written before its children, the transitions of a play after its states.
+
+Example:
+    {"type":"graph","format":"playbook2uml-graph","version":1,"playbook":"site.yml","role":"","tasks_from":"main"}
+    {"type":"play","id":"play_1","name":"play 1","hosts":"all","explicit":["hosts"],"vars_files":[],"vars_prompt":[],"entry":"task_1","end":"task_1"}
+    {"type":"task","id":"task_1","name":"ping","action":"ping","args":{},"when":[],...,"parent":"play_1","section":"tasks"}
+    {"type":"transition","from":"[*]","to":"task_1","label":null}
+    {"type":"transition","from":"task_1","to":"[*]","label":null}
+    {"type":"end","plays":1}
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import Any, Iterable, Iterator, Optional
+from argparse import Namespace
+from collections import defaultdict
+import contextlib
+import gzip
+import json
+import sys
+from playbook2uml.umlstate.base import (
+    pair_state_iter,
+    UMLStatePlaybookBase,
+    UMLStatePlayBase,
+    UMLStateBase,
+    UMLStateTaskBase,
+    UMLStateBlockBase,
+    UMLStateSummaryBase,
+    UMLStateStart
+)
+from playbook2uml.umlstate.ir import TaskIR, BlockIR, PlayIR
+from playbook2uml.profiling import Profiler
+
+GRAPH_FORMAT = 'playbook2uml-graph'
+GRAPH_VERSION = 1
+
+Record = dict[str, Any]
+
+def _import_msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise ImportError('the msgpack package is required for msgpack graphs: pip install msgpack') from None
+    return msgpack
+
+def _transition(source:str, target:str, label:Optional[str]=None) -> Record:
+    return {'type': 'transition', 'from': source, 'to': target, 'label': label}
+
+def _points(state:UMLStateBase) -> tuple[Optional[str], Optional[str]]:
+    '''
+    Get the entry and end point names, `None` when the state has no tasks
+    '''
+    try:
+        return state.get_entry_point_name(), state.get_end_point_name()
+    except IndexError:
+        return None, None
+
+def _in_section(records:Iterable[Record], parent:str, section:str) -> Iterator[Record]:
+    '''
+    Set the parent and the section of the records of the direct children.
+    The records of the grandchildren already have their parent.
+    '''
+    for record in records:
+        if 'parent' not in record:
+            record['parent'] = parent
+            record['section'] = section
+        yield record
+
+class UMLStateTask(UMLStateTaskBase):
+    """
+    A task written as a `task` record and its `transition` records
+    """
+    __slots__ = ()
+
+    def generateDefinition(self, level:int=0) -> Iterator[Record]:
+        yield {'type': 'task', 'id': self.name, **self.task.to_dict(),
+               'entry': self._entry_point_name, 'end': self._end_point_name}
+
+    def generateRelation(self, next:Optional[UMLStateBase], level:int=0) -> Iterator[Record]:
+        if next is not None:
+            if self.has_when:
+                yield _transition(self._entry_point_name, self.name)
+                yield _transition(self._end_point_name, next.get_entry_point_name())
+                yield _transition(self._entry_point_name, next.get_entry_point_name(), 'skip')
+            else:
+                yield _transition(self._end_point_name, next.get_entry_point_name())
+
+        if self.task.loop is not None:
+            yield _transition(self.name, self._entry_point_name, 'loop')
+
+        if self.has_until:
+            yield _transition(self.name, self._end_point_name)
+            yield _transition(self._end_point_name, self._entry_point_name, 'retry')
+
+class UMLStateSummary(UMLStateSummaryBase):
+    """
+    A role collapsed by `--collapse-roles` or a block deeper than `--max-depth`,
+    written as a `summary` record
+    """
+    __slots__ = ()
+
+    def generateDefinition(self, level:int=0) -> Iterator[Record]:
+        yield {'type': 'summary', 'id': self.name, 'kind': self.kind, 'label': self.label,
+               'task_count': self.task_count, 'link': self.link, 'entry': self.name, 'end': self.name}
+
+    def generateRelation(self, next:Optional[UMLStateBase], level:int=0) -> Iterator[Record]:
+        if next is not None:
+            yield _transition(self.name, next.get_entry_point_name())
+
+class UMLStateBlock(UMLStateBlockBase):
+    """
+    A block written as a `block` record followed by the records of its children
+    """
+    __slots__ = ()
+
+    TASK_CLASS = UMLStateTask
+    SUMMARY_CLASS = UMLStateSummary
+
+    def _generateBlockDefinition(self, level:int=0) -> Iterator[Record]:
+        entry, end = _points(self)
+        yield {'type': 'block', 'id': self.name, **self.block.to_dict(), 'entry': entry, 'end': end}
+        for section in ('tasks', 'always', 'rescue'):
+            for task in getattr(self, section):
+                yield from _in_section(task.generateDefinition(), self.name, section)
+
+class UMLStatePlay(UMLStatePlayBase):
+    """
+    A play written as a `play` record followed by the records of its roles and tasks
+    """
+    __slots__ = ()
+
+    BLOCK_CLASS = UMLStateBlock
+
+    def generateDefinition(self, level:int=0, only_role=False) -> Iterator[Record]:
+        entry, end = _points(self)
+        yield {'type': 'play', 'id': self.name, **self.play.to_dict(), 'entry': entry, 'end': end}
+        yield from self._generateSection('pre_tasks', self.pre_tasks)
+        for index, (role_name, states) in enumerate(self.role_groups, 1):
+            role_id = '%s_role_%d' % (self.name, index)
+            yield {'type': 'role', 'id': role_id, 'name': role_name, 'parent': self.name, 'section': 'roles'}
+            for state in states:
+                yield from _in_section(state.generateDefinition(), role_id, 'tasks')
+        yield from self._generateSection('tasks', self.tasks)
+        yield from self._generateSection('post_tasks', self.post_tasks)
+
+    def _generateSection(self, section:str, states:tuple) -> Iterator[Record]:
+        for state in states:
+            yield from _in_section(state.generateDefinition(), self.name, section)
+
+    def generateRelation(self, next:Optional[UMLStateBase], level:int=0) -> Iterator[Record]:
+        for current_state, next_state in pair_state_iter(*self.get_all_tasks(), next):
+            yield from current_state.generateRelation(next_state)
+
+class UMLStatePlaybook(UMLStatePlaybookBase):
+    """
+    Writes the states of the playbook as JSON Lines (`-t json`) or as a MessagePack stream (`-t msgpack`).
+
+    `generate()` yields one JSON document (`str`) or one packed record (`bytes`) per record.
+    """
+
+    PLAY_CLASS  = UMLStatePlay
+    BLOCK_CLASS = UMLStateBlock
+    TASK_CLASS  = UMLStateTask
+
+    def generate(self) -> Iterator[str|bytes]:
+        return self.generate_plays(self.plays)
+
+    def generate_plays(self, plays:list[UMLStatePlay], only_role:Optional[bool]=None) -> Iterator[str|bytes]:
+        '''
+        Generate the encoded records of the plays.
+        The role mode is written to the `graph` record, `only_role` is not used.
+        '''
+        records = self.generate_records(plays)
+        if self.options is not None and self.options.type == 'msgpack':
+            packer = _import_msgpack().Packer(default=str)
+            return map(packer.pack, records)
+        encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str)
+        return map(encoder.encode, records)
+
+    def generate_records(self, plays:list[UMLStatePlay]) -> Iterator[Record]:
+        '''
+        Generate the records of the plays
+        '''
+        self.logger.info('START [graph]')
+        option = self.options
+        yield {'type': 'graph', 'format': GRAPH_FORMAT, 'version': GRAPH_VERSION,
+               'playbook': getattr(option, 'PLAYBOOK', None), 'role': getattr(option, 'role', '') or '',
+               'tasks_from': getattr(option, 'tasks_from', 'main')}
+        profiler = self.context.profiler
+        if plays:
+            yield _transition('[*]', plays[0].get_entry_point_name())
+        for current_state, next_state in pair_state_iter(*plays, UMLStateStart()):
+            yield from profiler.iterate(f'generate/{current_state.name}/definitions', current_state.generateDefinition())
+            yield from profiler.iterate(f'generate/{current_state.name}/relations', current_state.generateRelation(next_state))
+        yield {'type': 'end', 'plays': len(plays)}
+        self.logger.info('END')
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+def read_records(path:str) -> Iterator[Record]:
+    '''
+    Read the records of a graph file written by `-t json` or `-t msgpack`,
+    also gzip compressed. `-` reads STDIN. The records are read one at a time.
+    '''
+    with contextlib.ExitStack() as stack:
+        stream = sys.stdin.buffer if path == '-' else stack.enter_context(open(path, 'rb'))
+        if stream.peek(2)[:2] == GZIP_MAGIC:
+            stream = stack.enter_context(gzip.GzipFile(fileobj=stream, mode='rb'))
+        if stream.peek(1)[:1] == b'{':
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from _import_msgpack().Unpacker(stream, raw=False)
+
+def load_graph(path:str, playbook_class:type[UMLStatePlaybookBase], option:Namespace,
+               profiler:Optional[Profiler]=None) -> UMLStatePlaybookBase:
+    '''
+    Load the plays of a graph file as the states of `playbook_class`,
+    e.g. `playbook2uml.umlstate.plantuml.UMLStatePlaybook`, without ansible-core.
+
+    The states keep the names written in the file. The `transition` records are not read,
+    the transitions are derived from the states again.
+
+    The records are read one at a time and each play is built as soon as its records are read,
+    so only the records of one play are held in memory with the states already built.
+
+    Args:
+        path (str): The graph file, `-` reads STDIN
+        playbook_class: The playbook class of the diagram type
+        option (Namespace): The diagram options. The role mode is read from the graph.
+        profiler (Profiler, optional): Records the `parse` and `states` phases,
+            and the reading of the records as `parse/records`
+
+    Raises:
+        ValueError: when the file is not a graph of a supported version
+    '''
+    option = Namespace(**vars(option))
+    umlplaybook = playbook_class.empty(option, profiler)
+    profiler = umlplaybook.context.profiler
+    with profiler.phase('parse'):
+        records = read_records(path)
+        header = next(records, None)
+        if header is None or header.get('type') != 'graph' or header.get('format') != GRAPH_FORMAT:
+            raise ValueError(f'not a playbook2uml graph: {path}')
+        if header.get('version') != GRAPH_VERSION:
+            raise ValueError(f'unsupported graph version {header.get("version")}: {path}')
+        option.role = header.get('role') or ''
+        option.tasks_from = header.get('tasks_from') or 'main'
+    builder = _GraphBuilder(playbook_class, umlplaybook.context)
+    for play, children in _play_records(profiler.iterate('parse/records', records)):
+        with profiler.phase('states'):
+            umlplaybook.plays.append(builder.build_play(play, children))
+    umlplaybook.logger.debug('loaded %d plays from %s', len(umlplaybook.plays), path)
+    return umlplaybook
+
+def _play_records(records:Iterable[Record]) -> Iterator[tuple[Record, dict[str, list[Record]]]]:
+    '''
+    Generate each play record with the records of the children of each parent in the play.
+    A play is generated when the next play (or the end of the records) is read,
+    the states of a play are written before the next play. The other records are skipped.
+    '''
+    play: Optional[Record] = None
+    children: defaultdict[str, list[Record]] = defaultdict(list)
+    for record in records:
+        kind = record.get('type')
+        if kind == 'play':
+            if play is not None:
+                yield play, children
+            play, children = record, defaultdict(list)
+        elif kind in ('role', 'block', 'task', 'summary'):
+            children[record['parent']].append(record)
+    if play is not None:
+        yield play, children
+
+class _GraphBuilder:
+    '''
+    Create the states of a play from the records grouped by `_play_records`
+    '''
+
+    def __init__(self, playbook_class:type[UMLStatePlaybookBase], context) -> None:
+        self.play_class = playbook_class.PLAY_CLASS
+        self.block_class = playbook_class.BLOCK_CLASS
+        self.context = context
+        self.children: dict[str, list[Record]] = {}
+
+    def sections(self, parent:str) -> defaultdict[str, list[Record]]:
+        result: defaultdict[str, list[Record]] = defaultdict(list)
+        for record in self.children.pop(parent, ()):
+            result[record['section']].append(record)
+        return result
+
+    def build(self, record:Record) -> UMLStateBase:
+        kind = record['type']
+        if kind == 'task':
+            return self.block_class.TASK_CLASS.from_ir(TaskIR.from_dict(record), self.context, record['id'])
+        if kind == 'summary':
+            return self.block_class.SUMMARY_CLASS(record['kind'], record['label'], record['task_count'],
+                                                  self.context, link=record.get('link'), name=record['id'])
+        if kind == 'block':
+            sections = self.sections(record['id'])
+            return self.block_class.from_states(BlockIR.from_dict(record), self.context, name=record['id'],
+                                                **{section: self.build_all(sections[section])
+                                                   for section in ('tasks', 'always', 'rescue')})
+        raise ValueError(f'unexpected {kind} record in a block: {record.get("id")}')
+
+    def build_all(self, records:list[Record]) -> tuple[UMLStateBase, ...]:
+        return tuple(self.build(record) for record in records)
+
+    def build_play(self, record:Record, children:dict[str, list[Record]]) -> UMLStatePlayBase:
+        self.children = children
+        sections = self.sections(record['id'])
+        role_groups = tuple((role['name'], self.build_all(self.sections(role['id'])['tasks']))
+                            for role in sections['roles'])
+        return self.play_class.from_states(
+            PlayIR.from_dict(record), self.context, name=record['id'],
+            pre_tasks=self.build_all(sections['pre_tasks']), role_groups=role_groups,
+            tasks=self.build_all(sections['tasks']), post_tasks=self.build_all(sections['post_tasks']))
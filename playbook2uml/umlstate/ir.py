@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+'''
+Compact intermediate representation of the plays, blocks and tasks.
+
+The states copy what the diagrams show from Ansible's `Play`/`Block`/`Task`
+(or the nodes of `playbook2uml.fastparser`) into these slotted records when they
+are created, and drop the reference to the original object. The Ansible objects,
+their parents and the DataLoader can then be released right after loading,
+instead of living until the diagram is generated.
+
+The values are converted to plain Python types, because the strings of ansible-core
+carry their origin (file, line) with them. So the records can also be written to
+a graph file and read back without ansible-core (see `playbook2uml.umlstate.graph`).
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import Any, Optional
+
+def to_plain(value:Any) -> Any:
+    '''
+    Convert the value (and the items of lists and dicts) to plain `str`/`list`/`dict`.
+    Other values (`int`, `bool`, `None` ...) are returned as is.
+    '''
+    if isinstance(value, str):
+        return value if type(value) is str else str.__str__(value)
+    elif isinstance(value, dict):
+        return {to_plain(k): to_plain(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [to_plain(v) for v in value]
+    return value
+
+class TaskIR:
+    """
+    The attributes of a task used by the diagrams
+    """
+    __slots__ = ('name', 'action', 'args', 'when', 'loop', 'loop_with',
+                 'until', 'retries', 'delay', 'become', 'become_user', 'register', 'delegate_to')
+
+    def __init__(self, name:str, action:str, args:dict, when:tuple=(), loop:Any=None, loop_with:Optional[str]=None,
+                 until:Any=None, retries:Any=None, delay:Any=None, become:Any=None, become_user:Any=None,
+                 register:Any=None, delegate_to:Any=None) -> None:
+        self.name = name
+        self.action = action
+        self.args = args
+        self.when = when
+        self.loop = loop
+        self.loop_with = loop_with
+        self.until = until
+        self.retries = retries
+        self.delay = delay
+        self.become = become
+        self.become_user = become_user
+        self.register = register
+        self.delegate_to = delegate_to
+
+    @classmethod
+    def from_task(cls, task, when:list) -> TaskIR:
+        """
+        Copy the attributes of the task.
+
+        Args:
+            task: Ansible's `Task` or `FastTask`
+            when (list): The conditions of the task, see `UMLStateTaskBase._get_when_list`
+        """
+        return cls(
+            name=str(task.get_name()),
+            action=to_plain(task.action),
+            args=to_plain(task.args) if task.args else {},
+            when=tuple(to_plain(when)),
+            loop=to_plain(task.loop),
+            loop_with=to_plain(getattr(task, 'loop_with', None)),
+            until=to_plain(task.until),
+            retries=to_plain(task.retries),
+            delay=to_plain(task.delay),
+            become=to_plain(task.become),
+            become_user=to_plain(task.become_user),
+            register=to_plain(task.register),
+            delegate_to=to_plain(task.delegate_to),
+        )
+
+    @classmethod
+    def from_dict(cls, data:dict) -> TaskIR:
+        '''
+        Create the record from `to_dict()`, other keys are ignored
+        '''
+        task = cls(**{key: data[key] for key in cls.__slots__ if key in data})
+        task.when = tuple(task.when or ())
+        return task
+
+    def to_dict(self) -> dict[str, Any]:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def get_name(self) -> str:
+        return self.name
+
+    def __repr__(self) -> str:
+        return f'<TaskIR({self.name!r}, action={self.action!r})>'
+
+class BlockIR:
+    """
+    The attributes of a block used by the diagrams
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name:str='') -> None:
+        self.name = name
+
+    @classmethod
+    def from_block(cls, block) -> BlockIR:
+        return cls(to_plain(block.name) or '')
+
+    @classmethod
+    def from_dict(cls, data:dict) -> BlockIR:
+        return cls(data.get('name') or '')
+
+    def to_dict(self) -> dict[str, Any]:
+        return {'name': self.name}
+
+class PlayIR:
+    """
+    The attributes of a play used by the diagrams.
+
+    `explicit` holds the names of the keywords written in the play,
+    the implicit `hosts`, `strategy`, `serial` and `gather_facts` are not shown.
+    """
+    __slots__ = ('name', 'hosts', 'strategy', 'serial', 'gather_facts', 'explicit', 'vars_files', 'vars_prompt')
+
+    METADATA_KEYS = ('hosts', 'strategy', 'serial', 'gather_facts')
+
+    def __init__(self, name:str, hosts:Any=None, strategy:Any=None, serial:Any=None, gather_facts:Any=None,
+                 explicit:frozenset[str]=frozenset(), vars_files:tuple=(), vars_prompt:tuple=()) -> None:
+        self.name = name
+        self.hosts = hosts
+        self.strategy = strategy
+        self.serial = serial
+        self.gather_facts = gather_facts
+        self.explicit = explicit
+        self.vars_files = vars_files
+        self.vars_prompt = vars_prompt
+
+    @classmethod
+    def from_play(cls, play) -> PlayIR:
+        """
+        Copy the attributes of the play.
+
+        Args:
+            play: Ansible's `Play` or `FastPlay`
+        """
+        ds: dict = getattr(play, '_ds', None) or {}
+        explicit = frozenset(key for key in cls.METADATA_KEYS if key in ds and hasattr(play, key))
+        vars_files = play.vars_files if isinstance(play.vars_files, list) else ()
+        vars_prompt = play.vars_prompt if isinstance(play.vars_prompt, list) else ()
+        return cls(
+            name=str(play.get_name()),
+            explicit=explicit,
+            vars_files=tuple(to_plain(vars_files)),
+            vars_prompt=tuple({'name': to_plain(prompt['name'])} for prompt in vars_prompt),
+            **{key: to_plain(getattr(play, key)) for key in explicit},
+        )
+
+    @classmethod
+    def from_dict(cls, data:dict) -> PlayIR:
+        '''
+        Create the record from `to_dict()`, other keys are ignored
+        '''
+        explicit = frozenset(key for key in data.get('explicit') or () if key in cls.METADATA_KEYS)
+        return cls(
+            name=data['name'],
+            explicit=explicit,
+            vars_files=tuple(data.get('vars_files') or ()),
+            vars_prompt=tuple(data.get('vars_prompt') or ()),
+            **{key: data.get(key) for key in explicit},
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        '''
+        Get the attributes as plain values. Only the explicit metadata keys are included.
+        '''
+        return {
+            'name': self.name,
+            **{key: getattr(self, key) for key in self.METADATA_KEYS if key in self.explicit},
+            'explicit': sorted(self.explicit),
+            'vars_files': list(self.vars_files),
+            'vars_prompt': list(self.vars_prompt),
+        }
+
+    def get_name(self) -> str:
+        return self.name
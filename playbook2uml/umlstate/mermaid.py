@@ -11,6 +11,7 @@ from playbook2uml.umlstate.base import (
     UMLStateBase,
     UMLStateTaskBase,
     UMLStateBlockBase,
+    UMLStateSummaryBase,
     UMLStateStart
 )
 
@@ -22,9 +23,10 @@ class UMLStateTask(UMLStateTaskBase):
     including support for conditional execution (when), retry loops (until), and iterative
     loops (loop).
     """
+    __slots__ = ()
 
     def generateDefinition(self, level:int=0) -> Iterator[str]:
-        self.logger.debug(f'start {self}')
+        self.logger.debug('start %s', self)
         prefix = indent * level
         if self.has_when:
             yield from self._generateWhenDefinition(level)
@@ -34,7 +36,7 @@ class UMLStateTask(UMLStateTaskBase):
         if self.has_until:
             yield from self._generateUntilDefinition(level)
 
-        self.logger.debug(f'end {self}')
+        self.logger.debug('end %s', self)
 
     def _generateUntilDefinition(self, level:int=0) -> Iterator[str]:
         yield '%sstate %s <<choice>>' % (indent*level, self._end_point_name)
@@ -54,7 +56,7 @@ class UMLStateTask(UMLStateTaskBase):
         yield '%send note' % (indent*level)
 
     def generateRelation(self, next: Optional[UMLStateBase], level:int=0) -> Iterator[str]:
-        self.logger.debug(f'start {self}')
+        self.logger.debug('start %s', self)
         prefix = indent * level
         if next is not None:
             if self.has_when:
@@ -70,7 +72,7 @@ class UMLStateTask(UMLStateTaskBase):
             yield '%s%s --> %s' % (prefix, self.name, self._end_point_name)
             yield '%s%s --> %s : retry' % (prefix, self._end_point_name, self._entry_point_name)
 
-        self.logger.debug(f'end {self}')
+        self.logger.debug('end %s', self)
 
     def _generateLoopRelation(self, level:int=0) -> Iterator[str]:
         if self.task.loop is None:
@@ -87,6 +89,21 @@ class UMLStateTask(UMLStateTaskBase):
             loop_items.append(str(self.task.loop))
         yield '%s%s --> %s : %s' % (prefix, self.name, self._entry_point_name, '\\n'.join(loop_items))
 
+class UMLStateSummary(UMLStateSummaryBase):
+    """
+    A role collapsed by `--collapse-roles` or a block deeper than `--max-depth`,
+    shown as one state with the number of its tasks.
+    """
+    __slots__ = ()
+
+    def generateDefinition(self, level:int=0) -> Iterator[str]:
+        tasks = '%d task%s' % (self.task_count, '' if self.task_count == 1 else 's')
+        yield f'{indent * level}state "{self.label}<hr>{tasks}" as {self.name}'
+
+    def generateRelation(self, next:Optional[UMLStateBase], level:int=0) -> Iterator[str]:
+        if next is not None:
+            yield '%s%s --> %s' % (indent * level, self.name, next.get_entry_point_name())
+
 class UMLStateBlock(UMLStateBlockBase):
     """
     A UML state block generator for Mermaid diagram syntax.
@@ -95,11 +112,13 @@ class UMLStateBlock(UMLStateBlockBase):
     for Ansible playbook blocks, including support for task execution, always blocks,
     and rescue (error handling) blocks.
     """
+    __slots__ = ()
 
     TASK_CLASS = UMLStateTask
+    SUMMARY_CLASS = UMLStateSummary
 
-    def generateDefinition(self, level:int=0) -> Iterator[str]:
-        self.logger.debug(f'start {self}')
+    def _generateBlockDefinition(self, level:int=0) -> Iterator[str]:
+        self.logger.debug('start %s', self)
         is_explicit = self.block.name or self.always or self.rescue
         next_level = level
         prefix = indent * level
@@ -116,7 +135,7 @@ class UMLStateBlock(UMLStateBlockBase):
             yield from self._generateRescueDefinition(next_level)
             yield f'{prefix}}}'
 
-        self.logger.debug(f'end {self}')
+        self.logger.debug('end %s', self)
 
     def _generateAlwaysDefinition(self, level:int=0) -> Iterator[str]:
         if not self.always:
@@ -145,29 +164,28 @@ class UMLStatePlay(UMLStatePlayBase):
     This class generates Mermaid state diagram definitions and relations for a play,
     which contains multiple tasks organized in blocks.
     """
+    __slots__ = ()
 
     BLOCK_CLASS = UMLStateBlock
 
     def generateDefinition(self, level:int=0, only_role=False) -> Iterator[str]:
-        self.logger.debug(f'start {self}')
+        self.logger.debug('start %s', self)
         if not only_role:
             yield '%sstate "Play: %s" as %s {' % (indent*level, self.play.get_name(), self.name)
             level += 1
 
-        for tasks in self.get_all_tasks():
-            yield from tasks.generateDefinition(level)
+        yield from self.generateStatesDefinition(level)
 
         if not only_role:
             yield '%s}' % (indent*(level-1))
 
-        self.logger.debug(f'end {self}')
+        self.logger.debug('end %s', self)
 
     def generateRelation(self, next:Optional[UMLStateBase], level:int=0) -> Iterator[str]:
-        self.logger.debug(f'start {self}')
-        for current_state, next_state in pair_state_iter(*self.get_all_tasks(), next):
-            yield from current_state.generateRelation(next_state, level=level)
+        self.logger.debug('start %s', self)
+        yield from self.generateStatesRelation(next, level=level)
 
-        self.logger.debug(f'end {self}')
+        self.logger.debug('end %s', self)
 
 class UMLStatePlaybook(UMLStatePlaybookBase):
     """
@@ -188,25 +206,56 @@ class UMLStatePlaybook(UMLStatePlaybookBase):
         '''
         Generate Mermaid.js codes
         '''
-        self.logger.info('START [Mermaid.js]')
-        only_role = False
+        return self.generate_plays(self.plays)
+
+    def _generateHeader(self) -> Iterator[str]:
         yield 'stateDiagram-v2'
-        if self.options:
-            if self.options.left_to_right:
-                self.logger.debug(f'set left-to-right-direction')
-                yield f'{indent}direction LR'
+        if self.options and self.options.left_to_right:
+            self.logger.debug('set left-to-right-direction')
+            yield f'{indent}direction LR'
 
-            only_role = self.options.role != ''
+    def generate_plays(self, plays:list[UMLStatePlay], only_role:Optional[bool]=None) -> Iterator[str]:
+        '''
+        Generate one Mermaid.js diagram of the plays.
 
-        self.logger.info(f'START generate definitions (role-mode={only_role})')
-        for umlplay in self.plays:
-            yield from umlplay.generateDefinition(level=1, only_role=only_role)
+        Args:
+            plays: The plays, e.g. one play of `self.plays` (see `playbook2uml.split`)
+            only_role (bool, optional): Show the tasks without the play.
+                The role mode of the options when omitted.
+        '''
+        self.logger.info('START [Mermaid.js]')
+        if only_role is None:
+            only_role = bool(self.options) and self.options.role != ''
+        yield from self._generateHeader()
+
+        self.logger.info('START generate definitions (role-mode=%s)', only_role)
+        self.context.new_subtree_cache()
+        profiler = self.context.profiler
+        for umlplay in plays:
+            yield from profiler.iterate(f'generate/{umlplay.name}/definitions', umlplay.generateDefinition(level=1, only_role=only_role))
         self.logger.info('END generate definitions')
 
-        self.logger.info(f'START generate relations (role-mode={only_role})')
+        self.logger.info('START generate relations (role-mode=%s)', only_role)
         start_end = UMLStateStart()
-        for current_state, next_state in pair_state_iter(start_end, *self.plays, start_end):
-            yield from current_state.generateRelation(next_state, level=1)
+        for current_state, next_state in pair_state_iter(start_end, *plays, start_end):
+            yield from profiler.iterate(f'generate/{current_state.name}/relations', current_state.generateRelation(next_state, level=1))
         self.logger.info('END generate relations')
+        self.context.subtree_cache = None
 
         self.logger.info('END')
+
+    def generate_index(self, links:list[tuple[UMLStatePlay, str]]) -> Iterator[str]:
+        '''
+        Generate the index diagram: one state per play, labeled with the diagram file of the play.
+
+        Args:
+            links: The plays and the paths of their diagrams, relative to the index
+        '''
+        yield from self._generateHeader()
+        for umlplay, link in links:
+            task_count = umlplay.count_tasks()
+            tasks = '%d task%s' % (task_count, '' if task_count == 1 else 's')
+            yield f'{indent}state "Play: {umlplay.play.get_name()}<hr>{tasks}<br>{link}" as {umlplay.name}'
+        names = ['[*]', *(umlplay.name for umlplay, _ in links), '[*]']
+        for current_name, next_name in pair_state_iter(*names):
+            yield f'{indent}{current_name} --> {next_name}'
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+'''
+Structural paths of the states and the stable names derived from them (`--stable-ids`).
+
+The path of a state is where it is in the playbook: the play, the section (`pre_tasks`,
+`roles/ROLE`, `tasks`, `post_tasks`), the enclosing blocks (and their `always`/`rescue`)
+and the name of the task with its action, e.g.
+
+    site/tasks/block:install/rescue/report failure (debug)
+
+A path which appears several times in the same parent gets the number of the occurrence
+(` #2`, ` #3` ...), so inserting a task only changes the paths of the tasks with the same
+name and action after it in the same parent.
+
+By default the states are named by counters (`task_1`, `task_2` ...), so inserting a task
+renames all the states after it. With `--stable-ids`, the name is the kind of the state and
+a hash of its path (`task_5f0c3a1e`): the lines of an unchanged part of the playbook stay
+byte-identical, and the diagrams can be compared and cached by their parts.
+On a collision of the hashes, a longer hash is used.
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import TYPE_CHECKING, Iterable, Iterator
+from collections import Counter
+import hashlib
+
+if TYPE_CHECKING:
+    from playbook2uml.umlstate.base import UMLStateBase, UMLStatePlayBase
+
+HASH_LENGTH = 8
+"""
+The number of the hex digits of the hash in the names
+"""
+
+def occurrence(counter:Counter, key:str) -> str:
+    '''
+    Count the key, and get it with the number of the occurrence from the second one
+    '''
+    counter[key] += 1
+    number = counter[key]
+    return key if number == 1 else '%s #%d' % (key, number)
+
+def state_key(state) -> str:
+    '''
+    Get the name and the action of a task, or the label of a summary state
+    '''
+    task = getattr(state, 'task', None)
+    if task is not None:
+        return '%s (%s)' % (task.get_name(), task.action)
+    return state.label
+
+def walk_paths(plays:Iterable[UMLStatePlayBase]) -> Iterator[tuple[str, UMLStateBase]]:
+    '''
+    Walk the plays, the blocks, the tasks and the summary states with their paths,
+    in the order of the diagram (a block before its children)
+    '''
+    play_names: Counter[str] = Counter()
+    for umlplay in plays:
+        play_path = occurrence(play_names, umlplay.play.get_name())
+        yield play_path, umlplay
+        yield from _walk(play_path + '/pre_tasks', umlplay.pre_tasks)
+        role_names: Counter[str] = Counter()
+        for role_name, states in umlplay.role_groups:
+            yield from _walk('%s/roles/%s' % (play_path, occurrence(role_names, role_name)), states)
+        yield from _walk(play_path + '/tasks', umlplay.tasks)
+        yield from _walk(play_path + '/post_tasks', umlplay.post_tasks)
+
+def _walk(parent:str, states:Iterable) -> Iterator[tuple[str, UMLStateBase]]:
+    names: Counter[str] = Counter()
+    for state in states:
+        if hasattr(state, 'block'):
+            path = '%s/%s' % (parent, occurrence(names, 'block:%s' % state.block.name))
+            yield path, state
+            yield from _walk(path, state.tasks)
+            yield from _walk(path + '/always', state.always)
+            yield from _walk(path + '/rescue', state.rescue)
+            continue
+        yield '%s/%s' % (parent, occurrence(names, state_key(state))), state
+
+def _kind(state) -> str:
+    if hasattr(state, 'play'):
+        return 'play'
+    if hasattr(state, 'block'):
+        return 'block'
+    if hasattr(state, 'task'):
+        return 'task'
+    return state.kind
+
+def stable_name(kind:str, path:str, used:set[str]) -> str:
+    '''
+    Get the name of the state from the hash of its path, longer when it is already used
+    '''
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
+    for length in range(HASH_LENGTH, len(digest) + 1, 4):
+        name = '%s_%s' % (kind, digest[:length])
+        if name not in used:
+            return name
+    number = 2
+    while '%s_%d' % (name, number) in used:
+        number += 1
+    return '%s_%d' % (name, number)
+
+def assign_stable_names(plays:list[UMLStatePlayBase]) -> None:
+    '''
+    Rename the states of the plays by the hashes of their paths
+    '''
+    used: set[str] = set()
+    states = []
+    for path, state in walk_paths(plays):
+        name = stable_name(_kind(state), path, used)
+        used.add(name)
+        state.rename(name)
+        states.append(state)
+    # the entry and end points of the blocks are the names of their children
+    for state in reversed(states):
+        if hasattr(state, 'block'):
+            state._resolve_points()
@@ -12,6 +12,7 @@ from playbook2uml.umlstate.base import (
     UMLStateBase,
     UMLStateTaskBase,
     UMLStateBlockBase,
+    UMLStateSummaryBase,
     UMLStateStart
 )
 
@@ -23,9 +24,10 @@ class UMLStateTask(UMLStateTaskBase):
     Ansible task execution with support for conditionals (when), loops, retries (until),
     and task metadata like become, register, and delegate_to.
     """
+    __slots__ = ()
 
     def generateDefinition(self, level:int=0) -> Iterator[str]:
-        self.logger.debug(f'start {self}')
+        self.logger.debug('start %s', self)
         prefix = indent * level
         if self.has_when:
             yield from self._generateWhenDefinition(level)
@@ -42,15 +44,22 @@ class UMLStateTask(UMLStateTaskBase):
         if self.has_until:
             yield from self._generateUntilDefinition(level)
 
-        self.logger.debug(f'end {self}')
+        self.logger.debug('end %s', self)
 
     def _generete_table(self, obj:dict, level:int=0) -> Iterator[str]:
-        for key in obj:
+        max_args = self.context.max_args
+        max_length = self.context.max_arg_length
+        for i, key in enumerate(obj):
+            if max_args is not None and i >= max_args:
+                yield '%s%s : | ... | (+%d args) |' % (indent*level, self.name, len(obj) - max_args)
+                break
             val = obj[key]
             if isinstance(val, str):
                 lines = val.splitlines()
                 if len(lines) > 1:
                     val = '%s ...(+%d lines)' % (lines[0], len(lines)-1)
+            if max_length is not None and len(str(val)) > max_length:
+                val = '%s...' % str(val)[:max_length]
             yield '%s%s : | %s | %s |' %(indent*level, self.name, key, val)
 
     def _generateRegisterDefinition(self, level:int=0) -> Iterator[str]:
@@ -89,7 +98,7 @@ class UMLStateTask(UMLStateTaskBase):
         yield '%send note' % (indent*level)
 
     def generateRelation(self, next: Optional[UMLStateBase], level:int=0) -> Iterator[str]:
-        self.logger.debug(f'start {self}')
+        self.logger.debug('start %s', self)
         if next is not None:
             if self.has_when:
                 yield '%s --> %s' % (self._entry_point_name, self.name)
@@ -104,7 +113,7 @@ class UMLStateTask(UMLStateTaskBase):
             yield '%s --> %s' % (self.name, self._end_point_name)
             yield '%s --> %s : retry' % (self._end_point_name, self._entry_point_name)
 
-        self.logger.debug(f'end {self}')
+        self.logger.debug('end %s', self)
 
     def _generateLoopRelation(self) -> Iterator[str]:
         if self.task.loop is None:
@@ -123,17 +132,37 @@ class UMLStateTask(UMLStateTaskBase):
             yield '%s- %s' % (indent, self.task.loop)
         yield 'end note'
 
+class UMLStateSummary(UMLStateSummaryBase):
+    """
+    A role collapsed by `--collapse-roles` or a block deeper than `--max-depth`,
+    shown as one state with the number of its tasks.
+    """
+    __slots__ = ()
+
+    def generateDefinition(self, level:int=0) -> Iterator[str]:
+        prefix = indent * level
+        yield '%sstate "%s" as %s' % (prefix, self.label, self.name)
+        yield '%s%s : //%d task%s//' % (prefix, self.name, self.task_count, '' if self.task_count == 1 else 's')
+        if self.link:
+            yield '%s%s : [[%s]]' % (prefix, self.name, self.link)
+
+    def generateRelation(self, next:Optional[UMLStateBase], level:int=0) -> Iterator[str]:
+        if next is not None:
+            yield '%s --> %s' % (self.name, next.get_entry_point_name())
+
 class UMLStateBlock(UMLStateBlockBase):
     """
     UMLStateBlock represents a PlantUML state block for Ansible playbook tasks.
     This class extends UMLStateBlockBase and generates PlantUML state diagram definitions
     for block structures, including task execution, always blocks, and rescue blocks.
     """
+    __slots__ = ()
 
     TASK_CLASS = UMLStateTask
+    SUMMARY_CLASS = UMLStateSummary
 
-    def generateDefinition(self, level:int=0) -> Iterator[str]:
-        self.logger.debug(f'start {self}')
+    def _generateBlockDefinition(self, level:int=0) -> Iterator[str]:
+        self.logger.debug('start %s', self)
         is_explicit = self.block.name or self.always or self.rescue
         next_level = level
         prefix = indent * level
@@ -149,7 +178,7 @@ class UMLStateBlock(UMLStateBlockBase):
             yield from self._generateRescueDefinition(next_level)
             yield '%s}' % prefix
 
-        self.logger.debug(f'end {self}')
+        self.logger.debug('end %s', self)
 
     def _generateAlwaysDefinition(self, level:int=0) -> Iterator[str]:
         if not self.always:
@@ -179,6 +208,7 @@ class UMLStatePlay(UMLStatePlayBase):
     including metadata (hosts, strategy, serial, gather_facts), variables files,
     and variable prompts.
     """
+    __slots__ = ()
 
     BLOCK_CLASS = UMLStateBlock
 
@@ -205,20 +235,16 @@ class UMLStatePlay(UMLStatePlayBase):
                 key_name = ''
 
     def _get_play_metadata(self) -> Iterator[Tuple[str, str]]:
-        ds: dict = getattr(self.play, '_ds', {})
         for key in self.METADATA_KEYS:
-            if key not in ds:
-                self.logger.debug(f'{key} is implicit.')
-                continue
-            if not hasattr(self.play, key):
-                self.logger.debug(f'{key} is not implemented on Ansible')
+            if key not in self.play.explicit:
+                self.logger.debug('%s is implicit.', key)
                 continue
             value = str(getattr(self.play, key))
 
             yield (key, value)
 
     def generateDefinition(self, level:int=0, only_role=False) -> Iterator[str]:
-        self.logger.debug(f'start {self}')
+        self.logger.debug('start %s', self)
         if not only_role:
             yield '%sstate "= Play: %s" as %s {' % (indent*level, self.play.get_name(), self.name)
             level += 1
@@ -228,20 +254,18 @@ class UMLStatePlay(UMLStatePlayBase):
             yield from self._generateVarsFilesDefition(level=level)
             yield from self._generateVarsPromptDefinition(level=level)
 
-        for tasks in self.get_all_tasks():
-            yield from tasks.generateDefinition(level)
+        yield from self.generateStatesDefinition(level)
 
         if not only_role:
             yield '%s}' % (indent*(level-1))
 
-        self.logger.debug(f'end {self}')
+        self.logger.debug('end %s', self)
 
     def generateRelation(self, next:Optional[UMLStateBase], level:int=0) -> Iterator[str]:
-        self.logger.debug(f'start {self}')
-        for current_state, next_state in pair_state_iter(*self.get_all_tasks(), next):
-            yield from current_state.generateRelation(next_state)
+        self.logger.debug('start %s', self)
+        yield from self.generateStatesRelation(next)
 
-        self.logger.debug(f'end {self}')
+        self.logger.debug('end %s', self)
 
 class UMLStatePlaybook(UMLStatePlaybookBase):
     """
@@ -276,33 +300,66 @@ class UMLStatePlaybook(UMLStatePlaybookBase):
             - Info messages for generation start/end and phase progress
             - Debug messages for applied options (title, theme, direction)
         """
+        return self.generate_plays(self.plays)
 
-        self.logger.info('START [PlantUML]')
-        only_role = False
+    def _generateHeader(self) -> Iterator[str]:
         yield '@startuml'
         if self.options:
             if title := self.options.title:
-                self.logger.debug(f'set title "{title}"')
+                self.logger.debug('set title "%s"', title)
                 yield 'title %s' % title
             if theme := self.options.theme:
-                self.logger.debug(f'set theme "{theme}"')
+                self.logger.debug('set theme "%s"', theme)
                 yield '!theme %s' % theme
             if self.options.left_to_right:
-                self.logger.debug(f'set left-to-right-direction')
+                self.logger.debug('set left-to-right-direction')
                 yield 'left to right direction'
 
-            only_role = self.options.role != ''
+    def generate_plays(self, plays:list[UMLStatePlay], only_role:Optional[bool]=None) -> Iterator[str]:
+        """
+        Generate one PlantUML diagram of the plays.
 
-        self.logger.info(f'START generate definitions (role-mode={only_role})')
-        for umlplay in self.plays:
-            yield from umlplay.generateDefinition(only_role=only_role)
+        Args:
+            plays: The plays, e.g. one play of `self.plays` (see `playbook2uml.split`)
+            only_role (bool, optional): Show the tasks without the play.
+                The role mode of the options when omitted.
+        """
+        self.logger.info('START [PlantUML]')
+        if only_role is None:
+            only_role = bool(self.options) and self.options.role != ''
+        yield from self._generateHeader()
+
+        self.logger.info('START generate definitions (role-mode=%s)', only_role)
+        self.context.new_subtree_cache()
+        profiler = self.context.profiler
+        for umlplay in plays:
+            yield from profiler.iterate(f'generate/{umlplay.name}/definitions', umlplay.generateDefinition(only_role=only_role))
         self.logger.info('END generate definitions')
 
-        self.logger.info(f'START generate relations (role-mode={only_role})')
+        self.logger.info('START generate relations (role-mode=%s)', only_role)
         start_end = UMLStateStart()
-        for current_state, next_state in pair_state_iter(start_end, *self.plays, start_end):
-            yield from current_state.generateRelation(next_state)
+        for current_state, next_state in pair_state_iter(start_end, *plays, start_end):
+            yield from profiler.iterate(f'generate/{current_state.name}/relations', current_state.generateRelation(next_state))
         self.logger.info('END generate relations')
+        self.context.subtree_cache = None
 
         yield '@enduml'
         self.logger.info('END')
+
+    def generate_index(self, links:list[tuple[UMLStatePlay, str]]) -> Iterator[str]:
+        """
+        Generate the index diagram: one state per play, linked to the diagram file of the play.
+
+        Args:
+            links: The plays and the paths of their diagrams, relative to the index
+        """
+        yield from self._generateHeader()
+        for umlplay, link in links:
+            task_count = umlplay.count_tasks()
+            yield 'state "= Play: %s" as %s' % (umlplay.play.get_name(), umlplay.name)
+            yield '%s : //%d task%s//' % (umlplay.name, task_count, '' if task_count == 1 else 's')
+            yield '%s : [[%s]]' % (umlplay.name, link)
+        names = ['[*]', *(umlplay.name for umlplay, _ in links), '[*]']
+        for current_name, next_name in pair_state_iter(*names):
+            yield '%s --> %s' % (current_name, next_name)
+        yield '@enduml'
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+'''
+Shared cache of the states of the roles.
+
+A role listed in the `roles` keyword of many plays (and playbooks) is converted to
+states once. The compact records of its tasks and blocks (`playbook2uml.umlstate.ir`)
+are kept as a tree, and the states of the next plays are created from the tree with
+their own IDs (`task_N`, `block_N`) handed out by the `RenderContext`, as if loaded again.
+
+The entries are keyed by the role path, `tasks_from`, the role name and the attributes
+the tasks inherit from the play and the `roles` entry (`when`, `become`, `become_user`,
+`delegate_to`), and are valid while the files of `tasks/`, `handlers/` and `meta/` of the role,
+and the files its tasks were loaded from outside of it (`../shared/tasks.yml` ...), keep their
+modification time and size. A role importing a templated path is not cached.
+
+A role is stored the second time its key is looked up, a role used once is loaded
+without the cache (and without reading the stats of its files).
+
+`ROLE_CACHE` is shared by all renderings of the process: the plays of a playbook,
+the jobs of the batch mode and the requests of the render server.
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from collections import OrderedDict
+from typing import Iterable, NamedTuple, Optional, Union
+import os
+import threading
+from playbook2uml.umlstate.ir import TaskIR, BlockIR, to_plain
+
+INHERITED_ATTRIBUTES = ('become', 'become_user', 'delegate_to')
+
+ROLE_DIRS = ('tasks', 'handlers', 'meta')
+"""
+The directories of a role the states are loaded from
+"""
+
+class BlockTree(NamedTuple):
+    '''
+    The records of a block and of its children
+    '''
+    block: BlockIR
+    tasks: tuple[StateTree, ...]
+    always: tuple[StateTree, ...]
+    rescue: tuple[StateTree, ...]
+
+class SummaryTree(NamedTuple):
+    '''
+    The record of a summary state (a block deeper than `--max-depth`)
+    '''
+    kind: str
+    label: str
+    task_count: int
+
+StateTree = Union[TaskIR, BlockTree, SummaryTree]
+
+class RoleKey(NamedTuple):
+    '''
+    What the states of a role depend on, except the files
+    '''
+    path: str
+    tasks_from: str
+    name: str
+    inherited: str
+    """
+    `repr()` of the conditions and the attributes inherited from the play and the `roles` entry
+    """
+    max_depth: Optional[int] = None
+    """
+    `--max-depth`, the deeper blocks are summary states
+    """
+    include_depth: Optional[int] = None
+    """
+    `--include-depth` of `--resolve-includes`, `None` when the includes are kept as tasks
+    """
+
+FileStats = tuple[tuple[str, int, int], ...]
+
+def role_files(path:str) -> FileStats:
+    '''
+    Get `(path, mtime_ns, size)` of the files of `ROLE_DIRS` of the role
+    '''
+    paths = []
+    for role_dir in ROLE_DIRS:
+        for directory, dirs, files in os.walk(os.path.join(path, role_dir)):
+            dirs.sort()
+            paths.extend(os.path.join(directory, file_name) for file_name in sorted(files))
+    return file_stats(paths)
+
+def file_stats(paths:Iterable[str]) -> FileStats:
+    '''
+    Get `(path, mtime_ns, size)` of the files, the missing files are skipped
+    '''
+    stats = []
+    for file_path in paths:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            continue
+        stats.append((file_path, stat.st_mtime_ns, stat.st_size))
+    return tuple(stats)
+
+def outside_files(path:str, files:Iterable[str]) -> tuple[str, ...]:
+    '''
+    Get the files outside the role directory
+    '''
+    root = os.path.abspath(path)
+    return tuple(file_path for file_path in files
+                 if os.path.commonpath((root, os.path.abspath(file_path))) != root)
+
+def role_key(role, play, max_depth:Optional[int]=None, include_depth:Optional[int]=None) -> Optional[RoleKey]:
+    '''
+    Get the key of the role listed in the play, `None` when the role can not be cached.
+
+    Args:
+        role: Ansible's `Role` or `FastRole`
+        play: Ansible's `Play` or `FastPlay` listing the role
+        max_depth (int, optional): `--max-depth` of the rendering
+        include_depth (int, optional): `--include-depth` when the includes are resolved
+    '''
+    path = role.get_role_path()
+    if not path or not os.path.isdir(path):
+        return None
+    from playbook2uml.fastparser import FastRole
+    if isinstance(role, FastRole):
+        return RoleKey(path, role.tasks_from, role.get_name(), repr(to_plain(role.inherited)), max_depth, include_depth)
+    inherited = [role.when]
+    inherited.extend(getattr(role, key, None) for key in INHERITED_ATTRIBUTES)
+    inherited.extend(getattr(play, key, None) for key in INHERITED_ATTRIBUTES)
+    tasks_from = getattr(role, '_from_files', {}).get('tasks') or 'main'
+    return RoleKey(path, tasks_from, str(role.get_name()), repr(to_plain(inherited)), max_depth, include_depth)
+
+class RoleCacheStats(NamedTuple):
+    hits: int
+    misses: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+class RoleCache:
+    '''
+    Thread-safe LRU cache of the state trees of the roles.
+
+    Args:
+        max_entries (int): The number of roles kept
+    '''
+
+    def __init__(self, max_entries:int=256) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[RoleKey, tuple[FileStats, tuple[StateTree, ...], tuple[str, ...]]] = OrderedDict()
+        self._seen: OrderedDict[RoleKey, None] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key:RoleKey, files:FileStats) -> Optional[tuple[StateTree, ...]]:
+        '''
+        Get the trees of the role, `None` when not cached or the files have changed
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != files:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def imports(self, key:RoleKey) -> Optional[tuple[str, ...]]:
+        '''
+        Get the files outside the role directory the entry depends on, `None` when the role is not cached
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[2] if entry is not None else None
+
+    def seen(self, key:RoleKey) -> bool:
+        '''
+        Record the lookup of a role which is not cached (a miss), whether it was looked up before
+        '''
+        with self._lock:
+            self._misses += 1
+            if key in self._seen:
+                self._seen.move_to_end(key)
+                return True
+            self._seen[key] = None
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+            return False
+
+    def put(self, key:RoleKey, files:FileStats, trees:tuple[StateTree, ...], imports:tuple[str, ...]=()) -> None:
+        with self._lock:
+            self._entries[key] = (files, trees, imports)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> RoleCacheStats:
+        with self._lock:
+            return RoleCacheStats(self._hits, self._misses)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._seen.clear()
+            self._hits = self._misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+ROLE_CACHE = RoleCache()
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+'''
+Memoization of the lines of the repeated blocks (and roles) of a diagram.
+
+A role listed in many plays (or a block repeated in many places) generates the same lines
+each time, only the names of the states differ (`task_12` instead of `task_3` ...).
+The lines are memoized per subtree: an explicit block, or the states of a role in a play.
+
+The content of a subtree is hash-consed: the subtrees (and the blocks, the tasks and the summary
+states in them) with the same records get the same fingerprint, a small `int`. The definition lines
+and the relation lines are cached by the fingerprint and the indentation level.
+
+- The first occurrence of a subtree is generated as usual. Its fingerprint is not computed:
+  a subtree is fingerprinted when a subtree of the same shape (the names and the numbers of the
+  states at its top) was seen, so the subtrees which are not repeated cost little
+- The next one is generated with placeholders instead of the names of its states, which
+  makes the template of the lines
+- The next ones are the template with the names of their states, which are in the same
+  order as the states of the first one
+
+A cache lives for one `generate()` of one playbook, the options of the rendering
+(`--max-args` ...) and the diagram type are the same for all of its subtrees.
+The state graph (`-t json`, `-t msgpack`) does not use it.
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import TYPE_CHECKING, Callable, Hashable, Iterable, NamedTuple, Optional, Union
+from collections import Counter
+from playbook2uml.umlstate.ir import TaskIR, BlockIR
+
+if TYPE_CHECKING:
+    from playbook2uml.umlstate.base import UMLStateBase, UMLStateBlockBase
+
+Subtree = Union['UMLStateBlockBase', tuple['UMLStateBase', ...]]
+"""
+A block, or the states of a role
+"""
+
+class Template(NamedTuple):
+    """
+    The lines of a subtree with `%s` for the names of its states
+    """
+    text: str
+    """
+    The lines joined by newlines, `%` of the lines is escaped
+    """
+    indexes: tuple[int, ...]
+    """
+    The indexes of the names of the `%s` in `text`
+    """
+
+_MARK = '\x00'
+"""
+Around the number of a placeholder. A subtree whose lines already hold it (`name: "a\\0b"` ...)
+is not memoized
+"""
+
+class _NextState:
+    """
+    The state after the subtree while the template of the relations is generated
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name:str) -> None:
+        self.name = name
+
+    def get_entry_point_name(self) -> str:
+        return self.name
+
+def state_names(subtree:Subtree, names:Optional[list[str]]=None) -> list[str]:
+    '''
+    Get the names of the states of the subtree, a block before its children
+    '''
+    if names is None:
+        names = []
+    for state in subtree if isinstance(subtree, tuple) else (subtree,):
+        names.append(state.name)
+        if hasattr(state, 'block'):
+            state_names((*state.tasks, *state.always, *state.rescue), names)
+    return names
+
+def _states(subtree:Subtree, states:list[UMLStateBase]) -> list[UMLStateBase]:
+    for state in subtree if isinstance(subtree, tuple) else (subtree,):
+        states.append(state)
+        if hasattr(state, 'block'):
+            _states((*state.tasks, *state.always, *state.rescue), states)
+    return states
+
+def _shape(subtree:Subtree) -> Hashable:
+    if isinstance(subtree, tuple):
+        return tuple(state.block.name if hasattr(state, 'block') else state.task.name if hasattr(state, 'task') else state.label
+                     for state in subtree)
+    return (subtree.block.name, len(subtree.tasks), len(subtree.always), len(subtree.rescue))
+
+def _compile(lines:list[str], unmarked:list[str], names:list[str]) -> Optional[Template]:
+    '''
+    Make the template from the lines generated with the placeholders, `None` when the lines
+    generated with the names of the states (`unmarked`) or the names already hold the mark
+    '''
+    if any(_MARK in line for line in unmarked) or any(_MARK in name for name in names):
+        return None
+    text = '\n'.join(lines)
+    if not lines or text.count('\n') != len(lines) - 1:
+        # no lines, or a name with a newline
+        return None
+    parts = text.split(_MARK)
+    return Template(''.join(part.replace('%', '%%') if i % 2 == 0 else '%s' for i, part in enumerate(parts)),
+                    tuple(int(part) for part in parts[1::2]))
+
+def _render(template:Template, names:list[str]) -> list[str]:
+    return (template.text % tuple([names[i] for i in template.indexes])).split('\n')
+
+class SubtreeCache:
+    '''
+    The templates of the lines of the subtrees repeated in one diagram.
+
+    Args:
+        stats (Counter): Counts `subtree_cache_hits` (the subtrees whose lines are made from a template)
+            and `subtree_cache_templates`, e.g. `RenderContext.stats`
+    '''
+
+    def __init__(self, stats:Optional[Counter]=None) -> None:
+        self.stats: Counter[str] = Counter() if stats is None else stats
+        self._ids: dict[Hashable, int] = {}
+        # the states and the records are kept with their fingerprints, so that their `id()` is not reused
+        self._states: dict[int, tuple[UMLStateBase | tuple, int]] = {}
+        self._tasks: dict[int, tuple[TaskIR, tuple]] = {}
+        self._blocks: dict[int, tuple[BlockIR, int]] = {}
+        self._shapes: set[Hashable] = set()
+        self._templates: dict[Hashable, Optional[Template]] = {}
+        self._building = False
+
+    def fingerprint(self, state:UMLStateBase | tuple[UMLStateBase, ...]) -> int:
+        '''
+        Get the fingerprint of the content of the state (or of the states), the same for the states
+        generating the same lines except for the names
+        '''
+        entry = self._states.get(id(state))
+        if entry is not None:
+            return entry[1]
+        if isinstance(state, tuple):
+            key: tuple = ('states', tuple(self.fingerprint(child) for child in state))
+            fingerprint = self._ids.setdefault(key, len(self._ids))
+        elif hasattr(state, 'block'):
+            # the states of a cached role share the records of its blocks, and so their children
+            record = self._blocks.get(id(state.block))
+            if record is not None:
+                fingerprint = record[1]
+            else:
+                key = ('block', state.block.name, tuple(self.fingerprint(task) for task in state.tasks),
+                              tuple(self.fingerprint(task) for task in state.always),
+                              tuple(self.fingerprint(task) for task in state.rescue))
+                fingerprint = self._ids.setdefault(key, len(self._ids))
+                self._blocks[id(state.block)] = (state.block, fingerprint)
+        else:
+            if hasattr(state, 'task'):
+                key = self._task_key(state.task)
+            else:
+                key = ('summary', state.kind, state.label, state.task_count, state.link)
+            fingerprint = self._ids.setdefault(key, len(self._ids))
+        self._states[id(state)] = (state, fingerprint)
+        return fingerprint
+
+    def _task_key(self, task:TaskIR) -> tuple:
+        # the states of a cached role share the records of its tasks
+        entry = self._tasks.get(id(task))
+        if entry is None:
+            entry = self._tasks[id(task)] = (task, ('task', repr(tuple(getattr(task, key) for key in TaskIR.__slots__))))
+        return entry[1]
+
+    def definition(self, subtree:Subtree, level:int, generate:Callable[[], Iterable[str]]) -> Iterable[str]:
+        '''
+        Get the definition lines of the subtree.
+
+        Args:
+            subtree: The block, or the states of a role
+            level (int): The indentation level
+            generate: Generates the lines of the subtree without the cache
+        '''
+        return self._lines('definition', subtree, level, None, generate)
+
+    def relation(self, subtree:Subtree, next:Optional[UMLStateBase], level:int,
+                 generate:Callable[[Optional[UMLStateBase]], Iterable[str]]) -> Iterable[str]:
+        '''
+        Get the relation lines of the subtree to the next state.
+
+        Args:
+            subtree: The block, or the states of a role
+            next: The state after the subtree
+            level (int): The indentation level
+            generate: Generates the lines of the subtree to the state without the cache
+        '''
+        return self._lines('relation', subtree, level, next, generate)
+
+    def _lines(self, kind:str, subtree:Subtree, level:int, next:Optional[UMLStateBase], generate:Callable) -> Iterable[str]:
+        if self._building:
+            return generate(next) if kind == 'relation' else generate()
+        shape = (kind, _shape(subtree), level, next is None)
+        if shape not in self._shapes:
+            self._shapes.add(shape)
+            return generate(next) if kind == 'relation' else generate()
+        key = (kind, self.fingerprint(subtree), level, next is None)
+        if key in self._templates:
+            template = self._templates[key]
+        else:
+            template = self._templates[key] = self._build(kind, subtree, next, generate)
+            self.stats['subtree_cache_templates'] += 1
+        if template is None:
+            return generate(next) if kind == 'relation' else generate()
+        self.stats['subtree_cache_hits'] += 1
+        names = state_names(subtree)
+        if next is not None:
+            names.append(next.get_entry_point_name())
+        return _render(template, names)
+
+    def _build(self, kind:str, subtree:Subtree, next:Optional[UMLStateBase], generate:Callable) -> Optional[Template]:
+        '''
+        Generate the lines with the placeholders as the names of the states
+        '''
+        states = _states(subtree, [])
+        names = [state.name for state in states]
+        self._building = True
+        try:
+            unmarked = list(generate(next) if kind == 'relation' else generate())
+            _rename(states, ['%s%d%s' % (_MARK, i, _MARK) for i in range(len(states))])
+            if kind == 'relation':
+                placeholder = _NextState('%s%d%s' % (_MARK, len(states), _MARK)) if next is not None else None
+                return _compile(list(generate(placeholder)), unmarked, names)
+            return _compile(list(generate()), unmarked, names)
+        finally:
+            _rename(states, names)
+            self._building = False
+
+def _rename(states:list[UMLStateBase], names:list[str]) -> None:
+    for state, name in zip(states, names):
+        state.rename(name)
+    # the entry and end points of the blocks are the names of their children
+    for state in reversed(states):
+        if hasattr(state, 'block'):
+            state._resolve_points()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+'''
+Watch mode: re-render the diagrams when the files they are made of change.
+
+The files of each diagram (the playbook, the task files of its roles, `import_tasks`
+targets and `vars_files`, see `playbook2uml.dependency`) are kept in a dependency
+graph from files to diagrams. The files are polled for changes of their modification
+time and size. After a change, the watcher waits until the files stay unchanged for
+the debounce time (editors write files in several steps), then re-renders only the
+affected diagrams with the warm Ansible environment, and updates the graph with
+their new dependencies.
+'''
+from __future__ import (absolute_import, division, print_function, annotations)
+from typing import Callable, Iterable, Optional
+import os
+import threading
+import time
+from playbook2uml.batch import BatchJob, BatchResult, render_job
+from playbook2uml.dependency import collect_dependencies
+from playbook2uml.logger import getLogger
+
+logger = getLogger(__name__)
+
+DEFAULT_INTERVAL = 0.5
+DEFAULT_DEBOUNCE = 0.3
+
+FileStat = Optional[tuple[int, int]]
+"""
+`(mtime_ns, size)` of a file, `None` when it does not exist
+"""
+
+def file_stat(path:str) -> FileStat:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+class DependencyGraph:
+    '''
+    Maps the files to the indexes of the jobs (diagrams) made of them
+    '''
+
+    def __init__(self) -> None:
+        self._files: dict[str, set[int]] = {}
+        self._dependencies: dict[int, tuple[str, ...]] = {}
+
+    def update(self, index:int, job:BatchJob) -> None:
+        '''
+        Collect the files of the job again and replace its edges
+        '''
+        option = job.option
+        dependencies = collect_dependencies(option.PLAYBOOK, role=option.role,
+                                            tasks_from=option.tasks_from, base_dir=option.BASE_DIR)
+        files = tuple(os.path.abspath(path) for path in dependencies.files)
+        for path in self._dependencies.get(index, ()):
+            indexes = self._files[path]
+            indexes.discard(index)
+            if not indexes:
+                del self._files[path]
+        for path in files:
+            self._files.setdefault(path, set()).add(index)
+        self._dependencies[index] = files
+
+    def files(self) -> list[str]:
+        return list(self._files)
+
+    def affected(self, paths:Iterable[str]) -> list[int]:
+        '''
+        Get the indexes of the jobs made of the files, in the order of the jobs
+        '''
+        indexes: set[int] = set()
+        for path in paths:
+            indexes.update(self._files.get(os.path.abspath(path), ()))
+        return sorted(indexes)
+
+class Watcher:
+    '''
+    Re-render the jobs when their files change.
+
+    Args:
+        jobs: The diagrams to render and to keep up to date
+        environment (AnsibleEnvironment, optional): Shared Ansible loaders.
+            Created when omitted, unless the jobs use the fast parser.
+        interval (float): Seconds between the polls of the files
+        debounce (float): Seconds the files must stay unchanged before re-rendering
+        on_render (callable, optional): Called with the `BatchResult` of each rendering
+
+    Example:
+        >>> watcher = Watcher(jobs)
+        >>> watcher.run()   # until KeyboardInterrupt, or `stop` is set
+    '''
+
+    def __init__(self, jobs:list[BatchJob], environment=None, interval:float=DEFAULT_INTERVAL,
+                 debounce:float=DEFAULT_DEBOUNCE, on_render:Optional[Callable[[BatchResult], None]]=None) -> None:
+        self.jobs = list(jobs)
+        self.interval = interval
+        self.debounce = debounce
+        self.on_render = on_render
+        if environment is None and self.jobs and getattr(self.jobs[0].option, 'parser', 'ansible') != 'fast':
+            from playbook2uml.umlstate.extract import AnsibleEnvironment
+            environment = AnsibleEnvironment()
+        self.environment = environment
+        self.graph = DependencyGraph()
+        self._stats: dict[str, FileStat] = {}
+
+    def render(self, indexes:Iterable[int]) -> list[BatchResult]:
+        '''
+        Render the jobs and update their dependencies
+        '''
+        results = []
+        for index in indexes:
+            job = self.jobs[index]
+            if self.environment is not None:
+                self.environment.clear_cache()
+            result = render_job(job, self.environment)
+            try:
+                self.graph.update(index, job)
+            except Exception as e:
+                logger.warning('failed to collect the files of %s: %s', job.source, e)
+            results.append(result)
+            if self.on_render is not None:
+                self.on_render(result)
+        # the new files of the rendered jobs are watched from their current state
+        self._stats = {path: self._stats.get(path) or file_stat(path) for path in self.graph.files()}
+        return results
+
+    def render_all(self) -> list[BatchResult]:
+        return self.render(range(len(self.jobs)))
+
+    def poll(self) -> list[str]:
+        '''
+        Get the watched files changed since the last poll
+        '''
+        changed = []
+        for path, stat in self._stats.items():
+            current = file_stat(path)
+            if current != stat:
+                self._stats[path] = current
+                changed.append(path)
+        return changed
+
+    def wait_changes(self, stop:Optional[threading.Event]=None) -> list[str]:
+        '''
+        Wait for changes, then until the files are unchanged for `debounce` seconds.
+        Returns all the changed files, or an empty list when stopped.
+        '''
+        stop = stop or threading.Event()
+        changed: dict[str, None] = {}
+        quiet_since = None
+        while not stop.wait(self.interval if not changed else min(self.interval, self.debounce)):
+            paths = self.poll()
+            now = time.monotonic()
+            if paths:
+                logger.info('changed: %s', paths)
+                changed.update(dict.fromkeys(paths))
+                quiet_since = now
+            elif changed and now - quiet_since >= self.debounce:
+                return list(changed)
+        return []
+
+    def run(self, stop:Optional[threading.Event]=None) -> None:
+        '''
+        Render all jobs, then re-render the affected jobs on every change until `stop` is set
+        '''
+        stop = stop or threading.Event()
+        self.render_all()
+        while not stop.is_set():
+            changed = self.wait_changes(stop)
+            if changed:
+                self.render(self.graph.affected(changed))